@@ -21,22 +21,142 @@ from azure.search.documents.indexes.models import (
     AzureOpenAIVectorizerParameters,
     SearchIndexerDataUserAssignedIdentity 
 )
-from azure.core.exceptions import ResourceNotFoundError
-from langchain_openai import AzureOpenAIEmbeddings
-from langchain_core.documents import Document
+from azure.core.exceptions import ResourceNotFoundError, ResourceExistsError
 from langchain.text_splitter import RecursiveCharacterTextSplitter
+from openai import AsyncAzureOpenAI, RateLimitError, APIConnectionError, APITimeoutError, InternalServerError
+from abc import ABC, abstractmethod
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import asyncio
+import hashlib
 import logging
+import os
+import random
+import sqlite3
+import tiktoken
 import traceback
 from os import environ
-import base64
-import io
+import json
+import tempfile
+import time
 import fitz
-import uuid
-from typing import List
+from search_keys import chunk_id, indexed_chunk_ids, source_path
+import threading
+import unicodedata
 
 
 myApp = df.DFApp(http_auth_level=func.AuthLevel.ANONYMOUS)
 
+COMPLETED_CONTAINER = "completed"
+# Intermediate chunk and embedding artifacts, one folder per orchestration instance
+STAGING_CONTAINER = environ.get("DOCUMENT_STAGING_CONTAINER", "staging")
+
+# Fan-out sizes: pages chunked per activity, chunks embedded per activity, and the number of
+# activities an orchestration runs at once
+PAGES_PER_TASK = int(environ.get("DOCUMENT_PAGES_PER_TASK", 20))
+CHUNKS_PER_TASK = int(environ.get("DOCUMENT_CHUNKS_PER_TASK", 64))
+MAX_PARALLEL_ACTIVITIES = int(environ.get("DOCUMENT_MAX_PARALLEL_ACTIVITIES", 16))
+
+# Embedding requests: inputs and tokens per request (the deployment's input limits), requests in
+# flight per activity, and attempts per request on rate limiting and transient errors
+EMBEDDING_BATCH_INPUTS = int(environ.get("AZURE_OPENAI_EMBEDDING_BATCH_INPUTS", 16))
+EMBEDDING_BATCH_TOKENS = int(environ.get("AZURE_OPENAI_EMBEDDING_BATCH_TOKENS", 8191))
+EMBEDDING_CONCURRENCY = int(environ.get("AZURE_OPENAI_EMBEDDING_CONCURRENCY", 4))
+EMBEDDING_MAX_ATTEMPTS = int(environ.get("AZURE_OPENAI_EMBEDDING_MAX_ATTEMPTS", 8))
+
+# Embedding cache: backend (blob, sqlite or none), its location and the size it is evicted down to.
+# Keys include the model version, bump it when the deployment is upgraded to a new model version.
+EMBEDDING_CACHE_BACKEND = environ.get("EMBEDDING_CACHE_BACKEND", "blob")
+EMBEDDING_CACHE_CONTAINER = environ.get("EMBEDDING_CACHE_CONTAINER", "embedding-cache")
+EMBEDDING_CACHE_PATH = environ.get("EMBEDDING_CACHE_PATH", "embedding-cache.sqlite")
+EMBEDDING_CACHE_MAX_BYTES = int(environ.get("EMBEDDING_CACHE_MAX_BYTES", 1024 ** 3))
+EMBEDDING_MODEL = environ.get("AZURE_OPENAI_EMBEDDING_MODEL", "text-embedding-ada-002")
+EMBEDDING_MODEL_VERSION = environ.get("AZURE_OPENAI_EMBEDDING_MODEL_VERSION", "2")
+
+# Retried activities resume from their checkpoints
+ACTIVITY_RETRY = df.RetryOptions(first_retry_interval_in_milliseconds=5000, max_number_of_attempts=3)
+
+_blob_service_client = None
+
+
+### Blob helpers ###
+# Activities exchange blob references (claim checks) instead of document content, so the
+# orchestration history stays the same small size however large the document is.
+
+def get_blob_service_client() -> BlobServiceClient:
+    global _blob_service_client
+    if _blob_service_client is None:
+        _blob_service_client = BlobServiceClient(environ.get("AZURE_STORAGE_URL"), credential=DefaultAzureCredential())
+    return _blob_service_client
+
+
+def blob_ref(container: str, blob: str, **details) -> dict:
+    return {"container": container, "blob": blob, **details}
+
+
+def read_blob(ref: dict) -> bytes:
+    blob_client = get_blob_service_client().get_blob_client(container=ref["container"], blob=ref["blob"])
+    return blob_client.download_blob().readall()
+
+
+def read_json_blob(ref: dict):
+    return json.loads(read_blob(ref))
+
+
+def upload_blob(container: str, blob: str, data, **details) -> dict:
+    """Upload bytes or a file and return a reference to it, creating the container on first use."""
+    container_client = get_blob_service_client().get_container_client(container)
+    try:
+        container_client.upload_blob(blob, data, overwrite=True)
+    except ResourceNotFoundError:
+        try:
+            container_client.create_container()
+        except ResourceExistsError:
+            pass
+        if hasattr(data, "seek"):
+            data.seek(0)
+        container_client.upload_blob(blob, data, overwrite=True)
+    return blob_ref(container, blob, **details)
+
+
+def write_json_blob(container: str, blob: str, data, **details) -> dict:
+    """Upload `data` as JSON and return a reference to it."""
+    return upload_blob(container, blob, json.dumps(data).encode("utf-8"), **details)
+
+
+@contextmanager
+def download_blob_to_file(ref: dict):
+    """Stream a blob to a temporary file and yield its path, the content is never held in memory."""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, os.path.basename(ref["blob"]))
+        blob_client = get_blob_service_client().get_blob_client(container=ref["container"], blob=ref["blob"])
+        with open(path, "wb") as file:
+            blob_client.download_blob(max_concurrency=4).readinto(file)
+        yield path
+
+
+### Search helpers ###
+
+def get_search_client() -> SearchClient:
+    ### Switched to Key to resolve ###
+    ### - occasional random failures:Failed to get Azure RBAC authorization decision ###
+    return SearchClient(endpoint=environ["AZURE_AI_SEARCH_ENDPOINT"], index_name=environ["AZURE_AI_SEARCH_INDEX"],
+                        credential=AzureKeyCredential(environ["AZURE_AI_SEARCH_API_KEY"]))
+
+
+### PDF extraction ###
+
+def iter_page_texts(path: str):
+    """
+    Yield the text of every page of the PDF at `path` in order, loading one page at a time so only
+    that page is held in memory. Parallelism comes from the orchestrator's PAGES_PER_TASK fan-out.
+    """
+    with fitz.open(path) as doc:
+        for number in range(doc.page_count):
+            yield doc.load_page(number).get_text()
+
+
 # Blob Trigger Function to start the Durable Function orchestration
 @myApp.blob_trigger(arg_name="myblob", path="load", connection="BlobTriggerConnection")
 @myApp.durable_client_input(client_name="client")
@@ -49,82 +169,178 @@ async def blob_trigger_start(myblob: func.InputStream, client):
         logging.info(f"Skipping processing: {myblob.name} is not a .pdf file.")
         return f"Skipping processing: {myblob.name} is not a .pdf file."
     
-    # Read the blob content and encode it to base64
-    base64_bytes = base64.b64encode(myblob.read())
-
-   
-    
+    # The orchestration gets a reference to the blob, activities read the content from storage
+    container, blob = myblob.name.split('/', 1)
     file_name = myblob.name.split('/')[-1] 
 
     # Start the Durable Functions orchestration
-    instance_id = await client.start_new("document_orchestrator", None, {"filename": file_name,"data": base64_bytes.decode('ascii')})
+    instance_id = await client.start_new("document_orchestrator", None, {"filename": file_name, "source": blob_ref(container, blob)})
     logging.info(f"Started orchestration with ID = '{instance_id}'.")
 
 
+def call_activities(context, name: str, inputs: list, retry_options: df.RetryOptions = None):
+    """
+    Fan out one activity per input, at most MAX_PARALLEL_ACTIVITIES at a time, and fan in the
+    results in input order. Use with `yield from` inside an orchestrator.
+    """
+    results = []
+    for offset in range(0, len(inputs), MAX_PARALLEL_ACTIVITIES):
+        tasks = [
+            context.call_activity_with_retry(name, retry_options, item) if retry_options else context.call_activity(name, item)
+            for item in inputs[offset:offset + MAX_PARALLEL_ACTIVITIES]
+        ]
+        results.extend((yield context.task_all(tasks)))
+    return results
+
+
 # Orchestrator Function
 @myApp.orchestration_trigger(context_name="context")
 def document_orchestrator(context):
     """
     Orchestrates multiple activities based on the input from the Blob trigger.
+
+    The document is split into page ranges that are chunked in parallel, the chunks are embedded
+    in parallel batches and each batch is uploaded to the index, so ingestion time scales with the
+    number of instances rather than the length of the document. Chunk ids are derived from the
+    document, page and text, so re-processing a document only embeds and uploads the chunks that
+    changed and deletes the ones that are gone.
     """
-    data_base64 = context.get_input()["data"]
+    source = context.get_input()["source"]
     filename = context.get_input()["filename"]
-
-    logging.info(f"File Name: {filename} ")
-    logging.info(f"Data: {data_base64} ")
-    
-    # Chunk the document
-    chunks = yield context.call_activity('chunk_pdf', {"filename": filename,"data": data_base64})
-
-    # Generate embeddings
-    embeddings = yield context.call_activity('generate_embeddings', chunks)
-
-    # Update search index
-    yield context.call_activity('update_search_index', embeddings)
+    # Chunks are keyed by the full blob path, documents with the same file name in other folders stay apart
+    path = source_path(source)
+    staging_prefix = f"{context.instance_id}/"
+
+    if not context.is_replaying:
+        logging.info(f"File Name: {filename} ")
+
+    # Split the document into page ranges
+    parts = yield context.call_activity('split_pdf', {"source": source, "staging_prefix": staging_prefix})
+
+    # Chunk every page range, the chunks are staged and referenced
+    chunk_files = yield from call_activities(context, 'chunk_pdf', [
+        {"filename": filename, "path": path, "source": part, "target": f"{staging_prefix}chunks-{index:05d}.json"}
+        for index, part in enumerate(parts)
+    ])
+
+    # Compare with the chunks indexed for this document, only new or changed chunks are embedded
+    yield context.call_activity('ensure_search_index', None)
+    changes = yield context.call_activity('diff_search_index', {
+        "filename": filename, "path": path, "chunk_files": chunk_files, "staging_prefix": staging_prefix
+    })
+
+    # Generate embeddings in batches of chunks, in document order
+    batches = [
+        {"chunks": changed_file, "offset": offset, "limit": CHUNKS_PER_TASK}
+        for changed_file in changes["changed"]
+        for offset in range(0, changed_file["count"], CHUNKS_PER_TASK)
+    ]
+    for index, batch in enumerate(batches):
+        batch["target"] = f"{staging_prefix}embeddings-{index:05d}.json"
+    embedding_files = yield from call_activities(context, 'generate_embeddings', batches, ACTIVITY_RETRY)
+
+    # Update search index, then remove the chunks the document no longer has
+    yield from call_activities(context, 'update_search_index', embedding_files)
+    if changes["orphans"]["count"]:
+        yield context.call_activity('delete_search_chunks', changes["orphans"])
 
     # Move the blob to a "completed" container
-    yield context.call_activity('move_blob', {"filename": filename,"data": data_base64})
-    
+    yield context.call_activity('move_blob', {"filename": filename, "source": source})
+
+    # Remove the staged artifacts of this run
+    yield context.call_activity('delete_staging', staging_prefix)
+
+    if not context.is_replaying:
+        cache_hits = sum(embedding_file["cache_hits"] for embedding_file in embedding_files)
+        cache_lookups = sum(embedding_file["cache_lookups"] for embedding_file in embedding_files)
+        logging.info(f"Indexed {sum(chunk_file['count'] for chunk_file in chunk_files)} chunks of {filename} "
+                     f"from {len(parts)} page range(s): {changes['unchanged']} unchanged, "
+                     f"{sum(changed_file['count'] for changed_file in changes['changed'])} new or changed, "
+                     f"{changes['orphans']['count']} removed, {len(batches)} embedding batch(es), "
+                     f"embedded {sum(embedding_file['embedded'] for embedding_file in embedding_files)}, "
+                     f"embedding cache hits {cache_hits}/{cache_lookups}")
     return "Orchestration Completed"
 
 
 ### Activity Functions ##
 
-# Chunking the PDF
+# Split the PDF into page ranges of PAGES_PER_TASK pages
 @myApp.activity_trigger(input_name="input")
-def chunk_pdf(input: dict):
+def split_pdf(input: dict):
     try:
 
-        data_base64 = input.get("data")
-        filename = input.get("filename")
+        source = input.get("source")
+        staging_prefix = input.get("staging_prefix")
 
-        logging.info(f"Reading and chunking PDF: {len(data_base64)} bytes")
+        with download_blob_to_file(source) as path, fitz.open(path) as doc:
+            logging.info(f"Splitting PDF of {doc.page_count} pages into ranges of {PAGES_PER_TASK} pages")
 
+            # Short documents are chunked straight from the source
+            if doc.page_count <= PAGES_PER_TASK:
+                return [{**source, "first_page": 1}]
 
-        base64_bytes = data_base64.encode('ascii')
-        pdf_data = base64.b64decode(base64_bytes)
-        pdf_file = io.BytesIO(pdf_data)
-        doc = fitz.open(stream=pdf_file, filetype="pdf")
+            parts = []
+            for first in range(0, doc.page_count, PAGES_PER_TASK):
+                with fitz.open() as part:
+                    part.insert_pdf(doc, from_page=first, to_page=min(first + PAGES_PER_TASK, doc.page_count) - 1)
+                    blob = f"{staging_prefix}pages-{first + 1:05d}.pdf"
+                    parts.append(upload_blob(STAGING_CONTAINER, blob, part.tobytes(), first_page=first + 1))
+            return parts
 
-        documents = []
-        for index, page in enumerate(doc):
-            documents.append({
-                "page_content": page.get_text(),
-                "metadata": {"title": filename, "page_number": index + 1}
-            })
+    except Exception as ex:
+        logging.error(f"Error splitting PDF: {ex}")
+        logging.error(traceback.format_exc())
+        raise ex
+
+
+# Chunking a range of pages of the PDF
+@myApp.activity_trigger(input_name="input")
+def chunk_pdf(input: dict):
+    try:
+
+        source = input.get("source")
+        filename = input.get("filename")
+        document_path = input.get("path")
+        first_page = source.get("first_page", 1)
 
-        # Chunking
         splitter = RecursiveCharacterTextSplitter(
             chunk_size=int(environ.get("DOCUMENT_CHUNK_SIZE")),
             chunk_overlap=int(environ.get("DOCUMENT_CHUNK_OVERLAP"))
         )
-        chunks = splitter.split_documents([Document(**doc) for doc in documents])
 
-        for chunk in chunks:
-            chunk.metadata["chunk_id"] = str(uuid.uuid4())
-
-        # Return as list of plain dicts (JSON-serializable)
-        return [{"content": c.page_content, "metadata": c.metadata} for c in chunks]
+        # Pages are split as they are extracted and the chunks streamed to a file, so only a
+        # window of pages is in memory at a time. Chunks never span pages.
+        started = time.perf_counter()
+        page_count = count = 0
+        with download_blob_to_file(source) as path, tempfile.TemporaryFile() as records:
+            records.write(b"[")
+            for page_count, text in enumerate(iter_page_texts(path), start=1):
+                page_number = first_page + page_count - 1
+                # Identical text on the same page is told apart by its occurrence
+                occurrences = {}
+                for content in splitter.split_text(text):
+                    content_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+                    occurrences[content_hash] = occurrences.get(content_hash, -1) + 1
+                    record = {
+                        "content": content,
+                        "metadata": {
+                            "title": filename,
+                            "source_path": document_path,
+                            "page_number": page_number,
+                            "chunk_id": chunk_id(document_path, page_number, content_hash, occurrences[content_hash])
+                        }
+                    }
+                    records.write((b"," if count else b"") + json.dumps(record).encode("utf-8"))
+                    count += 1
+            records.write(b"]")
+
+            seconds = time.perf_counter() - started
+            logging.info(f"Chunked {page_count} pages from page {first_page} into {count} chunks in {seconds:.2f}s "
+                         f"({page_count / seconds:.1f} pages/s)")
+
+            # Stage the chunks and return the reference
+            records.seek(0)
+            return upload_blob(STAGING_CONTAINER, input.get("target"), records, count=count)
 
     except Exception as ex:
         logging.error(f"Error chunking PDF: {ex}")
@@ -132,48 +348,381 @@ def chunk_pdf(input: dict):
         raise ex
 
 
-# Generate embeddings for the chunks
-@myApp.activity_trigger(input_name="chunks")
-def generate_embeddings(chunks: List[dict]):
-    try:
-        logging.info(f"Generating embeddings for {len(chunks)} chunks")
+### Embedding helpers ###
+
+_token_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    global _token_encoding
+    if _token_encoding is None:
+        _token_encoding = tiktoken.get_encoding("cl100k_base")
+    return len(_token_encoding.encode(text))
+
+
+def embedding_batches(chunks: list) -> list:
+    """Group consecutive chunks into requests of at most EMBEDDING_BATCH_INPUTS inputs and EMBEDDING_BATCH_TOKENS tokens."""
+    batches = []
+    batch, batch_tokens = [], 0
+    for chunk in chunks:
+        tokens = count_tokens(chunk["content"])
+        if batch and (len(batch) == EMBEDDING_BATCH_INPUTS or batch_tokens + tokens > EMBEDDING_BATCH_TOKENS):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(chunk)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def retry_after_seconds(ex: Exception, attempt: int) -> float:
+    """The delay the service asks for, or exponential backoff with jitter when it does not say."""
+    response = getattr(ex, "response", None)
+    headers = response.headers if response is not None else {}
+    for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        try:
+            return float(headers[header]) * scale
+        except (KeyError, ValueError):
+            pass
+    return min(60.0, 2.0 ** attempt) * (0.5 + random.random() / 2)
+
+
+class EmbeddingThrottle:
+    """
+    Bounds the requests in flight and backs them off together: a 429 pauses every request of the
+    activity for the retry-after delay instead of each one retrying straight into the limit.
+    """
+
+    def __init__(self, concurrency: int):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.resume_at = 0.0
+
+    async def wait(self):
+        delay = self.resume_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def back_off(self, seconds: float):
+        self.resume_at = max(self.resume_at, time.monotonic() + seconds)
+
+
+COGNITIVE_SERVICES_SCOPE = "https://cognitiveservices.azure.com/.default"
+# Tokens are refreshed this long before they expire
+TOKEN_REFRESH_SECONDS = 300
+
+
+def openai_token_provider(credential=None):
+    """
+    Async Entra ID token provider for AsyncAzureOpenAI, called before every request. The token is
+    cached and only fetched again, by the sync credential in a thread, when it is about to expire,
+    so long throttled activities keep authenticating without blocking the event loop.
+    """
+    credential = credential or DefaultAzureCredential()
+    lock = asyncio.Lock()
+    token = None
+
+    async def provider() -> str:
+        nonlocal token
+        async with lock:
+            if token is None or token.expires_on - time.time() < TOKEN_REFRESH_SECONDS:
+                token = await asyncio.to_thread(credential.get_token, COGNITIVE_SERVICES_SCOPE)
+        return token.token
+
+    return provider
+
+
+async def embed_batch(client: AsyncAzureOpenAI, throttle: EmbeddingThrottle, texts: list) -> tuple:
+    """Embed `texts` in one request, returns the vectors, the tokens used and the number of retries."""
+    async with throttle.semaphore:
+        for attempt in range(EMBEDDING_MAX_ATTEMPTS):
+            await throttle.wait()
+            try:
+                response = await client.embeddings.create(input=texts, model=environ.get("AZURE_OPENAI_EMBEDDING"))
+                vectors = [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+                return vectors, response.usage.total_tokens, attempt
+            except (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError) as ex:
+                if attempt + 1 == EMBEDDING_MAX_ATTEMPTS:
+                    raise
+                delay = retry_after_seconds(ex, attempt)
+                logging.warning(f"Embedding request failed ({type(ex).__name__}), retrying in {delay:.1f}s")
+                if isinstance(ex, RateLimitError):
+                    throttle.back_off(delay)
+                else:
+                    await asyncio.sleep(delay)
+
+
+### Embedding cache ###
+# Vectors are stored by a hash of the normalized chunk text and the model that embedded it, so
+# unchanged chunks of a revised document and repeated boilerplate are embedded only once.
+
+def embedding_cache_key(content: str) -> str:
+    normalized = " ".join(unicodedata.normalize("NFKC", content).split())
+    identity = "\0".join((environ.get("AZURE_OPENAI_EMBEDDING", ""), EMBEDDING_MODEL, EMBEDDING_MODEL_VERSION, normalized))
+    return hashlib.sha256(identity.encode("utf-8")).hexdigest()
+
 
-        credential = DefaultAzureCredential()
+def pack_vector(vector: list) -> bytes:
+    # Embeddings are float32 on the wire, so storing them as float32 loses nothing
+    return array("f", vector).tobytes()
 
-        # Set the API type to `azure_ad`
-        environ["OPENAI_API_TYPE"] = "azure_ad"
-        # Set the API_KEY to the token from the Azure credential
-        token = credential.get_token("https://cognitiveservices.azure.com/.default").token
-        environ["OPENAI_API_KEY"] = token
 
-        environ["AZURE_OPENAI_AD_TOKEN"] = environ["OPENAI_API_KEY"]
+def unpack_vector(data: bytes) -> list:
+    vector = array("f")
+    vector.frombytes(data)
+    return vector.tolist()
 
-        embeddings = AzureOpenAIEmbeddings(
-            azure_deployment=environ.get("AZURE_OPENAI_EMBEDDING"),
-            openai_api_version=environ.get("AZURE_OPENAI_API_VERSION"),
+
+class EmbeddingCache(ABC):
+    """
+    Backend interface: `get_many` returns the vectors found for the keys, `put_many` stores vectors
+    and `evict` removes the least recently used entries until the cache fits in `max_bytes`.
+    Hits and misses are counted over the lifetime of the worker.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, keys: list) -> dict:
+        found = self._get_many(keys)
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    @abstractmethod
+    def put_many(self, vectors: dict):
+        ...
+
+    @abstractmethod
+    def evict(self) -> int:
+        ...
+
+    @abstractmethod
+    def _get_many(self, keys: list) -> dict:
+        ...
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else None}
+
+
+class NoEmbeddingCache(EmbeddingCache):
+
+    def _get_many(self, keys: list) -> dict:
+        return {}
+
+    def put_many(self, vectors: dict):
+        pass
+
+    def evict(self) -> int:
+        return 0
+
+
+class SqliteEmbeddingCache(EmbeddingCache):
+    """
+    Local cache in a SQLite file, for development and tests. The size is tracked as vectors are
+    written, eviction only scans the table once it exceeds `max_bytes`.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        super().__init__(max_bytes)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL, size INTEGER NOT NULL, used REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS embeddings_used ON embeddings (used)")
+        self.size = self._total_size()
+
+    def _total_size(self) -> int:
+        return self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+
+    def _get_many(self, keys: list) -> dict:
+        found = {}
+        with self.lock, self.connection:
+            for offset in range(0, len(keys), 500):
+                batch = keys[offset:offset + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self.connection.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch)
+                found.update((key, unpack_vector(vector)) for key, vector in rows)
+                self.connection.execute(f"UPDATE embeddings SET used = ? WHERE key IN ({placeholders})", [time.time(), *batch])
+        return found
+
+    def put_many(self, vectors: dict):
+        now = time.time()
+        rows = [(key, data, len(data), now) for key, data in ((key, pack_vector(vector)) for key, vector in vectors.items())]
+        with self.lock, self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO embeddings (key, vector, size, used) VALUES (?, ?, ?, ?)", rows)
+            # Replaced vectors are counted twice, the next eviction recounts
+            self.size += sum(row[2] for row in rows)
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def evict(self) -> int:
+        with self.lock, self.connection:
+            total = self._total_size()
+            self.size = total
+            if total <= self.max_bytes:
+                return 0
+            evicted = []
+            for key, size in self.connection.execute("SELECT key, size FROM embeddings ORDER BY used"):
+                if total <= self.max_bytes:
+                    break
+                evicted.append((key,))
+                total -= size
+            self.connection.executemany("DELETE FROM embeddings WHERE key = ?", evicted)
+            self.size = total
+        return len(evicted)
+
+
+class BlobEmbeddingCache(EmbeddingCache):
+    """
+    One blob per vector in a storage container. Recency is the blob's last access time when access
+    time tracking is enabled on the account, its last write otherwise. Eviction lists the whole
+    container, so it runs on a schedule rather than on every write.
+    """
+
+    def __init__(self, container: str, max_bytes: int):
+        super().__init__(max_bytes)
+        self.container = container
+        self.executor = ThreadPoolExecutor(max_workers=16)
+
+    def _blob_name(self, key: str) -> str:
+        return f"{key[:2]}/{key}"
+
+    def _get(self, key: str):
+        try:
+            return key, unpack_vector(read_blob(blob_ref(self.container, self._blob_name(key))))
+        except ResourceNotFoundError:
+            return key, None
+
+    def _get_many(self, keys: list) -> dict:
+        return {key: vector for key, vector in self.executor.map(self._get, keys) if vector is not None}
+
+    def _put(self, item: tuple):
+        key, vector = item
+        upload_blob(self.container, self._blob_name(key), pack_vector(vector))
+
+    def put_many(self, vectors: dict):
+        list(self.executor.map(self._put, vectors.items()))
+
+    def evict(self) -> int:
+        container_client = get_blob_service_client().get_container_client(self.container)
+        try:
+            blobs = list(container_client.list_blobs())
+        except ResourceNotFoundError:
+            return 0
+        total = sum(blob.size for blob in blobs)
+        evicted = 0
+        for blob in sorted(blobs, key=lambda blob: blob.last_accessed_on or blob.last_modified):
+            if total <= self.max_bytes:
+                break
+            container_client.delete_blob(blob.name)
+            total -= blob.size
+            evicted += 1
+        return evicted
+
+
+_embedding_cache = None
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    global _embedding_cache
+    if _embedding_cache is None:
+        if EMBEDDING_CACHE_BACKEND == "blob":
+            _embedding_cache = BlobEmbeddingCache(EMBEDDING_CACHE_CONTAINER, EMBEDDING_CACHE_MAX_BYTES)
+        elif EMBEDDING_CACHE_BACKEND == "sqlite":
+            _embedding_cache = SqliteEmbeddingCache(EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_BYTES)
+        elif EMBEDDING_CACHE_BACKEND == "none":
+            _embedding_cache = NoEmbeddingCache(EMBEDDING_CACHE_MAX_BYTES)
+        else:
+            raise ValueError(f"Unknown EMBEDDING_CACHE_BACKEND {EMBEDDING_CACHE_BACKEND!r}, expected blob, sqlite or none")
+    return _embedding_cache
+
+
+def read_checkpoints(prefix: str) -> dict:
+    """Vectors checkpointed by earlier attempts of an activity, by cache key."""
+    vectors = {}
+    container_client = get_blob_service_client().get_container_client(STAGING_CONTAINER)
+    for blob in container_client.list_blobs(name_starts_with=prefix):
+        vectors.update(read_json_blob(blob_ref(STAGING_CONTAINER, blob.name)))
+    return vectors
+
+
+# Generate embeddings for the chunks
+@myApp.activity_trigger(input_name="input")
+async def generate_embeddings(input: dict):
+    """
+    Embeds the chunks whose text is not in the embedding cache, in batched requests sent
+    EMBEDDING_CONCURRENCY at a time. Identical texts are embedded once. Every finished request is
+    checkpointed to staging, so a retried activity only sends the requests that did not complete.
+    """
+    try:
+        offset = input.get("offset", 0)
+        # Blob and tokenizer calls are blocking, they run in threads so the event loop keeps serving the requests
+        chunks = (await asyncio.to_thread(read_json_blob, input.get("chunks")))[offset:offset + input.get("limit")]
+        target = input.get("target")
+        checkpoint_prefix = f"{target}.batches/"
+
+        keys = [embedding_cache_key(chunk["content"]) for chunk in chunks]
+        texts = dict(zip(keys, (chunk["content"] for chunk in chunks)))
+
+        # Vectors of a previous attempt, then the cache
+        vectors = await asyncio.to_thread(read_checkpoints, checkpoint_prefix)
+        resumed = len(vectors)
+        cache = get_embedding_cache()
+        cached = await asyncio.to_thread(cache.get_many, [key for key in texts if key not in vectors])
+        vectors.update(cached)
+
+        missing = [{"key": key, "content": content} for key, content in texts.items() if key not in vectors]
+        batches = await asyncio.to_thread(embedding_batches, missing)
+        logging.info(f"Generating embeddings for {len(chunks)} chunks: {len(texts)} distinct, {resumed} from a previous attempt, "
+                     f"{len(cached)} cached, {len(missing)} to embed in {len(batches)} requests")
+
+        client = AsyncAzureOpenAI(
             azure_endpoint=environ.get("AZURE_OPENAI_ENDPOINT"),
-            api_key=environ.get("OPENAI_API_KEY")
+            api_version=environ.get("AZURE_OPENAI_API_VERSION"),
+            azure_ad_token_provider=openai_token_provider(),
+            max_retries=0,
         )
-        
+        throttle = EmbeddingThrottle(EMBEDDING_CONCURRENCY)
+
+        async def run_batch(number: int, batch: list):
+            started = time.perf_counter()
+            batch_vectors, tokens, retries = await embed_batch(client, throttle, [item["content"] for item in batch])
+            seconds = time.perf_counter() - started
+            logging.info(f"Embedding request {number + 1}/{len(batches)}: {len(batch)} inputs, {tokens} tokens "
+                         f"in {seconds:.2f}s ({tokens / seconds:.0f} tokens/s, {retries} retries)")
+
+            embedded = {item["key"]: vector for item, vector in zip(batch, batch_vectors)}
+            # Checkpoints are named by their content, batches are regrouped when a retry finds more in the cache
+            checkpoint = f"{checkpoint_prefix}{hashlib.sha256(''.join(embedded).encode()).hexdigest()}.json"
+            await asyncio.to_thread(write_json_blob, STAGING_CONTAINER, checkpoint, embedded)
+            await asyncio.to_thread(cache.put_many, embedded)
+            vectors.update(embedded)
+
+        started = time.perf_counter()
+        async with client:
+            await asyncio.gather(*(run_batch(number, batch) for number, batch in enumerate(batches)))
+        logging.info(f"Generated {len(missing)} embeddings in {time.perf_counter() - started:.2f}s, "
+                     f"embedding cache hits {len(cached)}/{len(texts) - resumed}, worker totals {cache.stats()}")
+
         embeddings_list = []
-        for chunk in chunks:
-            content = chunk["content"]
+        for chunk, key in zip(chunks, keys):
             metadata = chunk.get("metadata", {})
-            embedding = embeddings.embed_query(content)
-
-            chunk_id = str(metadata.get("chunk_id"))
-            title = str(metadata.get("title"))
-            page_number = str(metadata.get("page_number")) 
-            
-            embeddings_list.append({           
-                "chunk_id": chunk_id,
-                "content": content,
-                "title": title,
-                "pageNumber": page_number,
-                "content_vector": embedding
+            embeddings_list.append({
+                "chunk_id": str(metadata.get("chunk_id")),
+                "content": chunk["content"],
+                "title": str(metadata.get("title")),
+                "source_path": str(metadata.get("source_path")),
+                "pageNumber": str(metadata.get("page_number")),
+                "content_vector": vectors[key]
             })
-        
-        return embeddings_list
+
+        return await asyncio.to_thread(write_json_blob, STAGING_CONTAINER, target, embeddings_list, count=len(embeddings_list),
+                                       embedded=len(missing), cache_hits=len(cached), cache_lookups=len(texts) - resumed)
 
     except Exception as ex:
         logging.error(f"Error generating embeddings: {ex}")
@@ -181,15 +730,24 @@ def generate_embeddings(chunks: List[dict]):
         raise ex
 
 
+# Evict the least recently used vectors from the embedding cache
+@myApp.timer_trigger(arg_name="timer", schedule=environ.get("EMBEDDING_CACHE_EVICTION_SCHEDULE", "0 0 3 * * *"))
+def evict_embedding_cache(timer: func.TimerRequest):
+    try:
+        evicted = get_embedding_cache().evict()
+        logging.info(f"Evicted {evicted} vectors from the embedding cache, limit {EMBEDDING_CACHE_MAX_BYTES} bytes")
 
+    except Exception as ex:
+        logging.error(f"Error evicting the embedding cache: {ex}")
+        logging.error(traceback.format_exc())
+        raise ex
 
-# Update search index with the embeddings
-@myApp.activity_trigger(input_name="embeddings")
-def update_search_index(embeddings):
+
+# Create the search index if it does not exist, once before the parallel uploads
+@myApp.activity_trigger(input_name="input")
+def ensure_search_index(input):
     try:
-        logging.info(f"Updating search index with {len(embeddings)} embeddings")
 
-    
         # Configuration for Azure Cognitive Search
         search_endpoint = environ["AZURE_AI_SEARCH_ENDPOINT"]
         index_name = environ["AZURE_AI_SEARCH_INDEX"]
@@ -201,9 +759,6 @@ def update_search_index(embeddings):
         # Initialize the Azure credentials
         credential = AzureKeyCredential(search_api_key)
 
-        # Create SearchClient
-        search_client = SearchClient(endpoint=search_endpoint, index_name=index_name, credential=credential)
-
         # Create SearchIndexClient
         search_index_client = SearchIndexClient(endpoint=search_endpoint, credential=credential)
 
@@ -211,8 +766,13 @@ def update_search_index(embeddings):
         index_exists = False
         try:
             logging.info("Verifying if AI Search index exists...")
-            search_index_client.get_index(index_name)
+            existing = search_index_client.get_index(index_name)
             index_exists = True
+            # Indexes created before chunks were keyed by blob path get the field, adding a field keeps the documents
+            if not any(field.name == "source_path" for field in existing.fields):
+                logging.info("Adding the source_path field to the AI Search index...")
+                existing.fields.append(SimpleField(name="source_path", type="Edm.String", filterable=True))
+                search_index_client.create_or_update_index(existing)
         except ResourceNotFoundError:
             logging.info("AI Search index not found, creating index...")
 
@@ -232,6 +792,7 @@ def update_search_index(embeddings):
                     SimpleField(name="chunk_id", type="Edm.String", key=True, filterable=True, sortable=True),
                     SearchableField(name="content", type="Edm.String", filterable=True, sortable=True),
                     SearchableField(name="title", type="Edm.String", filterable=True, sortable=True),
+                    SimpleField(name="source_path", type="Edm.String", filterable=True),
                     SearchableField(name="pageNumber", type="Edm.Int", filterable=True, sortable=True),
                     SearchField(name="content_vector", type="Collection(Edm.Single)", vector_search_dimensions=1536, vector_search_profile_name="my-vector-config")
                 ],
@@ -262,6 +823,22 @@ def update_search_index(embeddings):
                 logging.error(f"Error creating search index: {ex}")
                 logging.error(traceback.format_exc())
 
+    except Exception as ex:
+        logging.error(f"Error verifying search index: {ex}")
+        logging.error(traceback.format_exc())
+        raise ex
+
+
+# Update search index with a batch of embeddings
+@myApp.activity_trigger(input_name="input")
+def update_search_index(input: dict):
+    try:
+        embeddings = read_json_blob(input)
+        logging.info(f"Updating search index with {len(embeddings)} embeddings")
+
+        # Create SearchClient
+        search_client = get_search_client()
+
         # Now process the embeddings and upload them in batches
         documents = []
         batch_size = int(environ.get("AZURE_AI_SEARCH_BATCH_SIZE"))
@@ -274,6 +851,7 @@ def update_search_index(embeddings):
                 chunk_id = str(embedding["chunk_id"])
                 content = str(embedding["content"])
                 title = str(embedding["title"])
+                document_path = str(embedding["source_path"])
                 page_number = str(embedding["pageNumber"])
                 content_vector = embedding["content_vector"]
 
@@ -282,6 +860,7 @@ def update_search_index(embeddings):
                     "chunk_id": chunk_id,
                     "content": content,
                     "title": title,
+                    "source_path": document_path,
                     "pageNumber": page_number,
                     "content_vector": content_vector
                 })
@@ -308,34 +887,80 @@ def update_search_index(embeddings):
 
 
 
+# Split the chunks into the ones to index and the indexed ones the document no longer has
+@myApp.activity_trigger(input_name="input")
+def diff_search_index(input: dict):
+    try:
+
+        filename = input.get("filename")
+        staging_prefix = input.get("staging_prefix")
+
+        indexed = indexed_chunk_ids(get_search_client(), input.get("path"), filename)
+
+        changed, current = [], set()
+        for index, chunk_file in enumerate(input.get("chunk_files")):
+            chunks = read_json_blob(chunk_file)
+            current.update(chunk["metadata"]["chunk_id"] for chunk in chunks)
+            new_chunks = [chunk for chunk in chunks if chunk["metadata"]["chunk_id"] not in indexed]
+            if new_chunks:
+                changed.append(write_json_blob(STAGING_CONTAINER, f"{staging_prefix}changed-{index:05d}.json", new_chunks, count=len(new_chunks)))
+
+        orphans = sorted(indexed - current)
+        logging.info(f"{filename}: {len(current)} chunks, {len(current & indexed)} already indexed, "
+                     f"{len(current - indexed)} to index, {len(orphans)} to remove")
+        return {
+            "changed": changed,
+            "unchanged": len(current & indexed),
+            "orphans": write_json_blob(STAGING_CONTAINER, f"{staging_prefix}orphans.json", orphans, count=len(orphans)),
+        }
+
+    except Exception as ex:
+        logging.error(f"Error comparing with the search index: {ex}")
+        logging.error(traceback.format_exc())
+        raise ex
+
+
+# Delete chunks from the search index in batches
+@myApp.activity_trigger(input_name="input")
+def delete_search_chunks(input: dict):
+    try:
+        chunk_ids = read_json_blob(input)
+        batch_size = int(environ.get("AZURE_AI_SEARCH_BATCH_SIZE"))
+
+        search_client = get_search_client()
+        for offset in range(0, len(chunk_ids), batch_size):
+            search_client.delete_documents(documents=[{"chunk_id": key} for key in chunk_ids[offset:offset + batch_size]])
+        logging.info(f"Deleted {len(chunk_ids)} chunks from the search index")
+
+    except Exception as ex:
+        logging.error(f"Error deleting from the search index: {ex}")
+        logging.error(traceback.format_exc())
+        raise ex
+
+
 # Move the processed blob to the "completed" container
 @myApp.activity_trigger(input_name="input")
 def move_blob(input: dict):
     try:
 
-        data_base64 = input.get("data")
+        source = input.get("source")
         filename = input.get("filename")
 
         logging.info(f"Moving blob {filename} to the completed container")
 
-        base64_bytes = data_base64.encode('ascii')
-        pdf_data = base64.b64decode(base64_bytes)
+        # Server-side copy, the document is not downloaded again
+        blob_service_client = get_blob_service_client()
+        blob_client = blob_service_client.get_blob_client(container=source["container"], blob=source["blob"])
+        completed_blob_client = blob_service_client.get_blob_client(container=COMPLETED_CONTAINER, blob=filename)
+        completed_blob_client.start_copy_from_url(blob_client.url)
 
-        container_name = "load"
-        completed_container = "completed"
+        copy = completed_blob_client.get_blob_properties().copy
+        while copy.status == "pending":
+            time.sleep(1)
+            copy = completed_blob_client.get_blob_properties().copy
+        if copy.status != "success":
+            raise RuntimeError(f"Copy of {filename} to {COMPLETED_CONTAINER} ended with status {copy.status}: {copy.status_description}")
 
-        # Blob storage logic to move the file
-        credential = DefaultAzureCredential()
-        AZURE_STORAGE_URL = environ.get("AZURE_STORAGE_URL")
-
-        # Create the BlobServiceClient object    
-        blob_service_client =  BlobServiceClient(AZURE_STORAGE_URL, credential=credential)    
-        blob_client = blob_service_client.get_blob_client(container=container_name, blob=filename)
-        
-        # Upload to completed container
-        completed_blob_client = blob_service_client.get_blob_client(container=completed_container, blob=filename)
-        completed_blob_client.upload_blob(pdf_data, overwrite=True)
-        
         logging.info(f"Deleted blob: {filename}")
         blob_client.delete_blob()
 
@@ -343,3 +968,19 @@ def move_blob(input: dict):
         logging.error(f"Error moving blob: {ex}")
         logging.error(traceback.format_exc())
         raise ex
+
+
+# Delete the staged artifacts of an orchestration instance
+@myApp.activity_trigger(input_name="prefix")
+def delete_staging(prefix: str):
+    try:
+        container_client = get_blob_service_client().get_container_client(STAGING_CONTAINER)
+        names = [blob.name for blob in container_client.list_blobs(name_starts_with=prefix)]
+        for name in names:
+            container_client.delete_blob(name)
+        logging.info(f"Deleted {len(names)} staged blob(s) under {prefix}")
+
+    except Exception as ex:
+        logging.error(f"Error deleting staged blobs: {ex}")
+        logging.error(traceback.format_exc())
+        raise ex
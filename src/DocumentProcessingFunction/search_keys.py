@@ -0,0 +1,47 @@
+import hashlib
+
+# Chunks read from the index per request when listing a document's chunks
+INDEXED_CHUNKS_PAGE_SIZE = 1000
+
+
+def source_path(source: dict) -> str:
+    """Full path of a source blob, container included, which tells documents with the same file name apart."""
+    return f"{source['container']}/{source['blob']}"
+
+
+def chunk_id(path: str, page_number: int, content_hash: str, occurrence: int) -> str:
+    """
+    Index key of a chunk, the same every time the document at `path` is processed as long as the
+    chunk's text and page do not change. Hex digits only, which index keys allow.
+    """
+    return hashlib.sha256(f"{path}\0{page_number}\0{content_hash}\0{occurrence}".encode("utf-8")).hexdigest()
+
+
+def _quote(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def document_filter(path: str, title: str) -> str:
+    """
+    OData filter matching the indexed chunks of the document at `path`. Chunks indexed before the
+    source_path field existed are matched by title, so a reprocessed document replaces them.
+    """
+    return f"(source_path eq {_quote(path)} or (source_path eq null and title eq {_quote(title)}))"
+
+
+def indexed_chunk_ids(search_client, path: str, title: str, page_size: int = INDEXED_CHUNKS_PAGE_SIZE) -> set:
+    """
+    Ids of every chunk indexed for the document at `path`. Pages through the results in chunk_id
+    order, each request starting after the last id seen, so no result limit or skip cap applies.
+    """
+    ids, last = set(), None
+    while True:
+        query_filter = document_filter(path, title)
+        if last is not None:
+            query_filter += f" and chunk_id gt {_quote(last)}"
+        page = [result["chunk_id"] for result in search_client.search(
+            search_text="*", filter=query_filter, select=["chunk_id"], order_by=["chunk_id asc"], top=page_size)]
+        ids.update(page)
+        if len(page) < page_size:
+            return ids
+        last = page[-1]
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# function_app is imported from the function app root, as the Functions host does
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
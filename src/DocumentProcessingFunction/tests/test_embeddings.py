@@ -0,0 +1,45 @@
+import asyncio
+import time
+from collections import namedtuple
+
+import pytest
+
+# function_app imports the Functions runtime, the Azure SDKs and the PDF and text splitting libraries
+for module in ("azure.functions", "azure.durable_functions", "azure.storage.blob", "azure.search.documents",
+               "langchain.text_splitter", "openai", "tiktoken", "fitz"):
+    pytest.importorskip(module)
+
+import function_app  # noqa: E402
+
+AccessToken = namedtuple("AccessToken", ["token", "expires_on"])
+
+
+class FakeCredential:
+    def __init__(self, lifetime: float):
+        self.lifetime = lifetime
+        self.scopes = []
+
+    def get_token(self, scope):
+        self.scopes.append(scope)
+        return AccessToken(f"token-{len(self.scopes)}", int(time.time() + self.lifetime))
+
+
+def test_token_is_reused_while_valid():
+    credential = FakeCredential(3600)
+    provider = function_app.openai_token_provider(credential)
+
+    async def requests():
+        return await asyncio.gather(*(provider() for _ in range(5)))
+
+    assert asyncio.run(requests()) == ["token-1"] * 5
+    assert credential.scopes == [function_app.COGNITIVE_SERVICES_SCOPE]
+
+
+def test_token_is_refreshed_before_it_expires():
+    credential = FakeCredential(function_app.TOKEN_REFRESH_SECONDS - 1)
+    provider = function_app.openai_token_provider(credential)
+
+    async def requests():
+        return [await provider(), await provider()]
+
+    assert asyncio.run(requests()) == ["token-1", "token-2"]
@@ -0,0 +1,109 @@
+import hashlib
+import json
+
+import pytest
+
+# function_app imports the Functions runtime, the Azure SDKs and the PDF and text splitting libraries
+for module in ("azure.functions", "azure.durable_functions", "azure.storage.blob", "azure.search.documents",
+               "langchain.text_splitter", "openai", "tiktoken", "fitz"):
+    pytest.importorskip(module)
+
+import function_app  # noqa: E402
+from function_app import STAGING_CONTAINER, blob_ref  # noqa: E402
+from search_keys import chunk_id  # noqa: E402
+
+# Activities are registered through the decorators, the user function is what the host calls
+diff_search_index = function_app.diff_search_index.build().get_user_function()
+
+
+PATH = "load/reports/report.pdf"
+
+
+def _hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class FakeSearchClient:
+    def __init__(self, chunk_ids=()):
+        self.chunk_ids = set(chunk_ids)
+        self.filters = []
+
+    def search(self, search_text, filter, select, order_by, top):
+        self.filters.append(filter)
+        return [{"chunk_id": key} for key in self.chunk_ids]
+
+
+@pytest.fixture
+def blobs(monkeypatch):
+    store = {}
+
+    def upload_blob(container, blob, data, **details):
+        store[(container, blob)] = data if isinstance(data, bytes) else data.read()
+        return blob_ref(container, blob, **details)
+
+    monkeypatch.setattr(function_app, "upload_blob", upload_blob)
+    monkeypatch.setattr(function_app, "read_blob", lambda ref: store[(ref["container"], ref["blob"])])
+    return store
+
+
+def _chunks(path, pages):
+    """Chunk records as chunk_pdf writes them, one list of texts per page."""
+    chunks = []
+    for page_number, texts in enumerate(pages, start=1):
+        occurrences = {}
+        for content in texts:
+            content_hash = _hash(content)
+            occurrences[content_hash] = occurrences.get(content_hash, -1) + 1
+            chunks.append({"content": content, "metadata": {
+                "title": path.rsplit("/", 1)[-1], "source_path": path, "page_number": page_number,
+                "chunk_id": chunk_id(path, page_number, content_hash, occurrences[content_hash]),
+            }})
+    return chunks
+
+
+def _diff(monkeypatch, blobs, indexed, chunk_files):
+    search_client = FakeSearchClient(indexed)
+    monkeypatch.setattr(function_app, "get_search_client", lambda: search_client)
+    refs = [function_app.write_json_blob(STAGING_CONTAINER, f"run/chunks-{index:05d}.json", chunks)
+            for index, chunks in enumerate(chunk_files)]
+
+    result = diff_search_index({"filename": "report.pdf", "path": PATH, "staging_prefix": "run/", "chunk_files": refs})
+
+    changed = [chunk for ref in result["changed"] for chunk in json.loads(blobs[(ref["container"], ref["blob"])])]
+    orphans = json.loads(blobs[(result["orphans"]["container"], result["orphans"]["blob"])])
+    return result, changed, orphans
+
+
+def test_first_run_indexes_every_chunk(monkeypatch, blobs):
+    chunks = _chunks(PATH, [["a", "b"], ["c", "c"]])
+
+    result, changed, orphans = _diff(monkeypatch, blobs, [], [chunks[:2], chunks[2:]])
+
+    assert changed == chunks
+    assert [ref["count"] for ref in result["changed"]] == [2, 2]
+    assert result["unchanged"] == 0
+    assert orphans == [] and result["orphans"]["count"] == 0
+
+
+def test_unchanged_document_indexes_nothing(monkeypatch, blobs):
+    chunks = _chunks(PATH, [["a", "b"], ["c", "c"]])
+    indexed = [chunk["metadata"]["chunk_id"] for chunk in chunks]
+
+    result, changed, orphans = _diff(monkeypatch, blobs, indexed, [chunks])
+
+    assert result["changed"] == [] and changed == []
+    assert result["unchanged"] == 4
+    assert orphans == []
+
+
+def test_edited_document_indexes_new_chunks_and_removes_old_ones(monkeypatch, blobs):
+    before = _chunks(PATH, [["a", "b"], ["c", "c"]])
+    after = _chunks(PATH, [["a", "b2"], ["c"]])
+    indexed = [chunk["metadata"]["chunk_id"] for chunk in before]
+
+    result, changed, orphans = _diff(monkeypatch, blobs, indexed, [after])
+
+    assert [chunk["content"] for chunk in changed] == ["b2"]
+    assert result["unchanged"] == 2
+    # "b" and the second "c" on page 2
+    assert orphans == sorted([before[1]["metadata"]["chunk_id"], before[3]["metadata"]["chunk_id"]])
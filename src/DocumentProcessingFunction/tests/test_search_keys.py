@@ -0,0 +1,99 @@
+import hashlib
+import re
+
+import pytest
+
+from search_keys import chunk_id, document_filter, indexed_chunk_ids, source_path
+
+PATH = "load/reports/2025/q3.pdf"
+
+
+def _hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def test_chunk_id_is_stable():
+    expected = hashlib.sha256(f"{PATH}\0{3}\0{_hash('text')}\0{0}".encode("utf-8")).hexdigest()
+
+    assert chunk_id(PATH, 3, _hash("text"), 0) == expected
+
+
+def test_chunk_id_is_a_valid_index_key():
+    key = chunk_id("load/Q3 report (final).pdf", 1, _hash("text"), 0)
+
+    assert len(key) == 64
+    assert set(key) <= set("0123456789abcdef")
+
+
+@pytest.mark.parametrize("other", [
+    # Same file name in another folder
+    ("load/reports/2024/q3.pdf", 3, "text", 0),
+    (PATH, 4, "text", 0),
+    (PATH, 3, "changed text", 0),
+    (PATH, 3, "text", 1),
+    # Fields are separated, shifting characters between them changes the key
+    (PATH + "3", 3, "text", 0),
+])
+def test_chunk_id_changes_with_every_component(other):
+    path, page_number, content, occurrence = other
+
+    assert chunk_id(path, page_number, _hash(content), occurrence) != chunk_id(PATH, 3, _hash("text"), 0)
+
+
+def test_source_path_includes_the_container_and_folders():
+    assert source_path({"container": "load", "blob": "reports/2025/q3.pdf", "first_page": 1}) == PATH
+
+
+def test_document_filter_escapes_quotes():
+    assert document_filter("load/O'Brien.pdf", "O'Brien.pdf") == \
+        "(source_path eq 'load/O''Brien.pdf' or (source_path eq null and title eq 'O''Brien.pdf'))"
+
+
+class FakeSearchClient:
+    """Evaluates the filters indexed_chunk_ids sends against a list of indexed documents."""
+
+    def __init__(self, documents):
+        self.documents = documents
+        self.requests = []
+
+    def search(self, search_text, filter, select, order_by, top):
+        self.requests.append(filter)
+        assert order_by == ["chunk_id asc"]
+        path = re.search(r"source_path eq '((?:[^']|'')*)'", filter).group(1).replace("''", "'")
+        title = re.search(r"title eq '((?:[^']|'')*)'", filter).group(1).replace("''", "'")
+        after = re.search(r"chunk_id gt '([0-9a-f]+)'", filter)
+        matches = sorted(
+            document["chunk_id"] for document in self.documents
+            if (document.get("source_path") == path or (document.get("source_path") is None and document["title"] == title))
+            and (after is None or document["chunk_id"] > after.group(1))
+        )
+        return [{"chunk_id": key} for key in matches[:top]]
+
+
+def _documents(path, count, legacy=False):
+    title = path.rsplit("/", 1)[-1]
+    return [{"chunk_id": chunk_id(path, 1, _hash(str(n)), 0), "title": title, **({} if legacy else {"source_path": path})}
+            for n in range(count)]
+
+
+@pytest.mark.parametrize("count, page_size, requests", [(0, 4, 1), (3, 4, 1), (8, 4, 3), (10, 4, 3), (2500, 1000, 3)])
+def test_indexed_chunk_ids_reads_every_page(count, page_size, requests):
+    documents = _documents(PATH, count)
+    search_client = FakeSearchClient(documents)
+
+    ids = indexed_chunk_ids(search_client, PATH, "q3.pdf", page_size=page_size)
+
+    assert ids == {document["chunk_id"] for document in documents}
+    assert len(search_client.requests) == requests
+
+
+def test_indexed_chunk_ids_keeps_documents_with_the_same_name_apart():
+    mine, other = _documents(PATH, 5), _documents("load/reports/2024/q3.pdf", 5)
+
+    assert indexed_chunk_ids(FakeSearchClient(mine + other), PATH, "q3.pdf", page_size=2) == {d["chunk_id"] for d in mine}
+
+
+def test_indexed_chunk_ids_includes_chunks_indexed_without_a_path():
+    legacy = _documents("q3.pdf", 3, legacy=True)
+
+    assert indexed_chunk_ids(FakeSearchClient(legacy), PATH, "q3.pdf") == {d["chunk_id"] for d in legacy}
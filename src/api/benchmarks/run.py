@@ -0,0 +1,293 @@
+"""
+Benchmark the energy API's REST and GraphQL paths across dataset sizes.
+
+Runs in-process against a local storage backend (file:// or memory://), one worker process per
+dataset size so caches and peak RSS do not leak between sizes. Requests go through httpx's ASGI
+transport (pip install httpx). Results are written as JSON and can be compared against an earlier
+run, any p95 or throughput regression beyond --threshold exits non-zero.
+
+Every scenario repeats the same request, so by default each size is measured twice: with the
+response caches (HTTP responses, GraphQL results, anomalies) on, timing cache hits, and with them
+off, timing the actual query work. Results carry "response_cache": "on" or "off".
+
+
+    cd src/api
+    python -m benchmarks.run --sizes 1000,100000,1000000 --output results.json
+    python -m benchmarks.run --sizes 1000,100000,1000000 --baseline results.json --output new.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from benchmarks.scenarios import DATASET_START, Scenario, select
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SIZES = "1000,10000,100000,1000000,10000000"
+
+# Entry limits of the response caches, set to 0 to measure uncached requests
+RESPONSE_CACHE_SETTINGS = ("ENERGY_HTTP_CACHE_MAX_ENTRIES", "ENERGY_GRAPHQL_CACHE_MAX_ENTRIES", "ENERGY_ANOMALY_CACHE_MAX_ENTRIES")
+
+
+class RssSampler:
+    """Track the peak resident set size of this process while a scenario runs."""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def current() -> int:
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except OSError:
+            # No procfs, fall back to the process-wide peak
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.current())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = self.current()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def _ensure_dataset(rows: int, data_centers: int, seed: int, layout: str):
+    """Generate the dataset into the configured storage once, later runs reuse it."""
+    import pyarrow.parquet as pq
+    from data.storageaccount import energy_usage, init
+    from service.data_generator import generate_energy_usage
+
+    init.storage_init()
+    fs, storage_account_container = init.fs, init.storage_account_container
+
+    marker = f"{storage_account_container}/.complete"
+    if fs.exists(marker):
+        return
+
+    started = time.perf_counter()
+    batches = generate_energy_usage(rows, data_centers=data_centers, start=DATASET_START, seed=seed)
+    if layout == "partitioned":
+        energy_usage.write_energy_usage(batches)
+    else:
+        fs.makedirs(storage_account_container, exist_ok=True)
+        with fs.open(f"{storage_account_container}/{energy_usage.USAGE_BLOB_NAME}", "wb") as f, \
+                pq.ParquetWriter(f, energy_usage.ENERGY_USAGE_SCHEMA, compression="zstd") as writer:
+            for batch in batches:
+                writer.write_table(batch)
+
+    fs.touch(marker)
+    print(f"Generated {rows} rows ({layout}) in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+
+async def _request(client, scenario: Scenario) -> tuple[float, int, int]:
+    started = time.perf_counter()
+    response = await client.request(scenario.method, scenario.endpoint, params=scenario.params, json=scenario.body,
+                                    headers={"Accept": scenario.accept})
+    elapsed = time.perf_counter() - started
+    return elapsed, response.status_code, len(response.content)
+
+
+async def _measure(client, scenario: Scenario, concurrency: int, requests: int, warmup: int) -> dict:
+    for _ in range(warmup):
+        await _request(client, scenario)
+
+    queue = iter(range(requests))
+    samples = []
+
+    async def worker():
+        for _ in queue:
+            samples.append(await _request(client, scenario))
+
+    with RssSampler() as rss:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall = time.perf_counter() - started
+
+    latencies = np.array([sample[0] for sample in samples]) * 1000
+    return {
+        "scenario": scenario.name,
+        "endpoint": scenario.endpoint,
+        "filters": scenario.filters,
+        "format": scenario.format,
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": sum(1 for sample in samples if sample[1] >= 400),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+        "mean_ms": round(float(latencies.mean()), 3),
+        "throughput_rps": round(requests / wall, 2),
+        "response_bytes": int(np.median([sample[2] for sample in samples])),
+        "peak_rss_mb": round(rss.peak / 2 ** 20, 1),
+    }
+
+
+async def _run_worker(args) -> list[dict]:
+    import httpx
+    import main
+
+    async with main.app.router.lifespan_context(main.app):
+        await main.warm_up.wait()
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+            # Import and warm-up (storage, dataset load) and the first request, reported separately from steady state
+            started = time.perf_counter()
+            await client.get("/usage/energy-usage", params={"limit": 1})
+            results = [{"scenario": "cold-start", "ready_ms": round(main.warm_up.ready_seconds * 1000, 3),
+                        "first_request_ms": round((time.perf_counter() - started) * 1000, 3),
+                        "peak_rss_mb": round(RssSampler.current() / 2 ** 20, 1)}]
+
+            for scenario in select(args.scenarios):
+                for concurrency in args.concurrency:
+                    results.append(await _measure(client, scenario, concurrency, args.requests, args.warmup))
+                    print(f"  {args.rows} rows {scenario.name} x{concurrency} (response caches {args.response_cache}): p50 {results[-1]['p50_ms']}ms "
+                          f"{results[-1]['throughput_rps']} req/s", file=sys.stderr)
+    return results
+
+
+def worker(args):
+    """Benchmark a single dataset size, printing the results as JSON on stdout."""
+    dataset = f"{args.layout}-{args.rows}-{args.data_centers}dc-seed{args.seed}"
+    if args.storage == "memory":
+        os.environ["ENERGY_STORAGE_URL"] = f"memory://{dataset}"
+    else:
+        os.environ["ENERGY_STORAGE_URL"] = f"file://{os.path.join(os.path.abspath(args.data_dir), dataset)}"
+    os.environ["ENERGY_CACHE_ENABLED"] = "false" if args.no_cache else "true"
+    if args.response_cache == "off":
+        for setting in RESPONSE_CACHE_SETTINGS:
+            os.environ[setting] = "0"
+    sys.path.insert(0, API_DIR)
+
+    _ensure_dataset(args.rows, args.data_centers, args.seed, args.layout)
+
+    results = asyncio.run(_run_worker(args))
+    for result in results:
+        result["rows"] = args.rows
+        result["response_cache"] = args.response_cache
+    json.dump(results, sys.stdout)
+
+
+def _worker_command(args, rows: int, response_cache: str) -> list[str]:
+    command = [
+        sys.executable, "-m", "benchmarks.run", "--worker", "--rows", str(rows), "--response-cache", response_cache,
+        "--concurrency", ",".join(map(str, args.concurrency)), "--requests", str(args.requests), "--warmup", str(args.warmup),
+        "--storage", args.storage, "--layout", args.layout, "--data-dir", os.path.abspath(args.data_dir),
+        "--data-centers", str(args.data_centers), "--seed", str(args.seed),
+    ]
+    if args.scenarios:
+        command += ["--scenarios", ",".join(args.scenarios)]
+    if args.no_cache:
+        command.append("--no-cache")
+    return command
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=API_DIR, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+def compare(results: list[dict], baseline: list[dict], threshold: float) -> list[str]:
+    """Describe scenarios whose p95 latency or throughput got worse than the baseline by more than `threshold`."""
+    def key(result):
+        return result["rows"], result.get("response_cache", "on"), result["scenario"], result.get("concurrency")
+
+    previous = {key(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        before = previous.get(key(result))
+        if before is None or "p95_ms" not in result:
+            continue
+        if result["p95_ms"] > before["p95_ms"] * (1 + threshold):
+            regressions.append(f"{key(result)} p95 {before['p95_ms']}ms -> {result['p95_ms']}ms")
+        if result["throughput_rps"] < before["throughput_rps"] * (1 - threshold):
+            regressions.append(f"{key(result)} throughput {before['throughput_rps']} -> {result['throughput_rps']} req/s")
+    return regressions
+
+
+def main(args):
+    results = []
+    modes = ["on", "off"] if args.response_cache == "both" else [args.response_cache]
+    for rows in args.sizes:
+        for mode in modes:
+            print(f"Benchmarking {rows} rows, response caches {mode}", file=sys.stderr)
+            output = subprocess.run(_worker_command(args, rows, mode), cwd=API_DIR, stdout=subprocess.PIPE, check=True, text=True).stdout
+            results.extend(json.loads(output))
+
+    report = {
+        "meta": {
+            "revision": _git_revision(),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "settings": {key: value for key, value in vars(args).items() if key not in ("worker", "rows", "baseline", "output")},
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {len(results)} results to {args.output}", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f)["results"], args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, type=lambda value: [int(size) for size in value.split(",")])
+    parser.add_argument("--scenarios", type=lambda value: value.split(","), help="Comma separated scenario names, all by default")
+    parser.add_argument("--concurrency", default="1,8", type=lambda value: [int(level) for level in value.split(",")])
+    parser.add_argument("--requests", default=50, type=int, help="Measured requests per scenario and concurrency level")
+    parser.add_argument("--warmup", default=3, type=int)
+    parser.add_argument("--storage", default="file", choices=["file", "memory"])
+    parser.add_argument("--layout", default="partitioned", choices=["partitioned", "single"])
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "energy-benchmark-data"))
+    parser.add_argument("--data-centers", default=20, type=int)
+    parser.add_argument("--seed", default=42, type=int)
+    parser.add_argument("--no-cache", action="store_true", help="Benchmark with the in-process dataset cache disabled")
+    parser.add_argument("--response-cache", default="both", choices=["both", "on", "off"],
+                        help="Measure with the response caches on, off, or both reported separately")
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--baseline", help="Earlier results file to compare against")
+    parser.add_argument("--threshold", default=0.1, type=float, help="Relative slowdown reported as a regression")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--rows", type=int, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    arguments = _parse_args()
+    if arguments.worker:
+        worker(arguments)
+    else:
+        main(arguments)
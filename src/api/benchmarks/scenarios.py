@@ -0,0 +1,71 @@
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Optional
+
+# Generated datasets start here, time windows below are relative to it
+DATASET_START = datetime(2025, 1, 1)
+
+JSON = "application/json"
+NDJSON = "application/x-ndjson"
+ARROW = "application/vnd.apache.arrow.stream"
+
+
+@dataclass
+class Scenario:
+    """One request shape: endpoint, filter combination and response format."""
+    name: str
+    endpoint: str
+    method: str = "GET"
+    params: dict = field(default_factory=dict)
+    accept: str = JSON
+    body: Optional[dict] = None
+    filters: str = "none"
+
+    @property
+    def format(self) -> str:
+        return {JSON: "json", NDJSON: "ndjson", ARROW: "arrow"}[self.accept]
+
+
+def _window(days: int = 1) -> dict:
+    return {"start": DATASET_START.isoformat(), "end": (DATASET_START + timedelta(days=days)).isoformat()}
+
+
+def _graphql(query: str, variables: Optional[dict] = None, name: str = "", filters: str = "none") -> Scenario:
+    return Scenario(name=name, endpoint="/graphql", method="POST", body={"query": query, "variables": variables or {}}, filters=filters)
+
+
+REST_FILTERS = {
+    "none": {},
+    "zone": {"zone": "A1"},
+    "alarm": {"alarm_status": "critical"},
+    "zone+window": {"zone": "B2", **_window()},
+}
+
+SCENARIOS = [
+    # Paged JSON, the shape agents use
+    *[Scenario(name=f"rest-page-{name}", endpoint="/usage/energy-usage", params={**params, "limit": 1000}, filters=name)
+      for name, params in REST_FILTERS.items()],
+    Scenario(name="rest-page-projected", endpoint="/usage/energy-usage", params={"fields": "timestamp,zone,pue", "limit": 1000}),
+    # Streamed one day windows
+    *[Scenario(name=f"rest-stream-{fmt}", endpoint="/usage/energy-usage", params=_window(), accept=accept, filters="window")
+      for fmt, accept in (("ndjson", NDJSON), ("arrow", ARROW))],
+    Scenario(name="rest-aggregate-rollup", endpoint="/usage/aggregate", params={"group_by": "zone", "functions": "mean,max"}),
+    Scenario(name="rest-aggregate-bucketed", endpoint="/usage/aggregate",
+             params={"group_by": "data_center_id", "bucket": "1h", "metrics": "pue,power_draw_kw", "functions": "mean,p95", **_window(7)},
+             filters="window"),
+    _graphql("query Page($limit: Int) { energyUsage(limit: $limit) { timestamp zone pue } }", {"limit": 1000}, name="graphql-page"),
+    _graphql("query Filtered($start: DateTime, $end: DateTime) { energyUsagePage(filter: {zone: A1}, start: $start, end: $end, limit: 1000) "
+             "{ nextCursor items { timestamp dataCenterId powerDrawKw pue alarmStatus } } }",
+             _window(), name="graphql-page-filtered", filters="zone+window"),
+    _graphql("{ energyAggregate(groupBy: [ZONE], metrics: [PUE], functions: [\"mean\", \"p95\"]) { zone values { name value } } }",
+             name="graphql-aggregate"),
+]
+
+
+def select(names: Optional[list[str]]) -> list[Scenario]:
+    if not names:
+        return SCENARIOS
+    unknown = set(names) - {scenario.name for scenario in SCENARIOS}
+    if unknown:
+        raise ValueError(f"Unknown scenario(s): {', '.join(sorted(unknown))}")
+    return [scenario for scenario in SCENARIOS if scenario.name in names]
@@ -0,0 +1,143 @@
+import asyncio
+import posixpath
+from typing import TYPE_CHECKING, Optional
+
+import fsspec
+import pyarrow as pa
+from fsspec.implementations.local import LocalFileSystem
+
+if TYPE_CHECKING:
+    import aiohttp
+    from azure.identity.aio import DefaultAzureCredential
+    from azure.storage.blob.aio import BlobServiceClient
+
+
+class AzureBlobAsyncStorage:
+    """
+    Async blob client shared by every request of a worker process.
+
+    The blob service client and the aiohttp connection pool are created once at application
+    startup and closed on shutdown, so requests reuse warm connections instead of opening their
+    own. The credential is passed in and owned by the caller, so its token cache is shared.
+    """
+
+    def __init__(self, account_name: str, credential: "DefaultAzureCredential", max_connections: int = 32):
+        self.account_url = f"https://{account_name}.blob.core.windows.net"
+        self.max_connections = max_connections
+
+        self._credential = credential
+        self._session: Optional["aiohttp.ClientSession"] = None
+        self._client: Optional["BlobServiceClient"] = None
+
+    async def open(self):
+        # Imported on open, local and in-memory storage never load the Azure SDK
+        import aiohttp
+        from azure.core.pipeline.transport import AioHttpTransport
+        from azure.storage.blob.aio import BlobServiceClient
+
+        self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.max_connections))
+        transport = AioHttpTransport(session=self._session, session_owner=False)
+        self._client = BlobServiceClient(self.account_url, credential=self._credential, transport=transport)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.close()
+        if self._session is not None:
+            await self._session.close()
+        self._client = self._session = None
+
+    def _container(self, container: str):
+        if self._client is None:
+            raise RuntimeError("Async storage client is not open, it is opened by the application lifespan")
+        return self._client.get_container_client(container)
+
+    def _blob(self, container: str, blob: str):
+        return self._container(container).get_blob_client(blob)
+
+    async def read_bytes(self, container: str, blob: str) -> bytes:
+        from azure.core.exceptions import ResourceNotFoundError
+
+        try:
+            downloader = await self._blob(container, blob).download_blob(max_concurrency=4)
+        except ResourceNotFoundError as ex:
+            # Same contract as the fsspec backend, missing blobs raise FileNotFoundError
+            raise FileNotFoundError(f"{container}/{blob}") from ex
+        return await downloader.readall()
+
+    async def open_input(self, container: str, blob: str) -> pa.NativeFile:
+        """Download a blob into memory and return it as a readable Arrow file."""
+        return pa.BufferReader(await self.read_bytes(container, blob))
+
+    async def get_version(self, container: str, blob: str) -> str:
+        """Return the blob ETag (or last-modified time) used to detect changes, FileNotFoundError when it does not exist."""
+        from azure.core.exceptions import ResourceNotFoundError
+
+        try:
+            properties = await self._blob(container, blob).get_blob_properties()
+        except ResourceNotFoundError as ex:
+            raise FileNotFoundError(f"{container}/{blob}") from ex
+        return str(properties.etag or properties.last_modified)
+
+    async def list_blobs(self, container: str, prefix: str) -> list[dict]:
+        """Flat listing of the blobs under `prefix`, as dicts with name, etag and size."""
+        return [
+            {"name": blob.name, "etag": blob.etag, "size": blob.size}
+            async for blob in self._container(container).list_blobs(name_starts_with=prefix)
+        ]
+
+    async def has_blobs(self, container: str, prefix: str) -> bool:
+        async for _ in self._container(container).list_blobs(name_starts_with=prefix, results_per_page=1):
+            return True
+        return False
+
+
+def _info_version(info: dict) -> str:
+    # Local and in-memory files have no ETag, their modification time and size identify a version
+    modified = info.get("mtime") or info.get("created") or info.get("last_modified")
+    return str(info.get("etag") or f"{modified}-{info.get('size')}")
+
+
+class FsspecAsyncStorage:
+    """
+    Async counterpart of AzureBlobAsyncStorage for any other fsspec filesystem (local disk, memory).
+
+    Containers are directories. Calls run in worker threads, and local files are memory-mapped
+    instead of being read into memory.
+    """
+
+    def __init__(self, fs: fsspec.AbstractFileSystem):
+        self.fs = fs
+        self.local = isinstance(fs, LocalFileSystem)
+
+    async def open(self):
+        pass
+
+    async def close(self):
+        pass
+
+    def _open_input(self, path: str) -> pa.NativeFile:
+        if self.local:
+            return pa.memory_map(path, "r")
+        return pa.BufferReader(self.fs.cat_file(path))
+
+    async def open_input(self, container: str, blob: str) -> pa.NativeFile:
+        return await asyncio.to_thread(self._open_input, f"{container}/{blob}")
+
+    async def get_version(self, container: str, blob: str) -> str:
+        return _info_version(await asyncio.to_thread(self.fs.info, f"{container}/{blob}"))
+
+    def _list(self, container: str, prefix: str) -> list[dict]:
+        # Prefixes are directories, ending with "/"
+        path = f"{container}/{prefix}"
+        if not self.fs.exists(path):
+            return []
+        return [
+            {"name": posixpath.relpath(name, container), "etag": _info_version(info), "size": info["size"]}
+            for name, info in self.fs.find(path, detail=True).items()
+        ]
+
+    async def list_blobs(self, container: str, prefix: str) -> list[dict]:
+        return await asyncio.to_thread(self._list, container, prefix)
+
+    async def has_blobs(self, container: str, prefix: str) -> bool:
+        return bool(await self.list_blobs(container, prefix))
@@ -0,0 +1,180 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional
+
+import numpy as np
+import pyarrow as pa
+
+from .pagination import timestamp_index
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class EnergyUsageSnapshot:
+    """Parsed energy usage table, sorted by timestamp, and the blob version it was read from."""
+    table: pa.Table
+    version: str
+    loaded_at: float
+    timestamps: np.ndarray = field(init=False, repr=False)
+    # Results precomputed by load hooks (e.g. rollups), valid for this version only
+    derived: dict = field(default_factory=dict, repr=False)
+
+    def __post_init__(self):
+        # Sorted int64 timestamp index used to binary search time windows and cursors
+        self.timestamps = timestamp_index(self.table)
+
+
+class DatasetCache:
+    """
+    Process-wide cache for a parsed Arrow table.
+
+    The cached table is revalidated against the source version (blob ETag / last-modified)
+    at most once every `revalidate_seconds`. Revalidation and reloads run as a background
+    task on the event loop, readers keep getting the current (possibly stale) snapshot until
+    the new one is ready. Load hooks are CPU bound and run in a worker thread.
+
+    When the version changes, `updater` is offered the current snapshot first and may return the
+    new table built incrementally from it (e.g. by merging appended files), or None to fall back
+    to a full load.
+    """
+
+    def __init__(self, loader: Callable[[str], Awaitable[pa.Table]], version_fetcher: Callable[[], Awaitable[str]],
+                 revalidate_seconds: float = 30,
+                 updater: Optional[Callable[[EnergyUsageSnapshot, str], Awaitable[Optional[pa.Table]]]] = None):
+        self._loader = loader
+        self._version_fetcher = version_fetcher
+        self._updater = updater
+        self.revalidate_seconds = revalidate_seconds
+
+        self._load_hooks: list[Callable[[EnergyUsageSnapshot], None]] = []
+        self._snapshot: Optional[EnergyUsageSnapshot] = None
+        self._lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._last_checked = 0.0
+        self._refresh_requested = False
+        # Bumped by invalidate(), loads that started before it are discarded
+        self._generation = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.updates = 0
+        self.revalidations = 0
+        self.errors = 0
+
+    async def get(self) -> EnergyUsageSnapshot:
+        """Return the cached snapshot, loading it on first use."""
+        snapshot = self._snapshot
+
+        if snapshot is None:
+            async with self._lock:
+                if self._snapshot is None:
+                    self.misses += 1
+                    while self._snapshot is None:
+                        generation = self._generation
+                        snapshot = await self._load()
+                        if generation == self._generation:
+                            self._snapshot = snapshot
+                    self._last_checked = time.monotonic()
+                else:
+                    self.hits += 1
+                return self._snapshot
+
+        self.hits += 1
+        if time.monotonic() - self._last_checked >= self.revalidate_seconds and not self.refreshing:
+            self._refresh_task = asyncio.create_task(self._refresh())
+        return snapshot
+
+    @property
+    def refreshing(self) -> bool:
+        return self._refresh_task is not None and not self._refresh_task.done()
+
+    def add_load_hook(self, hook: Callable[[EnergyUsageSnapshot], None]):
+        """Register a callback run on every newly loaded snapshot before it is served."""
+        self._load_hooks.append(hook)
+
+    def refresh(self):
+        """Revalidate now in the background instead of waiting for the interval, e.g. after an append."""
+        if self._snapshot is None:
+            return
+        if self.refreshing:
+            # The running check may predate the change, revalidate again on the next read
+            self._refresh_requested = True
+        else:
+            self._refresh_task = asyncio.create_task(self._refresh())
+
+    def invalidate(self):
+        """Drop the cached snapshot, the next read reloads from storage. Loads in flight are discarded."""
+        self._generation += 1
+        self._snapshot = None
+        self._last_checked = 0.0
+
+    async def close(self):
+        """Cancel an in-flight background refresh, used on application shutdown."""
+        if self.refreshing:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+        self._refresh_task = None
+
+    def stats(self) -> dict:
+        snapshot = self._snapshot
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "reloads": self.reloads,
+            "updates": self.updates,
+            "revalidations": self.revalidations,
+            "errors": self.errors,
+            "refreshing": self.refreshing,
+            "version": snapshot.version if snapshot else None,
+            "rows": snapshot.table.num_rows if snapshot else 0,
+            "loaded_at": snapshot.loaded_at if snapshot else None,
+        }
+
+    async def _load(self, version: Optional[str] = None) -> EnergyUsageSnapshot:
+        # Read the version first, if the blob changes mid-download the next revalidation picks it up
+        if version is None:
+            version = await self._version_fetcher()
+        table = await self._loader(version)
+        logger.info(f"Loaded energy usage dataset version {version} ({table.num_rows} rows)")
+        return await asyncio.to_thread(self._build_snapshot, table, version)
+
+    def _build_snapshot(self, table: pa.Table, version: str) -> EnergyUsageSnapshot:
+        snapshot = EnergyUsageSnapshot(table=table, version=version, loaded_at=time.time())
+
+        for hook in self._load_hooks:
+            try:
+                hook(snapshot)
+            except Exception as ex:
+                logger.error(f"Error in energy usage load hook {getattr(hook, '__name__', hook)}: {ex}")
+        return snapshot
+
+    async def _refresh(self):
+        try:
+            self.revalidations += 1
+            generation = self._generation
+            current = self._snapshot
+            version = await self._version_fetcher()
+
+            if current is None or version != current.version:
+                table = await self._updater(current, version) if current is not None and self._updater else None
+                if table is not None:
+                    snapshot = await asyncio.to_thread(self._build_snapshot, table, version)
+                    self.updates += 1
+                else:
+                    snapshot = await self._load(version)
+                    self.reloads += 1
+                if generation == self._generation:
+                    self._snapshot = snapshot
+        except Exception as ex:
+            self.errors += 1
+            logger.error(f"Error refreshing energy usage cache: {ex}")
+        finally:
+            self._last_checked = 0.0 if self._refresh_requested else time.monotonic()
+            self._refresh_requested = False
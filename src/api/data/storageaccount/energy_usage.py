@@ -1,19 +1,579 @@
-from .init import abfs, storage_account_container
+from . import init
+from .cache import DatasetCache, EnergyUsageSnapshot
+from .shared_snapshot import SharedSnapshot
+from .pagination import paginate, timestamp_index, decode_cursor, encode_offset_cursor, decode_offset_cursor
+from .partitioning import PARTITION_KEYS, parse_partition, partition_prefixes, partition_matches, split_partitions, partition_of
 from model.records_model import DataCenterEnergyRecord
-import pandas as pd
+from telemetry.timing import stage, count_rows, STORAGE_BYTES_READ, SCAN_FILE_BYTES
+from model.filter_model import EnergyUsageFilter
+from concurrent.futures import ThreadPoolExecutor
+from os import environ
+from typing import TYPE_CHECKING, AsyncIterator, Iterable, Optional, Union
+from uuid import uuid4
+import asyncio
+import fcntl
+import hashlib
+import logging
+import os
+import tempfile
+import orjson
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 import numpy as np
 
+if TYPE_CHECKING:
+    # Imported on first use, pyarrow.dataset also loads pandas and is a large share of the startup time
+    import pyarrow.dataset as ds
 
-def get_all_data_center_energy() -> list[DataCenterEnergyRecord]:
-    """Read energy usage data from Azure Blob Storage and return as list of DataCenterEnergyRecord models."""
+logger = logging.getLogger(__name__)
 
-    full_blob_path = f"{storage_account_container}/usage.parquet"
+ENERGY_USAGE_COLUMNS = list(DataCenterEnergyRecord.model_fields)
 
-    with abfs.open(full_blob_path, 'rb') as f:
-        df = pd.read_parquet(f, engine="pyarrow")
+ENERGY_USAGE_SCHEMA = pa.schema([
+    ("timestamp", pa.timestamp("ns")),
+    ("data_center_id", pa.string()),
+    ("zone", pa.string()),
+    ("power_draw_kw", pa.float64()),
+    ("it_load_kw", pa.float64()),
+    ("cooling_load_kw", pa.float64()),
+    ("pue", pa.float64()),
+    ("temperature_c", pa.float64()),
+    ("humidity_percent", pa.float64()),
+    ("ups_load_percent", pa.float64()),
+    ("battery_backup_status", pa.string()),
+    ("grid_energy_source", pa.string()),
+    ("co2_emissions_kg", pa.float64()),
+    ("alarm_status", pa.string()),
+    ("operator_notes", pa.string()),
+])
+
+# Uncached reads scan a pyarrow dataset over the pruned files instead of the snapshot
+EnergyUsageSource = Union[EnergyUsageSnapshot, "ds.Dataset"]
+
+cache_enabled = environ.get("ENERGY_CACHE_ENABLED", "true").lower() == "true"
+
+# Cached snapshots are written once per host as Arrow IPC and memory-mapped by every worker
+shared_snapshot = SharedSnapshot(
+    environ.get("ENERGY_SNAPSHOT_DIR", f"{tempfile.gettempdir()}/energy-usage-snapshots"),
+    keep=int(environ.get("ENERGY_SNAPSHOT_KEEP", 2)),
+) if environ.get("ENERGY_SHARED_SNAPSHOT", "true").lower() == "true" else None
+
+# Legacy single file, read when the partitioned dataset does not exist
+USAGE_BLOB_NAME = "usage.parquet"
+# Version of empty storage, neither the partitioned dataset nor the legacy file exists yet
+EMPTY_VERSION = "empty"
+# Partitioned dataset directory: usage/zone=<zone>/date=<yyyy-mm-dd>/*.parquet
+USAGE_DATASET_DIR = environ.get("ENERGY_USAGE_DATASET_DIR", "usage")
+partition_prune_max_days = int(environ.get("ENERGY_PARTITION_PRUNE_MAX_DAYS", 31))
+compaction_small_file_bytes = int(environ.get("ENERGY_COMPACTION_SMALL_FILE_BYTES", 64 * 1024 * 1024))
+compaction_workers = int(environ.get("ENERGY_COMPACTION_WORKERS", 8))
+
+# Schema metadata of a loaded table listing the files it was read from, {name: etag}
+FILES_METADATA_KEY = b"energy_usage_files"
+
+
+def _usage_blob_path() -> str:
+    return f"{init.storage_account_container}/{USAGE_BLOB_NAME}"
+
+
+def _dataset_root() -> str:
+    return f"{init.storage_account_container}/{USAGE_DATASET_DIR}"
+
+
+async def _list_dataset_files(filters: Optional[EnergyUsageFilter] = None) -> Optional[list[dict]]:
+    """
+    List the partitioned dataset files that can hold records matching `filters`.
+
+    Only the partitions selected by the filters are listed, each prefix concurrently. Returns
+    None when there is no partitioned dataset and the legacy single file should be read.
+    """
+    root = USAGE_DATASET_DIR + "/"
+    prefixes = partition_prefixes(filters, partition_prune_max_days)
+    with stage("storage_list"):
+        listings = await asyncio.gather(*(init.async_storage.list_blobs(init.storage_account_container, root + prefix) for prefix in prefixes))
+
+        files = [blob for listing in listings for blob in listing
+                 if blob["name"].endswith(".parquet") and partition_matches(blob["name"], filters)]
+        if not files and not await init.async_storage.has_blobs(init.storage_account_container, root):
+            return None
+    return sorted(files, key=lambda blob: blob["name"])
+
+
+def _parse_usage_table(source: pa.NativeFile) -> pa.Table:
+    with stage("parquet_decode"):
+        return pq.read_table(source).select(ENERGY_USAGE_COLUMNS).cast(ENERGY_USAGE_SCHEMA).sort_by("timestamp")
+
+
+def _parse_dataset_files(names: list[str], sources: list[pa.NativeFile]) -> pa.Table:
+    if not names:
+        return ENERGY_USAGE_SCHEMA.empty_table()
+
+    with stage("parquet_decode"):
+        tables = []
+        for name, source in zip(names, sources):
+            table = pq.read_table(source)
+            # The zone lives in the partition path, not in the file
+            table = table.append_column("zone", pa.repeat(pa.scalar(parse_partition(name)["zone"]), table.num_rows))
+            tables.append(table.select(ENERGY_USAGE_COLUMNS).cast(ENERGY_USAGE_SCHEMA))
+        return pa.concat_tables(tables).sort_by("timestamp")
+
+
+async def _read_usage_table() -> pa.Table:
+    """Download the dataset asynchronously and parse it, off the event loop, into an Arrow table sorted by timestamp."""
+    files = await _list_dataset_files()
+    if files is None:
+        with stage("storage_fetch"):
+            try:
+                source = await init.async_storage.open_input(init.storage_account_container, USAGE_BLOB_NAME)
+            except FileNotFoundError:
+                # Nothing generated or ingested yet, an empty partitioned dataset merges the first ingest
+                return _with_files(ENERGY_USAGE_SCHEMA.empty_table(), [])
+        STORAGE_BYTES_READ.inc(source.size())
+        return await asyncio.to_thread(_parse_usage_table, source)
+
+    table = await _read_dataset_files([blob["name"] for blob in files])
+    return _with_files(table, files)
+
+
+async def _read_dataset_files(names: list[str]) -> pa.Table:
+    with stage("storage_fetch"):
+        sources = await asyncio.gather(*(init.async_storage.open_input(init.storage_account_container, name) for name in names))
+    STORAGE_BYTES_READ.inc(sum(source.size() for source in sources))
+    return await asyncio.to_thread(_parse_dataset_files, names, sources)
+
+
+def _with_files(table: pa.Table, files: list[dict]) -> pa.Table:
+    listing = {blob["name"]: str(blob["etag"]) for blob in files}
+    return table.replace_schema_metadata({FILES_METADATA_KEY: orjson.dumps(listing)})
+
+
+def _table_files(table: pa.Table) -> Optional[dict[str, str]]:
+    metadata = table.schema.metadata or {}
+    return orjson.loads(metadata[FILES_METADATA_KEY]) if FILES_METADATA_KEY in metadata else None
+
+
+def _merge_sorted(table: pa.Table, timestamps: np.ndarray, delta: pa.Table) -> pa.Table:
+    """Merge a timestamp-sorted delta into a timestamp-sorted table without re-sorting the table."""
+    merged = pa.concat_tables([table, delta.cast(table.schema)])
+    delta_timestamps = timestamp_index(delta)
+    if not len(timestamps) or not len(delta_timestamps) or delta_timestamps[0] >= timestamps[-1]:
+        # Appended telemetry is usually newer than everything loaded, the table's chunks are kept as they are
+        return merged
+
+    # Position of every delta row in the merged order, after existing rows with the same timestamp
+    positions = np.searchsorted(timestamps, delta_timestamps, "right") + np.arange(len(delta_timestamps))
+    from_delta = np.zeros(merged.num_rows, dtype=bool)
+    from_delta[positions] = True
+    order = np.empty(merged.num_rows, dtype=np.int64)
+    order[~from_delta] = np.arange(len(timestamps))
+    order[from_delta] = np.arange(len(timestamps), merged.num_rows)
+    return merged.take(order)
+
+
+async def _update_usage_table(snapshot: EnergyUsageSnapshot, version: str) -> Optional[pa.Table]:
+    """
+    Bring a cached table up to date by reading only the files added since it was loaded.
+
+    Returns None, for a full reload, when any file it was read from changed or disappeared
+    (an overwrite or a compaction) or when it was read from the legacy single file. The merged
+    table is shared between the workers of the host through the snapshot file of `version`.
+    """
+    known = _table_files(snapshot.table)
+    if known is None:
+        return None
+    files = await _list_dataset_files()
+    if files is None:
+        return None
+
+    current = {blob["name"]: str(blob["etag"]) for blob in files}
+    if any(current.get(name) != etag for name, etag in known.items()):
+        return None
+
+    async def merge() -> pa.Table:
+        added = sorted(name for name in current if name not in known)
+        delta = await _read_dataset_files(added)
+        with stage("merge"):
+            table = await asyncio.to_thread(_merge_sorted, snapshot.table, snapshot.timestamps, delta)
+        logger.info(f"Merged {delta.num_rows} energy usage records from {len(added)} new file(s) into version {version}")
+        return _with_files(table, files)
+
+    if shared_snapshot is None:
+        return await merge()
+    # Written to the shared snapshot like a full load, one worker merges and every worker maps the result
+    return await shared_snapshot.load(version, merge)
+
+
+async def _load_usage_table(version: str) -> pa.Table:
+    if shared_snapshot is None:
+        return await _read_usage_table()
+    return await shared_snapshot.load(version, _read_usage_table)
+
+
+async def _get_usage_version() -> str:
+    """Return the blob ETag, or a digest of every dataset file's ETag, used to detect dataset changes."""
+    files = await _list_dataset_files()
+    if files is None:
+        try:
+            return await init.async_storage.get_version(init.storage_account_container, USAGE_BLOB_NAME)
+        except FileNotFoundError:
+            return EMPTY_VERSION
+
+    listing = "\n".join(f"{blob['name']}:{blob['etag']}" for blob in files)
+    return hashlib.sha256(listing.encode()).hexdigest()
+
+
+async def _open_dataset(filters: Optional[EnergyUsageFilter]) -> "ds.Dataset":
+    """Dataset over the files that survive partition pruning, scanned directly from storage."""
+    import pyarrow.dataset as ds
+
+    files = await _list_dataset_files(filters)
+    if files is None:
+        if not await asyncio.to_thread(init.fs.exists, _usage_blob_path()):
+            return ds.dataset(ENERGY_USAGE_SCHEMA.empty_table())
+        return ds.dataset(_usage_blob_path(), filesystem=init.arrow_fs, format="parquet", schema=ENERGY_USAGE_SCHEMA)
+    if not files:
+        return ds.dataset(ENERGY_USAGE_SCHEMA.empty_table())
+
+    SCAN_FILE_BYTES.inc(sum(blob["size"] for blob in files))
+    paths = [f"{init.storage_account_container}/{blob['name']}" for blob in files]
+    return ds.dataset(paths, filesystem=init.arrow_fs, format="parquet", partitioning=ds.partitioning(pa.schema([(key, pa.string()) for key in PARTITION_KEYS]), flavor="hive"), partition_base_dir=_dataset_root())
+
+
+energy_usage_cache = DatasetCache(
+    loader=_load_usage_table,
+    version_fetcher=_get_usage_version,
+    revalidate_seconds=float(environ.get("ENERGY_CACHE_REVALIDATE_SECONDS", 30)),
+    updater=_update_usage_table,
+)
+
+
+async def get_energy_usage_snapshot() -> EnergyUsageSnapshot:
+    """Return the cached energy usage table, revalidating against storage in the background."""
+    return await energy_usage_cache.get()
+
+
+async def get_energy_usage_version() -> str:
+    """Version of the data being served: the cached snapshot's when caching, the one in storage otherwise."""
+    if cache_enabled:
+        return (await get_energy_usage_snapshot()).version
+    return await _get_usage_version()
+
+
+async def _current_source(filters: Optional[EnergyUsageFilter]) -> EnergyUsageSource:
+    return await get_energy_usage_snapshot() if cache_enabled else await _open_dataset(filters)
+
+
+def build_filter_expression(filters: Optional[EnergyUsageFilter], include_time_range: bool = True) -> Optional[pc.Expression]:
+    """Translate request filters into a pyarrow expression usable for row-group pruning."""
+    if filters is None:
+        return None
+
+    conditions = []
+    if filters.alarm_status:
+        conditions.append(pc.field("alarm_status") == filters.alarm_status)
+    if filters.zone:
+        conditions.append(pc.field("zone") == filters.zone)
+    if filters.data_center_id:
+        conditions.append(pc.field("data_center_id") == filters.data_center_id)
+    if filters.start and include_time_range:
+        conditions.append(pc.field("timestamp") >= pa.scalar(filters.start, type=pa.timestamp("ns")))
+    if filters.end and include_time_range:
+        conditions.append(pc.field("timestamp") < pa.scalar(filters.end, type=pa.timestamp("ns")))
+
+    if not conditions:
+        return None
+
+    expression = conditions[0]
+    for condition in conditions[1:]:
+        expression = expression & condition
+    return expression
+
+
+def validate_columns(columns: Optional[list[str]]) -> Optional[list[str]]:
+    """Raise ValueError for unknown column names, return the projection in schema order."""
+    if not columns:
+        return None
+
+    unknown = set(columns) - set(ENERGY_USAGE_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(sorted(unknown))}")
+    return [column for column in ENERGY_USAGE_COLUMNS if column in columns]
+
+
+def scan_energy_usage(source: EnergyUsageSource, filters: Optional[EnergyUsageFilter] = None,
+                      columns: Optional[list[str]] = None) -> pa.Table:
+    """
+    Scan energy usage data with the filters and column projection pushed into the scan.
+
+    With a cached snapshot the scan runs over the in-memory table, otherwise the parquet
+    files left after partition pruning are scanned directly and row groups are skipped using
+    their column statistics.
+    """
+    import pyarrow.dataset as ds
+
+    columns = validate_columns(columns) or ENERGY_USAGE_COLUMNS
+
+    with stage("filter"):
+        if isinstance(source, EnergyUsageSnapshot):
+            count_rows("scan", scanned=source.table.num_rows)
+            source = ds.dataset(source.table)
+
+        table = source.to_table(columns=columns, filter=build_filter_expression(filters))
+    count_rows("scan", matched=table.num_rows)
+    return table
+
+
+def _get_sorted_page(source: EnergyUsageSource, filters: EnergyUsageFilter, columns: Optional[list[str]], limit: Optional[int],
+                     cursor: Optional[str], sort_by: str, descending: bool) -> tuple[pa.Table, Optional[str]]:
+    """Page through the filtered records ordered by `sort_by`, ties broken by timestamp."""
+    scan_columns = None if columns is None else list(dict.fromkeys(columns + [sort_by, "timestamp"]))
+    table = scan_energy_usage(source, filters, scan_columns)
+
+    order = "descending" if descending else "ascending"
+    with stage("sort"):
+        indices = pc.sort_indices(table, sort_keys=[(sort_by, order), ("timestamp", order)])
+
+    offset = decode_offset_cursor(cursor) if cursor else 0
+    end = min(offset + limit, table.num_rows) if limit is not None else table.num_rows
+    page = table.take(indices[offset:end]) if offset < end else table.slice(0, 0)
+
+    next_cursor = encode_offset_cursor(end) if limit is not None and end < table.num_rows else None
+    return page, next_cursor
+
+
+def page_energy_usage(source: EnergyUsageSource, filters: Optional[EnergyUsageFilter] = None,
+                      columns: Optional[list[str]] = None, limit: Optional[int] = None, cursor: Optional[str] = None,
+                      sort_by: Optional[str] = None, descending: bool = False) -> tuple[pa.Table, Optional[str]]:
+    """
+    Return energy usage records ordered by timestamp, one page at a time.
+
+    With a cached snapshot the time window and cursor are located by binary search over the
+    snapshot's sorted timestamp index and only that window is filtered. Without the cache the
+    filtered scan result is sorted and paged in memory. Any other ordering sorts the filtered
+    records and pages by offset.
+    """
+    filters = filters or EnergyUsageFilter()
+    columns = validate_columns(columns)
+
+    if (sort_by and sort_by != "timestamp") or descending:
+        sort_by = validate_columns([sort_by or "timestamp"])[0]
+        page, next_cursor = _get_sorted_page(source, filters, columns, limit, cursor, sort_by, descending)
+        count_rows("page", returned=page.num_rows)
+        return (page if columns is None else page.select(columns)), next_cursor
+    # The timestamp column is needed to build the next cursor
+    scan_columns = columns if columns is None or "timestamp" in columns else ["timestamp"] + columns
+
+    if isinstance(source, EnergyUsageSnapshot):
+        with stage("filter"):
+            page, next_cursor = paginate(source.table, source.timestamps, build_filter_expression(filters, include_time_range=False),
+                                         filters.start, filters.end, limit, cursor)
+    else:
+        scan_filters = filters
+        if cursor:
+            import pandas as pd
+
+            cursor_start = pd.Timestamp(decode_cursor(cursor)[0]).to_pydatetime(warn=False)
+            scan_filters = filters.model_copy(update={"start": max(filters.start, cursor_start) if filters.start else cursor_start})
+        table = scan_energy_usage(source, scan_filters, scan_columns)
+        with stage("sort"):
+            table = table.sort_by("timestamp")
+        page, next_cursor = paginate(table, timestamp_index(table), None, None, None, limit, cursor)
+
+    count_rows("page", returned=page.num_rows)
+    if columns is not None:
+        page = page.select(columns)
+    return page, next_cursor
+
+
+async def get_energy_usage_table(filters: Optional[EnergyUsageFilter] = None, columns: Optional[list[str]] = None) -> pa.Table:
+    """Await the cached snapshot or the pruned file listing, then run the scan in a worker thread."""
+    source = await _current_source(filters)
+    return await asyncio.to_thread(scan_energy_usage, source, filters, columns)
+
+
+async def get_energy_usage_page(filters: Optional[EnergyUsageFilter] = None, columns: Optional[list[str]] = None,
+                                limit: Optional[int] = None, cursor: Optional[str] = None,
+                                sort_by: Optional[str] = None, descending: bool = False) -> tuple[pa.Table, Optional[str]]:
+    """Await the cached snapshot or the pruned file listing, then page through it in a worker thread."""
+    source = await _current_source(filters)
+    return await asyncio.to_thread(page_energy_usage, source, filters, columns, limit, cursor, sort_by, descending)
+
+
+async def iter_energy_usage_pages(filters: Optional[EnergyUsageFilter] = None, columns: Optional[list[str]] = None,
+                                  page_size: int = 5000) -> AsyncIterator[pa.Table]:
+    """Yield all matching records in timestamp order, at most `page_size` rows at a time."""
+    if not cache_enabled:
+        # Scan once rather than once per page
+        table, _ = await get_energy_usage_page(filters, columns)
+        if table.num_rows == 0:
+            yield table
+        for offset in range(0, table.num_rows, page_size):
+            yield table.slice(offset, page_size)
+        return
+
+    cursor = None
+    while True:
+        page, cursor = await get_energy_usage_page(filters, columns, page_size, cursor)
+        yield page
+        if not cursor:
+            break
+
+
+async def get_all_data_center_energy() -> list[DataCenterEnergyRecord]:
+    """Read energy usage data from the configured storage backend and return as list of DataCenterEnergyRecord models."""
+
+    df = (await get_energy_usage_table()).to_pandas()
 
     # Convert each row to a DataCenterEnergyRecord
     records = [DataCenterEnergyRecord(**row) for row in df.to_dict(orient="records")]
 
     return records
-  
+
+
+def _dataset_files() -> list[dict]:
+    root = _dataset_root()
+    if not init.fs.exists(root):
+        return []
+    return [info for path, info in init.fs.find(root, detail=True).items() if path.endswith(".parquet")]
+
+
+def write_energy_usage(tables: Iterable[pa.Table], overwrite: bool = True,
+                       row_group_size: int = 1_000_000, compression: str = "zstd") -> int:
+    """
+    Stream tables into the partitioned dataset and return the number of rows written.
+
+    Each table is split by zone and date and appended to one open file per partition. Files of
+    days earlier than the current table are closed as soon as it arrives, so memory stays
+    bounded for timestamp ordered input. Existing dataset files, and the legacy single file, are
+    only removed once every new file is committed. Raises FileExistsError when data exists and
+    `overwrite` is False.
+    """
+    previous = _dataset_files()
+    legacy = init.fs.exists(_usage_blob_path())
+    if not overwrite and (previous or legacy):
+        raise FileExistsError(f"{USAGE_DATASET_DIR} already exists, set overwrite to replace it")
+
+    run = uuid4().hex[:12]
+    writers: dict[str, tuple] = {}
+    written: list[str] = []
+    rows = 0
+
+    def close(partition: str):
+        f, writer = writers.pop(partition)
+        writer.close()
+        f.close()
+
+    try:
+        for table in tables:
+            first_day = pc.min(table["timestamp"]).cast(pa.date32()).as_py().isoformat() if table.num_rows else ""
+            for partition in [partition for partition in writers if parse_partition(partition)["date"] < first_day]:
+                close(partition)
+
+            for partition, part in split_partitions(table):
+                if partition not in writers:
+                    init.fs.makedirs(f"{_dataset_root()}/{partition}", exist_ok=True)
+                    path = f"{_dataset_root()}/{partition}/part-{run}-{len(written):05d}.parquet"
+                    f = init.fs.open(path, "wb")
+                    writers[partition] = f, pq.ParquetWriter(f, part.schema, compression=compression)
+                    written.append(path)
+                writers[partition][1].write_table(part, row_group_size=row_group_size)
+            rows += table.num_rows
+
+        for partition in list(writers):
+            close(partition)
+    except Exception:
+        for partition in list(writers):
+            close(partition)
+        if written:
+            init.fs.rm(written)
+        raise
+
+    if previous:
+        init.fs.rm([info["name"] for info in previous])
+    if legacy:
+        # Readers ignore it once partitions exist, removed so it cannot resurface as the dataset
+        init.fs.rm(_usage_blob_path())
+
+    energy_usage_cache.invalidate()
+    logger.info(f"Wrote {rows} energy usage records to {len(written)} file(s) under {USAGE_DATASET_DIR}")
+    return rows
+
+
+def append_energy_usage(table: pa.Table, compression: str = "zstd") -> dict:
+    """
+    Add a validated batch to the dataset as delta files, one per zone/date partition.
+
+    Existing files are left untouched, so cached copies merge just the new files on their next
+    revalidation. Returns counts of what was written.
+    """
+    if not init.fs.exists(_dataset_root()) and init.fs.exists(_usage_blob_path()):
+        raise ValueError(f"Appending needs the partitioned dataset, {USAGE_BLOB_NAME} can only be replaced through /usage/init")
+
+    run = uuid4().hex[:12]
+    written: list[str] = []
+    try:
+        for partition, part in split_partitions(table):
+            init.fs.makedirs(f"{_dataset_root()}/{partition}", exist_ok=True)
+            path = f"{_dataset_root()}/{partition}/delta-{run}-{len(written):05d}.parquet"
+            with init.fs.open(path, "wb") as f:
+                pq.write_table(part.sort_by("timestamp"), f, compression=compression)
+            written.append(path)
+    except Exception:
+        if written:
+            init.fs.rm(written)
+        raise
+
+    logger.info(f"Appended {table.num_rows} energy usage records in {len(written)} delta file(s)")
+    return {"rows": table.num_rows, "files_written": len(written)}
+
+
+def _compact_partition(partition: str, files: list[dict], compression: str) -> int:
+    tables = []
+    for info in files:
+        with init.fs.open(info["name"], "rb") as f:
+            tables.append(pq.read_table(f))
+    table = pa.concat_tables(tables).sort_by("timestamp")
+
+    path = f"{_dataset_root()}/{partition}/part-{uuid4().hex[:12]}-compacted.parquet"
+    with init.fs.open(path, "wb") as f:
+        pq.write_table(table, f, compression=compression)
+
+    # The merged file is committed before the originals are removed, readers may briefly see both
+    init.fs.rm([info["name"] for info in files])
+    return table.num_rows
+
+
+def compact_energy_usage(small_file_bytes: Optional[int] = None, compression: str = "zstd") -> dict:
+    """
+    Merge the small files of every partition into one file per partition.
+
+    Partitions with at least two files below `small_file_bytes` are rewritten, sorted by
+    timestamp, in parallel across partitions, folding appended delta files into their partition.
+    Skipped when another worker of the host is already compacting. Returns counts of the work done.
+    """
+    small_file_bytes = small_file_bytes or compaction_small_file_bytes
+
+    # Two workers compacting the same partition would both rewrite it and duplicate its rows
+    with open(os.path.join(tempfile.gettempdir(), "energy-usage-compaction.lock"), "a") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            logger.info("Energy usage compaction already running on this host, skipped")
+            return {"partitions": 0, "files_merged": 0, "files_written": 0, "rows": 0}
+        return _compact(small_file_bytes, compression)
+
+
+def _compact(small_file_bytes: int, compression: str) -> dict:
+    partitions: dict[str, list[dict]] = {}
+    for info in _dataset_files():
+        if info["size"] < small_file_bytes:
+            partitions.setdefault(partition_of(info["name"], _dataset_root()), []).append(info)
+    partitions = {partition: files for partition, files in partitions.items() if len(files) > 1}
+
+    with ThreadPoolExecutor(max_workers=compaction_workers) as executor:
+        rows = sum(executor.map(lambda item: _compact_partition(item[0], item[1], compression), partitions.items()))
+
+    files_merged = sum(len(files) for files in partitions.values())
+    logger.info(f"Compacted {files_merged} energy usage file(s) in {len(partitions)} partition(s)")
+    return {"partitions": len(partitions), "files_merged": files_merged, "files_written": len(partitions), "rows": rows}
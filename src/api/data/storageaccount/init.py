@@ -1,25 +1,110 @@
+import asyncio
 from os import environ
 from dotenv import load_dotenv
-from azure.identity import DefaultAzureCredential
-from adlfs import AzureBlobFileSystem
+import fsspec
+from .async_storage import AzureBlobAsyncStorage, FsspecAsyncStorage
 
 load_dotenv(override=True)
 
-abfs :AzureBlobFileSystem | None = None
+AZURE_PROTOCOLS = ("abfs", "az")
+LOCAL_PROTOCOLS = (None, "file", "local")
+
+fs :fsspec.AbstractFileSystem | None = None
+# Filesystem handed to pyarrow dataset scans, native and memory-mapped for local disks
+arrow_fs :"pyarrow.fs.FileSystem | fsspec.AbstractFileSystem | None" = None
+storage_protocol :str | None = None
 storage_account_container:str |None=None
+async_storage :AzureBlobAsyncStorage | FsspecAsyncStorage | None = None
+# One credential per flavour for the whole process, so tokens are fetched and refreshed once
+credential :"azure.identity.DefaultAzureCredential | None" = None
+async_credential :"azure.identity.aio.DefaultAzureCredential | None" = None
 
-def storage_init():
 
-    credential = DefaultAzureCredential()
+def storage_url() -> str:
+    """
+    Location of the energy usage data, e.g. file:///srv/energy, memory://energy or abfs://data.
+
+    Defaults to the AZURE_STORAGE_CONTAINER container of the AZURE_STORAGE_ACCOUNT account.
+    """
+    return environ.get("ENERGY_STORAGE_URL") or f"abfs://{environ.get('AZURE_STORAGE_CONTAINER')}"
+
+
+def get_credential():
+    """Sync credential shared by the fsspec/adlfs clients, created on first use."""
+    global credential
+
+    if credential is None:
+        from azure.identity import DefaultAzureCredential
+
+        credential = DefaultAzureCredential()
+    return credential
+
+
+def get_async_credential():
+    """
+    Async credential shared by the async blob clients, created on first use. Bound to the event loop
+    that first uses it, so it is closed and dropped by `storage_shutdown`.
+    """
+    global async_credential
+
+    if async_credential is None:
+        from azure.identity.aio import DefaultAzureCredential
 
-    AZURE_STORAGE_URL = environ.get("AZURE_STORAGE_ACCOUNT")
-    AZURE_STORAGE_CONTAINER = environ.get("AZURE_STORAGE_CONTAINER")
-    global abfs
+        async_credential = DefaultAzureCredential()
+    return async_credential
+
+
+def storage_init():
+    """
+    Create the filesystem clients for `storage_url()`. Called from the application lifespan, not on
+    import, so importing the app stays cheap and configuration errors surface as a failed warm-up.
+    """
+    global fs
+    global arrow_fs
+    global storage_protocol
     global storage_account_container
 
+    storage_protocol, path = fsspec.core.split_protocol(storage_url())
+
+    if storage_protocol in AZURE_PROTOCOLS:
+        # Imported here, the Azure SDK is only needed when the data lives in a storage account
+        from adlfs import AzureBlobFileSystem
+
+        AZURE_STORAGE_URL = environ.get("AZURE_STORAGE_ACCOUNT")
+
+        storage_account_container = path.strip("/")
+        fs = AzureBlobFileSystem(AZURE_STORAGE_URL, credential=get_credential())
+        arrow_fs = fs
+    else:
+        import pyarrow.fs
+
+        fs, storage_account_container = fsspec.core.url_to_fs(storage_url())
+        arrow_fs = pyarrow.fs.LocalFileSystem(use_mmap=True) if storage_protocol in LOCAL_PROTOCOLS else fs
+
+
+async def storage_startup():
+    """Create the storage clients and open the async client shared by the worker, called from the application lifespan."""
+    global async_storage
+
+    await asyncio.to_thread(storage_init)
+    if storage_protocol in AZURE_PROTOCOLS:
+        async_storage = AzureBlobAsyncStorage(
+            environ.get("AZURE_STORAGE_ACCOUNT"),
+            get_async_credential(),
+            max_connections=int(environ.get("ENERGY_STORAGE_MAX_CONNECTIONS", 32)),
+        )
+    else:
+        async_storage = FsspecAsyncStorage(fs)
+    await async_storage.open()
 
-    storage_account_container = AZURE_STORAGE_CONTAINER
-    abfs  =  AzureBlobFileSystem(AZURE_STORAGE_URL, credential=credential)
 
+async def storage_shutdown():
+    global async_storage
+    global async_credential
 
-storage_init()
\ No newline at end of file
+    if async_storage is not None:
+        await async_storage.close()
+        async_storage = None
+    if async_credential is not None:
+        await async_credential.close()
+        async_credential = None
@@ -0,0 +1,113 @@
+import base64
+import json
+from datetime import datetime
+from typing import Optional
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from telemetry.timing import count_rows
+
+
+def to_epoch_ns(value: datetime) -> int:
+    return int(np.datetime64(value, "ns").astype(np.int64))
+
+
+def timestamp_index(table: pa.Table) -> np.ndarray:
+    """Return the timestamp column of a timestamp-sorted table as int64 nanoseconds."""
+    if table.num_rows == 0:
+        return np.empty(0, dtype=np.int64)
+    return table["timestamp"].cast(pa.timestamp("ns")).to_numpy().view(np.int64)
+
+
+def encode_cursor(timestamp_ns: int, skip: int) -> str:
+    payload = json.dumps({"t": timestamp_ns, "k": skip}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[int, int]:
+    """Return (timestamp_ns, rows already returned at that timestamp). Raises ValueError for malformed cursors."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return int(payload["t"]), int(payload["k"])
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def encode_offset_cursor(offset: int) -> str:
+    payload = json.dumps({"o": offset}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode("ascii").rstrip("=")
+
+
+def decode_offset_cursor(cursor: str) -> int:
+    """Return the row offset of a cursor issued for non-timestamp orderings."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        offset = int(json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))["o"])
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if offset < 0:
+        raise ValueError("Invalid cursor")
+    return offset
+
+
+def paginate(table: pa.Table, timestamps: np.ndarray, expression: Optional[pc.Expression] = None,
+             start: Optional[datetime] = None, end: Optional[datetime] = None,
+             limit: Optional[int] = None, cursor: Optional[str] = None) -> tuple[pa.Table, Optional[str]]:
+    """
+    Return one page of a timestamp-sorted table and the cursor for the next page.
+
+    The [start, end) window and the cursor position are located with a binary search over
+    `timestamps`. Any remaining `expression` is applied chunk by chunk from there until the page
+    is full, so only the scanned window is touched. A cursor identifies the last returned
+    timestamp and how many matching rows at that timestamp were already returned, which keeps
+    ordering stable for ties.
+    """
+    lo = int(np.searchsorted(timestamps, to_epoch_ns(start), "left")) if start else 0
+    hi = int(np.searchsorted(timestamps, to_epoch_ns(end), "left")) if end else len(timestamps)
+
+    cursor_ts, skip = None, 0
+    if cursor:
+        cursor_ts, skip = decode_cursor(cursor)
+        lo = max(lo, int(np.searchsorted(timestamps, cursor_ts, "left")))
+
+    remaining = limit if limit is not None else max(hi - lo, 0)
+    chunk_size = max((limit or 0) * 2, 8192)
+    pieces = []
+    position = lo
+
+    while position < hi and remaining > 0:
+        chunk_end = min(hi, position + chunk_size)
+        window = table.slice(position, chunk_end - position)
+        position = chunk_end
+
+        if expression is not None:
+            window = window.filter(expression)
+
+        if skip:
+            # Drop matching rows at the cursor timestamp that earlier pages already returned
+            window_ts = timestamp_index(window)
+            at_cursor = int(np.searchsorted(window_ts, cursor_ts, "right"))
+            dropped = min(skip, at_cursor)
+            window = window.slice(dropped)
+            skip = skip - dropped if at_cursor == len(window_ts) else 0
+
+        page = window.slice(0, remaining)
+        if page.num_rows:
+            pieces.append(page)
+            remaining -= page.num_rows
+
+    result = pa.concat_tables(pieces) if pieces else table.slice(0, 0)
+    count_rows("page", scanned=position - lo)
+
+    next_cursor = None
+    if limit is not None and remaining == 0 and result.num_rows:
+        result_ts = timestamp_index(result)
+        last_ts = int(result_ts[-1])
+        returned_at_last = len(result_ts) - int(np.searchsorted(result_ts, last_ts, "left"))
+        if cursor_ts == last_ts and returned_at_last == len(result_ts):
+            # The whole page sits on the cursor timestamp, carry over the earlier count
+            returned_at_last += decode_cursor(cursor)[1]
+        next_cursor = encode_cursor(last_ts, returned_at_last)
+
+    return result, next_cursor
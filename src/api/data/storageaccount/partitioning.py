@@ -0,0 +1,93 @@
+from datetime import date, timedelta
+from typing import Iterator, Optional, get_args
+import posixpath
+import pyarrow as pa
+import pyarrow.compute as pc
+from model.records_model import DataCenterEnergyRecord
+from model.filter_model import EnergyUsageFilter
+
+# Hive layout: <dataset>/zone=<zone>/date=<yyyy-mm-dd>/<file>.parquet, zone is not stored in the files
+PARTITION_KEYS = ("zone", "date")
+ZONES = list(get_args(DataCenterEnergyRecord.model_fields["zone"].annotation))
+
+
+def partition_dir(zone: str, day: str) -> str:
+    return f"zone={zone}/date={day}"
+
+
+def parse_partition(path: str) -> dict[str, str]:
+    """Return the hive key=value pairs found in a file path."""
+    values = {}
+    for segment in path.split("/"):
+        key, sep, value = segment.partition("=")
+        if sep and key in PARTITION_KEYS:
+            values[key] = value
+    return values
+
+
+def _date_range(filters: EnergyUsageFilter) -> tuple[Optional[date], Optional[date]]:
+    first = filters.start.date() if filters.start else None
+    # The window is half-open, a midnight end excludes that day
+    last = (filters.end - timedelta(microseconds=1)).date() if filters.end else None
+    return first, last
+
+
+def partition_prefixes(filters: Optional[EnergyUsageFilter], max_days: int = 31) -> list[str]:
+    """
+    Directory prefixes, relative to the dataset root, that can hold records matching `filters`.
+
+    A zone filter narrows the listing to that zone. A bounded time window of at most `max_days`
+    days is expanded to one prefix per day, wider windows are pruned by `partition_matches`
+    after listing.
+    """
+    zones = [filters.zone] if filters and filters.zone else None
+    first, last = _date_range(filters) if filters else (None, None)
+
+    if first and last and (last - first).days < max_days:
+        days = [(first + timedelta(days=offset)).isoformat() for offset in range((last - first).days + 1)]
+        return [partition_dir(zone, day) + "/" for zone in zones or ZONES for day in days]
+    if zones:
+        return [f"zone={zone}/" for zone in zones]
+    return [""]
+
+
+def partition_matches(path: str, filters: Optional[EnergyUsageFilter]) -> bool:
+    """False when the partition a file belongs to cannot hold records matching `filters`."""
+    if filters is None:
+        return True
+
+    values = parse_partition(path)
+    if filters.zone and values.get("zone", filters.zone) != filters.zone:
+        return False
+
+    day = values.get("date")
+    first, last = _date_range(filters)
+    if day and first and day < first.isoformat():
+        return False
+    if day and last and day > last.isoformat():
+        return False
+    return True
+
+
+def split_partitions(table: pa.Table) -> Iterator[tuple[str, pa.Table]]:
+    """Split a table by (zone, date), yielding the partition directory and its rows without the zone column."""
+    if table.num_rows == 0:
+        return
+
+    days = table["timestamp"].cast(pa.date32()).cast(pa.string())
+    keys = pc.binary_join_element_wise(table["zone"], days, "/")
+    # Stable sort, rows keep their order within a partition
+    order = pc.sort_indices(keys)
+    runs = pc.run_end_encode(keys.take(order).combine_chunks())
+    table = table.take(order).drop_columns(["zone"])
+
+    start = 0
+    for key, end in zip(runs.values.to_pylist(), runs.run_ends.to_pylist()):
+        zone, day = key.split("/")
+        yield partition_dir(zone, day), table.slice(start, end - start)
+        start = end
+
+
+def partition_of(path: str, root: str) -> str:
+    """Partition directory of a data file, relative to the dataset root."""
+    return posixpath.relpath(posixpath.dirname(path), root)
@@ -0,0 +1,124 @@
+import asyncio
+import fcntl
+import glob
+import hashlib
+import logging
+import os
+from typing import Awaitable, Callable, Optional, TextIO
+
+import pyarrow as pa
+
+from telemetry.timing import stage
+
+logger = logging.getLogger(__name__)
+
+
+class SharedSnapshot:
+    """
+    Arrow IPC copy of the dataset on local disk, shared by every worker process of a host.
+
+    Files are named after the dataset version. The first worker to need a version downloads it and
+    writes the file under an exclusive lock, the others wait for it and memory-map the result, so the
+    pages are held once in the page cache however many workers there are. Files are written to a
+    temporary name and renamed into place, a file under its final name is always complete. Superseded
+    versions are unlinked, workers still mapping them keep reading until they switch over.
+    """
+
+    def __init__(self, directory: str, keep: int = 2):
+        self.directory = directory
+        self.keep = keep
+
+    def path(self, version: str, name: Optional[str] = None) -> str:
+        key = hashlib.sha256(version.encode()).hexdigest()[:32]
+        return os.path.join(self.directory, f"{key}.{name}.arrow" if name else f"{key}.arrow")
+
+    async def load(self, version: str, loader: Callable[[], Awaitable[pa.Table]]) -> pa.Table:
+        """Memory-map the snapshot of `version`, writing it from `loader()` first if no worker has yet."""
+        path = self.path(version)
+        table = await asyncio.to_thread(self._open, path)
+        if table is not None:
+            return table
+
+        lock = await asyncio.to_thread(self._lock, path)
+        try:
+            # Another worker may have written it while we waited for the lock
+            table = await asyncio.to_thread(self._open, path)
+            if table is not None:
+                return table
+
+            table = await loader()
+            try:
+                await asyncio.to_thread(self._write, path, table)
+                await asyncio.to_thread(self._prune, path)
+            except OSError as ex:
+                logger.error(f"Could not write shared energy usage snapshot {path}, serving from memory: {ex}")
+                return table
+        finally:
+            lock.close()
+
+        # Serve the mapped copy too, the downloaded table is released
+        logger.info(f"Wrote shared energy usage snapshot {path} for version {version}")
+        return await asyncio.to_thread(self._open, path)
+
+    def derived(self, version: str, name: str, compute: Callable[[], pa.Table]) -> pa.Table:
+        """
+        Result derived from the snapshot of `version` (e.g. a rollup), computed by one worker and
+        read by the others. Blocking, meant for load hooks running in a worker thread.
+        """
+        path = self.path(version, name)
+        table = self._open(path)
+        if table is not None:
+            return table
+
+        lock = self._lock(path)
+        try:
+            table = self._open(path)
+            if table is not None:
+                return table
+            table = compute()
+            try:
+                self._write(path, table)
+            except OSError as ex:
+                logger.error(f"Could not write shared energy usage result {path}: {ex}")
+            return table
+        finally:
+            lock.close()
+
+    @staticmethod
+    def _open(path: str) -> Optional[pa.Table]:
+        try:
+            source = pa.memory_map(path, "r")
+        except FileNotFoundError:
+            return None
+        # Zero-copy, the table's buffers point into the mapping and keep it open
+        with stage("snapshot_map"):
+            return pa.ipc.open_file(source).read_all()
+
+    def _lock(self, path: str) -> TextIO:
+        os.makedirs(self.directory, exist_ok=True)
+        lock = open(path + ".lock", "a")
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        return lock
+
+    def _write(self, path: str, table: pa.Table):
+        temporary = f"{path}.{os.getpid()}.tmp"
+        try:
+            # Uncompressed, compressed IPC buffers could not be mapped without copying
+            with pa.OSFile(temporary, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+            os.replace(temporary, path)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+
+    def _prune(self, current: str):
+        # Snapshots are <key>.arrow, their derived results and lock files share the key prefix
+        snapshots = [path for path in glob.glob(os.path.join(self.directory, "*.arrow")) if os.path.basename(path).count(".") == 1]
+        snapshots.sort(key=os.path.getmtime, reverse=True)
+        for path in [path for path in snapshots if path != current][self.keep - 1:]:
+            for stale in glob.glob(path.removesuffix(".arrow") + ".*"):
+                try:
+                    os.remove(stale)
+                except FileNotFoundError:
+                    pass
@@ -1,5 +1,17 @@
 from model.records_model import DataCenterEnergyRecord
-from graphql_api.types import DataCenterEnergyRecordType, Zone, BatteryBackupStatus, GridEnergySource, AlarmStatus
+import pyarrow as pa
+from typing import TYPE_CHECKING
+from graphql_api.types import DataCenterEnergyRecordType, Zone, BatteryBackupStatus, GridEnergySource, AlarmStatus, AggregateRow, AggregateValue
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+ENUM_COLUMNS = {
+    "zone": Zone,
+    "battery_backup_status": BatteryBackupStatus,
+    "grid_energy_source": GridEnergySource,
+    "alarm_status": AlarmStatus,
+}
 
 def to_graphql(record: DataCenterEnergyRecord) -> DataCenterEnergyRecordType:
     return DataCenterEnergyRecordType(
@@ -19,3 +31,54 @@ def to_graphql(record: DataCenterEnergyRecord) -> DataCenterEnergyRecordType:
         alarm_status=AlarmStatus(record.alarm_status),
         operator_notes=record.operator_notes,
     )
+
+
+class ColumnRecord:
+    """Row view over converted columns, resolved in place of DataCenterEnergyRecordType."""
+    __slots__ = ("_columns", "_index")
+
+    def __init__(self, columns: dict[str, list], index: int):
+        self._columns = columns
+        self._index = index
+
+    def __getattr__(self, name: str):
+        try:
+            return self._columns[name][self._index]
+        except KeyError:
+            raise AttributeError(name)
+
+
+def table_to_graphql(table: pa.Table) -> list[ColumnRecord]:
+    """Convert only the projected columns, once per column rather than once per row and field."""
+    columns = {}
+    for name in table.column_names:
+        column = table[name]
+        if pa.types.is_timestamp(column.type):
+            column = column.cast(pa.timestamp("us"))
+        values = column.to_pylist()
+
+        enum = ENUM_COLUMNS.get(name)
+        if enum is not None:
+            members = {member.value: member for member in enum}
+            values = [members[value] if value is not None else None for value in values]
+        columns[name] = values
+
+    return [ColumnRecord(columns, index) for index in range(table.num_rows)]
+
+
+def aggregate_to_graphql(result: "pd.DataFrame") -> list[AggregateRow]:
+    import pandas as pd
+
+    keys = {"bucket", "zone", "data_center_id", "grid_energy_source"}
+    value_columns = [column for column in result.columns if column not in keys]
+
+    rows = []
+    for row in result.to_dict(orient="records"):
+        rows.append(AggregateRow(
+            bucket=row.get("bucket"),
+            zone=Zone(row["zone"]) if "zone" in row else None,
+            data_center_id=row.get("data_center_id"),
+            grid_energy_source=GridEnergySource(row["grid_energy_source"]) if "grid_energy_source" in row else None,
+            values=[AggregateValue(name=column, value=None if pd.isna(row[column]) else float(row[column])) for column in value_columns],
+        ))
+    return rows
@@ -0,0 +1,101 @@
+import hashlib
+import json
+import logging
+from os import environ
+from typing import Optional
+
+import orjson
+from graphql import GraphQLError
+from strawberry.extensions import SchemaExtension
+from strawberry.types.graphql import OperationType
+
+from service.energy_usage import get_dataset_version, add_dataset_load_hook
+from service.result_cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+persisted_queries = LRUCache(max_entries=int(environ.get("ENERGY_GRAPHQL_PERSISTED_QUERIES_MAX", 1000)))
+
+result_cache = LRUCache(
+    max_entries=int(environ.get("ENERGY_GRAPHQL_CACHE_MAX_ENTRIES", 256)),
+    max_bytes=int(environ.get("ENERGY_GRAPHQL_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+)
+
+# Cached results are keyed by dataset version, clearing on reload just frees the memory sooner
+add_dataset_load_hook(lambda snapshot: result_cache.clear())
+
+
+def query_hash(query: str) -> str:
+    return hashlib.sha256(query.encode("utf-8")).hexdigest()
+
+
+def load_persisted_queries(path: str):
+    """Register a {sha256: query} JSON manifest, e.g. generated at client build time."""
+    with open(path) as f:
+        manifest = json.load(f)
+    for sha, query in manifest.items():
+        if query_hash(query) != sha:
+            raise ValueError(f"Persisted query hash mismatch for {sha}")
+        persisted_queries.put(sha, query, len(query))
+    logger.info(f"Loaded {len(manifest)} persisted GraphQL queries from {path}")
+
+
+if environ.get("ENERGY_GRAPHQL_PERSISTED_QUERIES_FILE"):
+    load_persisted_queries(environ["ENERGY_GRAPHQL_PERSISTED_QUERIES_FILE"])
+
+
+class PersistedQueries(SchemaExtension):
+    """
+    Automatic persisted queries using the Apollo protocol.
+
+    Clients send `extensions.persistedQuery.sha256Hash` without the document, and the document
+    is looked up by hash. Unknown hashes answer with PersistedQueryNotFound, the client then
+    retries once with the full document, which is registered for later requests.
+    """
+
+    def on_operation(self):
+        context = self.execution_context
+        persisted = (context.operation_extensions or {}).get("persistedQuery")
+
+        if isinstance(persisted, dict) and persisted.get("sha256Hash"):
+            sha = persisted["sha256Hash"]
+            if context.query:
+                if query_hash(context.query) != sha:
+                    raise GraphQLError("provided sha does not match query", extensions={"code": "PERSISTED_QUERY_HASH_MISMATCH"})
+                persisted_queries.put(sha, context.query, len(context.query))
+            else:
+                query = persisted_queries.get(sha)
+                if query is None:
+                    raise GraphQLError("PersistedQueryNotFound", extensions={"code": "PERSISTED_QUERY_NOT_FOUND"})
+                context.query = query
+        yield
+
+
+class ResultCache(SchemaExtension):
+    """Cache query results keyed by (query hash, variables, operation name, dataset version)."""
+
+    async def on_execute(self):
+        context = self.execution_context
+        key = await self._cache_key()
+
+        if key is not None:
+            cached = result_cache.get(key)
+            if cached is not None:
+                context.result = cached
+                yield
+                return
+
+        yield
+
+        result = context.result
+        if key is not None and result is not None and not getattr(result, "errors", None) and hasattr(result, "data"):
+            result_cache.put(key, result, len(orjson.dumps(result.data)))
+
+    async def _cache_key(self) -> Optional[tuple]:
+        context = self.execution_context
+        if context.operation_type != OperationType.QUERY or not context.query:
+            return None
+
+        version = await get_dataset_version()
+        variables = orjson.dumps(context.variables or {}, option=orjson.OPT_SORT_KEYS)
+        return query_hash(context.query), variables, context.operation_name, version
@@ -1,19 +1,154 @@
 import strawberry
-from typing import List
-from graphql_api.types import DataCenterEnergyRecordType
-from graphql_api.converters import to_graphql
-from service.energy_usage import get_all_data_center_energy
+from graphql import GraphQLError
+from pydantic import ValidationError
+from strawberry.extensions import ParserCache, ValidationCache
+from strawberry.types import Info
+from strawberry.types.nodes import SelectedField
+from strawberry.utils.str_converters import to_camel_case
+from typing import List, Optional
+from datetime import datetime
+from os import environ
+from graphql_api.types import (DataCenterEnergyRecordType, EnergyUsagePage, AggregateGroupBy, EnergyMetric, AggregateRow,
+                               EnergyUsageFilterInput, EnergyUsageSort)
+from graphql_api.converters import table_to_graphql, aggregate_to_graphql
+from graphql_api.extensions import PersistedQueries, ResultCache
+from service.energy_usage import get_energy_usage_page
+from service.aggregation import get_energy_usage_aggregate
+from model.records_model import DataCenterEnergyRecord
+from model.filter_model import EnergyUsageFilter
+from model.aggregate_model import AggregateQuery
 
 import logging
 
 logger = logging.getLogger(__name__)
 
+max_page_size = int(environ.get("ENERGY_USAGE_MAX_PAGE_SIZE", 10000))
+# Default limit of energyUsagePage, energyUsage without limit and cursor returns every matching record
+default_page_size = int(environ.get("ENERGY_GRAPHQL_DEFAULT_LIMIT", 1000))
+# Upper bound on records x fields materialized per GraphQL request
+max_query_cost = int(environ.get("ENERGY_GRAPHQL_MAX_COST", 200000))
+document_cache_size = int(environ.get("ENERGY_GRAPHQL_DOCUMENT_CACHE_SIZE", 256))
+
+# Errors caused by the request, answered to the client without logging a traceback
+CLIENT_ERROR_CODES = {"BAD_USER_INPUT", "PERSISTED_QUERY_NOT_FOUND", "PERSISTED_QUERY_HASH_MISMATCH"}
+
+RECORD_COLUMNS = {to_camel_case(name): name for name in DataCenterEnergyRecord.model_fields}
+
+
+def _flatten(selections: list) -> list[SelectedField]:
+    """Expand fragment spreads and inline fragments into the fields they select."""
+    fields = []
+    for selection in selections:
+        if isinstance(selection, SelectedField):
+            fields.append(selection)
+        else:
+            fields.extend(_flatten(selection.selections))
+    return fields
+
+
+def _requested_columns(info: Info, nested: Optional[str] = None) -> list[str]:
+    selections = _flatten(info.selected_fields[0].selections)
+    if nested:
+        selections = _flatten([child for field in selections if field.name == nested for child in field.selections])
+    return list(dict.fromkeys(RECORD_COLUMNS[field.name] for field in selections if field.name in RECORD_COLUMNS))
+
+
+def bad_user_input(message: str) -> GraphQLError:
+    return GraphQLError(message, extensions={"code": "BAD_USER_INPUT"})
+
+
+def _charge(info: Info, rows: int, columns: int):
+    """Add this field's cost to the request total and reject the query once it exceeds the limit."""
+    cost = info.context.get("query_cost", 0) + rows * max(columns, 1)
+    if cost > max_query_cost:
+        raise bad_user_input(f"Query cost {cost} exceeds the maximum of {max_query_cost}, request fewer records or fields, or page with limit")
+    info.context["query_cost"] = cost
+
+
+def _to_filter(filter: Optional[EnergyUsageFilterInput], start: Optional[datetime], end: Optional[datetime]) -> EnergyUsageFilter:
+    return EnergyUsageFilter(
+        alarm_status=filter.alarm_status.value if filter and filter.alarm_status else None,
+        zone=filter.zone.value if filter and filter.zone else None,
+        data_center_id=filter.data_center_id if filter else None,
+        start=start,
+        end=end,
+    )
+
+
+async def _energy_usage_page(info: Info, columns: list[str], filter: Optional[EnergyUsageFilterInput], sort: Optional[EnergyUsageSort],
+                       start: Optional[datetime], end: Optional[datetime], limit: Optional[int], cursor: Optional[str],
+                       paged: bool = True) -> EnergyUsagePage:
+    """
+    One page of records, `limit` defaulting to ENERGY_GRAPHQL_DEFAULT_LIMIT. With `paged` False and
+    neither limit nor cursor given, every matching record is returned, charged by the rows returned.
+    """
+    unpaged = not (paged or limit is not None or cursor is not None)
+    if unpaged:
+        # Read one row more than the remaining cost allows, an oversized result is rejected without reading it all
+        scan_limit = (max_query_cost - info.context.get("query_cost", 0)) // max(len(columns), 1) + 1
+    else:
+        limit = limit if limit is not None else default_page_size
+        if not 1 <= limit <= max_page_size:
+            raise bad_user_input(f"limit must be between 1 and {max_page_size}")
+        _charge(info, limit, len(columns))
+        scan_limit = limit
+
+    try:
+        table, next_cursor = await get_energy_usage_page(
+            _to_filter(filter, start, end), columns or ["timestamp"], scan_limit, cursor,
+            sort_by=sort.field.value if sort else None, descending=sort.descending if sort else False,
+        )
+    except ValueError as ex:
+        raise bad_user_input(str(ex))
+    if unpaged:
+        _charge(info, table.num_rows, len(columns))
+        next_cursor = None
+    logger.info(f"Fetched {table.num_rows} records ({', '.join(columns)}), next cursor: {next_cursor}")
+    return EnergyUsagePage(items=table_to_graphql(table), next_cursor=next_cursor)
+
+
 @strawberry.type
 class Query:
     @strawberry.field
-    def energy_usage(self) -> List[DataCenterEnergyRecordType]:
-        records = get_all_data_center_energy()
-        logger.info(f"Fetched records sample: {records[:1]}")
-        return [to_graphql(record) for record in records]
+    async def energy_usage(self, info: Info, filter: Optional[EnergyUsageFilterInput] = None, sort: Optional[EnergyUsageSort] = None,
+                     start: Optional[datetime] = None, end: Optional[datetime] = None,
+                     limit: Optional[int] = None, cursor: Optional[str] = None) -> List[DataCenterEnergyRecordType]:
+        """Matching records, all of them unless `limit` or `cursor` is given. Use energyUsagePage to page through large results."""
+        return (await _energy_usage_page(info, _requested_columns(info), filter, sort, start, end, limit, cursor, paged=False)).items
+
+    @strawberry.field
+    async def energy_usage_page(self, info: Info, filter: Optional[EnergyUsageFilterInput] = None, sort: Optional[EnergyUsageSort] = None,
+                          start: Optional[datetime] = None, end: Optional[datetime] = None,
+                          limit: Optional[int] = None, cursor: Optional[str] = None) -> EnergyUsagePage:
+        return await _energy_usage_page(info, _requested_columns(info, "items"), filter, sort, start, end, limit, cursor)
+
+    @strawberry.field
+    async def energy_aggregate(self, group_by: Optional[List[AggregateGroupBy]] = None, bucket: Optional[str] = None,
+                         metrics: Optional[List[EnergyMetric]] = None, functions: Optional[List[str]] = None,
+                         filter: Optional[EnergyUsageFilterInput] = None,
+                         start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[AggregateRow]:
+        try:
+            query = AggregateQuery(
+                group_by=[field.value for field in group_by or []],
+                bucket=bucket,
+                metrics=[metric.value for metric in metrics or []],
+                functions=functions or ["mean"],
+            )
+        except ValidationError as ex:
+            raise bad_user_input("; ".join(error["msg"].removeprefix("Value error, ") for error in ex.errors()))
+        result = await get_energy_usage_aggregate(query, _to_filter(filter, start, end))
+        return aggregate_to_graphql(result)
+
+
+class EnergySchema(strawberry.Schema):
+    def process_errors(self, errors: list[GraphQLError], execution_context=None):
+        super().process_errors([error for error in errors if (error.extensions or {}).get("code") not in CLIENT_ERROR_CODES],
+                               execution_context)
+
 
-schema = strawberry.Schema(query=Query)
+schema = EnergySchema(query=Query, extensions=[
+    PersistedQueries,
+    lambda: ParserCache(maxsize=document_cache_size),
+    lambda: ValidationCache(maxsize=document_cache_size),
+    ResultCache,
+])
@@ -1,5 +1,5 @@
 import strawberry
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 from enum import Enum
 
@@ -46,3 +46,64 @@ class DataCenterEnergyRecordType:
     co2_emissions_kg: float
     alarm_status: AlarmStatus
     operator_notes: Optional[str]
+
+
+@strawberry.type
+class EnergyUsagePage:
+    items: List[DataCenterEnergyRecordType]
+    next_cursor: Optional[str]
+
+
+@strawberry.enum
+class AggregateGroupBy(Enum):
+    ZONE = "zone"
+    DATA_CENTER_ID = "data_center_id"
+    GRID_ENERGY_SOURCE = "grid_energy_source"
+
+@strawberry.enum
+class EnergyMetric(Enum):
+    POWER_DRAW_KW = "power_draw_kw"
+    IT_LOAD_KW = "it_load_kw"
+    COOLING_LOAD_KW = "cooling_load_kw"
+    PUE = "pue"
+    TEMPERATURE_C = "temperature_c"
+    HUMIDITY_PERCENT = "humidity_percent"
+    UPS_LOAD_PERCENT = "ups_load_percent"
+    CO2_EMISSIONS_KG = "co2_emissions_kg"
+
+@strawberry.type
+class AggregateValue:
+    name: str
+    value: Optional[float]
+
+@strawberry.type
+class AggregateRow:
+    bucket: Optional[datetime]
+    zone: Optional[Zone]
+    data_center_id: Optional[str]
+    grid_energy_source: Optional[GridEnergySource]
+    values: List[AggregateValue]
+
+
+@strawberry.input
+class EnergyUsageFilterInput:
+    alarm_status: Optional[AlarmStatus] = None
+    zone: Optional[Zone] = None
+    data_center_id: Optional[str] = None
+
+@strawberry.enum
+class EnergyUsageSortField(Enum):
+    TIMESTAMP = "timestamp"
+    POWER_DRAW_KW = "power_draw_kw"
+    IT_LOAD_KW = "it_load_kw"
+    COOLING_LOAD_KW = "cooling_load_kw"
+    PUE = "pue"
+    TEMPERATURE_C = "temperature_c"
+    HUMIDITY_PERCENT = "humidity_percent"
+    UPS_LOAD_PERCENT = "ups_load_percent"
+    CO2_EMISSIONS_KG = "co2_emissions_kg"
+
+@strawberry.input
+class EnergyUsageSort:
+    field: EnergyUsageSortField = EnergyUsageSortField.TIMESTAMP
+    descending: bool = False
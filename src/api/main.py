@@ -1,9 +1,24 @@
+import time
+
+# Startup time is measured from here, before the application's modules are imported
+started = time.perf_counter()
+
 from routes import energy_usage
+from routes.http_cache import HttpCacheMiddleware, http_cache_stats
+from routes import metrics
+from routes import health
+from telemetry.metrics import registry, metrics_dir, publish_metrics
+from service.energy_usage import get_cache_stats, open_storage, close_storage, preload_energy_usage
+from service.startup import WarmUp
+from service.anomalies import anomaly_cache
+from graphql_api.extensions import result_cache, persisted_queries
 from graphql_api.schema import schema
 from strawberry.fastapi import GraphQLRouter
-import uvicorn
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager, suppress
+import asyncio
+import importlib
 import logging
 from fastapi.logger import logger
 from os import environ
@@ -21,6 +36,38 @@ logger.setLevel(gunicorn_logger.level)
 
 server_url = environ.get("SERVER_URL")
 
+# Modules left out of the import path, loaded while warming up so the first scan or aggregation does not wait for them
+WARM_UP_MODULES = ("pyarrow.dataset", "pandas")
+
+
+def import_modules():
+    for name in WARM_UP_MODULES:
+        importlib.import_module(name)
+
+
+# Storage clients and their connection pool live for the lifetime of the worker
+warm_up = WarmUp(started)
+warm_up.add_step("storage", open_storage)
+warm_up.add_step("imports", lambda: asyncio.to_thread(import_modules))
+warm_up.add_step("dataset", preload_energy_usage)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm-up runs in the background, the worker answers liveness probes while it opens storage and loads the dataset
+    tasks = [asyncio.create_task(warm_up.run())]
+    if metrics_dir:
+        tasks.append(asyncio.create_task(publish_metrics()))
+    try:
+        yield
+    finally:
+        for task in tasks:
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+        await close_storage()
+
+
 # FastAPI Application Setup
 app = FastAPI(
     title="Data Center Energy Usage Service",
@@ -28,8 +75,13 @@ app = FastAPI(
     version="1.0.0",
     servers=[
         {"url": server_url, "description": "Lab environment"}
-    ]
+    ],
+    lifespan=lifespan,
 )
+app.state.warm_up = warm_up
+
+# ETags, 304s and compression for the usage endpoints, inside CORS so 304s carry CORS headers too
+app.add_middleware(HttpCacheMiddleware, prefixes=("/usage/",))
 
 # Configure CORS
 app.add_middleware(
@@ -38,14 +90,20 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Server-Timing"],
 )
 
-# Include REST router
-app.include_router(energy_usage.router)
+# Outermost, so request durations include CORS and the HTTP cache
+app.add_middleware(metrics.MetricsMiddleware, routes=app.router.routes)
+
+# Include REST router, data endpoints answer 503 until storage is open
+app.include_router(energy_usage.router, dependencies=[Depends(health.require_storage)])
+app.include_router(metrics.router)
+app.include_router(health.router)
 
 # Include GraphQL
 graphql_app = GraphQLRouter(schema)
-app.include_router(graphql_app, prefix="/graphql", include_in_schema=False)
+app.include_router(graphql_app, prefix="/graphql", include_in_schema=False, dependencies=[Depends(health.require_storage)])
 
 
 @app.get("/")
@@ -54,6 +112,39 @@ def get_status() -> str:
     logger.info("**Logging - RUNNING**")
     return "running"
 
+
+@app.get("/cache/stats", include_in_schema=False)
+def get_cache_status() -> dict:
+    """Hit/miss/reload counters for the in-process energy usage and GraphQL caches."""
+    return {
+        "energy_usage": get_cache_stats(),
+        "graphql_results": result_cache.stats(),
+        "graphql_persisted_queries": persisted_queries.stats(),
+        "http_responses": http_cache_stats(),
+        "anomalies": anomaly_cache.stats(),
+    }
+
+
+CACHE_GAUGES = ("entries", "bytes", "rows")
+
+
+def cache_metrics():
+    """The /cache/stats counters as Prometheus samples, e.g. energy_cache_hits_total{cache="graphql_results"}."""
+    for cache, stats in get_cache_status().items():
+        for name, value in stats.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or name == "loaded_at":
+                continue
+            if name in CACHE_GAUGES:
+                yield f"energy_cache_{name}", "gauge", f"Current cache {name}.", {"cache": cache}, value
+            else:
+                yield f"energy_cache_{name}_total", "counter", f"Cache {name.replace('_', ' ')}.", {"cache": cache}, value
+
+
+registry.add_collector(cache_metrics)
+registry.add_collector(warm_up.metrics)
+
 # Run the application using Uvicorn when executed directly
 if __name__ == "__main__":
+    import uvicorn
+
     uvicorn.run("main:app", host="0.0.0.0", port=8000)
\ No newline at end of file
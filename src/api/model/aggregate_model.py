@@ -0,0 +1,46 @@
+from pydantic import BaseModel, field_validator
+from typing import Any, Literal, Optional
+import re
+
+GroupByField = Literal['zone', 'data_center_id', 'grid_energy_source']
+
+MetricField = Literal['power_draw_kw', 'it_load_kw', 'cooling_load_kw', 'pue', 'temperature_c',
+                      'humidity_percent', 'ups_load_percent', 'co2_emissions_kg']
+
+BASE_FUNCTIONS = ('sum', 'mean', 'min', 'max', 'count')
+
+BUCKET_UNITS = {'s': 'second', 'm': 'minute', 'h': 'hour', 'd': 'day'}
+
+
+class AggregateQuery(BaseModel):
+    group_by: list[GroupByField] = []
+    bucket: Optional[str] = None
+    metrics: list[MetricField] = []
+    functions: list[str] = ['mean']
+
+    @field_validator("bucket")
+    @classmethod
+    def validate_bucket(cls, value: Optional[str]) -> Optional[str]:
+        if value is not None and not re.fullmatch(r"[1-9]\d*[smhd]", value):
+            raise ValueError("bucket must look like 15m, 1h or 1d")
+        return value
+
+    @field_validator("functions")
+    @classmethod
+    def validate_functions(cls, value: list[str]) -> list[str]:
+        for function in value:
+            if function not in BASE_FUNCTIONS and not re.fullmatch(r"p(100|[1-9]?\d)", function):
+                raise ValueError(f"Unsupported function '{function}', use {', '.join(BASE_FUNCTIONS)} or a percentile such as p95")
+        return value
+
+    def bucket_interval(self) -> Optional[tuple[int, str]]:
+        """Return the bucket as (multiple, unit) for pyarrow floor_temporal."""
+        if self.bucket is None:
+            return None
+        return int(self.bucket[:-1]), BUCKET_UNITS[self.bucket[-1]]
+
+
+class AggregateResponse(BaseModel):
+    group_by: list[str]
+    bucket: Optional[str]
+    rows: list[dict[str, Any]]
@@ -0,0 +1,43 @@
+from pydantic import BaseModel, Field, model_validator
+from datetime import datetime
+from typing import Literal, Optional
+
+AnomalyMetric = Literal['pue', 'temperature_c', 'power_draw_kw', 'ups_load_percent']
+
+
+class AnomalyQuery(BaseModel):
+    metrics: list[AnomalyMetric] = []
+    # Trailing baseline, in readings of the same data center
+    window: int = Field(96, ge=2, le=10_000)
+    min_periods: Optional[int] = Field(None, ge=2)
+    ewma_span: int = Field(12, ge=1, le=10_000)
+    threshold: float = Field(3.0, gt=0)
+    # value flags single readings, ewma flags sustained drift of the smoothed series
+    signal: Literal['value', 'ewma'] = 'value'
+    direction: Literal['both', 'up', 'down'] = 'both'
+
+    @model_validator(mode="after")
+    def validate_min_periods(self):
+        if self.min_periods is not None and self.min_periods > self.window:
+            raise ValueError("min_periods must not exceed window")
+        return self
+
+
+class AnomalyPoint(BaseModel):
+    timestamp: datetime
+    data_center_id: str
+    metric: str
+    value: float
+    rolling_mean: float
+    rolling_std: float
+    ewma: float
+    z_score: float
+
+
+class AnomalyResponse(BaseModel):
+    window: int
+    ewma_span: int
+    threshold: float
+    signal: str
+    total: int
+    points: list[AnomalyPoint]
@@ -0,0 +1,7 @@
+from pydantic import BaseModel
+
+class CompactionResponse(BaseModel):
+    partitions: int
+    files_merged: int
+    files_written: int
+    rows: int
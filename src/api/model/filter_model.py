@@ -0,0 +1,18 @@
+from pydantic import BaseModel, field_validator
+from typing import Optional
+from datetime import datetime, timezone
+
+class EnergyUsageFilter(BaseModel):
+    alarm_status: Optional[str] = None
+    zone: Optional[str] = None
+    data_center_id: Optional[str] = None
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+
+    @field_validator("start", "end")
+    @classmethod
+    def to_naive_utc(cls, value: Optional[datetime]) -> Optional[datetime]:
+        # Stored timestamps are naive UTC
+        if value is not None and value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
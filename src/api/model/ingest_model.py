@@ -0,0 +1,6 @@
+from pydantic import BaseModel
+
+class IngestResponse(BaseModel):
+    rows_written: int
+    files_written: int
+    compaction_scheduled: bool
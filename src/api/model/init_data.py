@@ -1,10 +1,25 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field, field_validator
+from typing import Literal, Optional
+from datetime import datetime, timezone
 
 class InitRequest(BaseModel):
-    rows: Optional[int] = 100
-    overwrite: Optional[bool] = True
+    rows: int = Field(100, ge=1)
+    overwrite: bool = True
+    data_centers: int = Field(3, ge=1, le=1000)
+    interval_minutes: int = Field(15, ge=1)
+    start: Optional[datetime] = None
+    seed: Optional[int] = None
+    row_group_size: Optional[int] = Field(None, ge=1000)
+    compression: Optional[Literal['zstd', 'snappy', 'gzip', 'lz4', 'brotli', 'none']] = None
+
+    @field_validator("start")
+    @classmethod
+    def to_naive_utc(cls, value: Optional[datetime]) -> Optional[datetime]:
+        # Stored timestamps are naive UTC
+        if value is not None and value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
 
 class InitResponse(BaseModel):
     message: str
-    rows_written: int
\ No newline at end of file
+    rows_written: int
@@ -1,35 +1,285 @@
 import logging
-from fastapi import APIRouter, Response,Query
+from fastapi import APIRouter, Depends, Header, Request, Response, Query, HTTPException
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from service import energy_usage
+from service import aggregation
+from service import anomalies
+from service.serialization import validate_energy_usage_table, energy_usage_to_json, energy_usage_to_ndjson, energy_usage_to_arrow_stream
+from service.serialization import energy_usage_from_json, energy_usage_from_ndjson, energy_usage_from_arrow_stream
 from model.records_model import DataCenterEnergyRecord
+from model.filter_model import EnergyUsageFilter
+from model.aggregate_model import AggregateQuery, AggregateResponse
+from model.anomaly_model import AnomalyQuery, AnomalyResponse
+from model.init_data import InitRequest, InitResponse
+from model.compaction_model import CompactionResponse
+from model.ingest_model import IngestResponse
+from pydantic import ValidationError
+from telemetry.timing import stage
 from fastapi.logger import logger
-from typing import List,Optional
+from typing import AsyncIterator, List, Optional
+import hmac
+import pyarrow as pa
+from datetime import datetime
+from os import environ
 
 gunicorn_logger = logging.getLogger("gunicorn.error")
 logger.handlers = gunicorn_logger.handlers
 logger.setLevel(gunicorn_logger.level)
 
+# Opt-in to per-record Pydantic validation instead of the columnar fast path
+strict_serialization = environ.get("ENERGY_USAGE_STRICT_SERIALIZATION", "false").lower() == "true"
+max_page_size = int(environ.get("ENERGY_USAGE_MAX_PAGE_SIZE", 10000))
+stream_batch_size = int(environ.get("ENERGY_USAGE_STREAM_BATCH_SIZE", 5000))
+# Key required by the endpoints that replace or change data (init, ingest, compact), unset disables them
+admin_api_key = environ.get("ENERGY_ADMIN_API_KEY")
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
 # Initialize Router with "/content" prefix
 router = APIRouter(prefix="/usage")
 
-@router.get("/energy-usage", response_model=List[DataCenterEnergyRecord], 
+
+def _split(value: Optional[str]) -> list[str]:
+    return [item.strip() for item in value.split(",") if item.strip()] if value else []
+
+
+async def _chain(first, iterator: AsyncIterator) -> AsyncIterator:
+    yield first
+    async for item in iterator:
+        yield item
+
+
+async def _peek(iterator: AsyncIterator) -> AsyncIterator:
+    # Pull the first item eagerly so errors surface before a streaming response starts
+    first = await anext(iterator)
+    return _chain(first, iterator)
+
+
+def require_admin_key(x_api_key: Optional[str] = Header(None)):
+    """Dependency of the data changing endpoints: 404 unless ENERGY_ADMIN_API_KEY is set, 401 without the matching X-API-Key header."""
+    if not admin_api_key:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if x_api_key is None or not hmac.compare_digest(x_api_key.encode(), admin_api_key.encode()):
+        raise HTTPException(status_code=401, detail="Invalid or missing X-API-Key", headers={"WWW-Authenticate": "ApiKey"})
+
+
+async def _slices(table: pa.Table, size: int) -> AsyncIterator[pa.Table]:
+    for offset in range(0, max(table.num_rows, 1), size):
+        yield table.slice(offset, size)
+
+
+@router.get("/energy-usage", response_model=List[DataCenterEnergyRecord],
     summary="Get Energy Usage",
-    description="Retrieve energy usage data for data centers. You can filter by `alarm_status` (e.g., critical), `zone`, or other fields.",
+    description="Retrieve energy usage data for data centers ordered by timestamp. You can filter by `alarm_status` (e.g., critical), `zone`, `data_center_id` or a `start`/`end` time range, and limit the returned `fields`. "
+                "Set `limit` to page through results, the `X-Next-Cursor` response header holds the `cursor` for the next page. "
+                "Send `Accept: application/x-ndjson` or `Accept: application/vnd.apache.arrow.stream` to stream the records instead of a JSON array.",
 )
-def get_energy_usage( alarm_status: Optional[str] = Query(
+async def get_energy_usage( request: Request, response: Response, alarm_status: Optional[str] = Query(
         None, description="Filter by alarm status (e.g., normal, warning, critical)"
     ),
     zone: Optional[str] = Query(
         None, description="Filter by zone identifier (e.g., A1, B2, C3)"
+    ),
+    data_center_id: Optional[str] = Query(
+        None, description="Filter by data center identifier (e.g., DC-NYC1)"
+    ),
+    start: Optional[datetime] = Query(
+        None, description="Only include records at or after this timestamp (ISO 8601)"
+    ),
+    end: Optional[datetime] = Query(
+        None, description="Only include records before this timestamp (ISO 8601)"
+    ),
+    fields: Optional[str] = Query(
+        None, description="Comma separated list of fields to return (e.g., timestamp,zone,pue)"
+    ),
+    limit: Optional[int] = Query(
+        None, ge=1, le=max_page_size, description="Maximum number of records to return"
+    ),
+    cursor: Optional[str] = Query(
+        None, description="Opaque cursor from the X-Next-Cursor header of the previous page"
     )):
 
-    all_data = energy_usage.get_all_data_center_energy()
+    filters = EnergyUsageFilter(alarm_status=alarm_status, zone=zone, data_center_id=data_center_id, start=start, end=end)
+    columns = _split(fields) or None
+
+    accept = request.headers.get("accept", "")
+    streaming_media_type = next((media_type for media_type in (NDJSON_MEDIA_TYPE, ARROW_STREAM_MEDIA_TYPE) if media_type in accept), None)
+
+    try:
+        if streaming_media_type and limit is None and cursor is None:
+            # Unpaged streams are produced page by page so memory stays flat regardless of result size
+            tables, next_cursor = await _peek(energy_usage.iter_energy_usage_pages(filters, columns, stream_batch_size)), None
+        else:
+            table, next_cursor = await energy_usage.get_energy_usage_page(filters, columns, limit, cursor)
+            tables = _slices(table, stream_batch_size)
+    except ValueError as ex:
+        raise HTTPException(status_code=400, detail=str(ex))
+
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+
+    if streaming_media_type == NDJSON_MEDIA_TYPE:
+        return StreamingResponse(energy_usage_to_ndjson(tables), media_type=NDJSON_MEDIA_TYPE, headers=headers)
+    if streaming_media_type == ARROW_STREAM_MEDIA_TYPE:
+        return StreamingResponse(energy_usage_to_arrow_stream(tables), media_type=ARROW_STREAM_MEDIA_TYPE, headers=headers)
 
+    if strict_serialization and not columns:
+        response.headers.update(headers)
+        with stage("pydantic"):
+            return [DataCenterEnergyRecord(**row) for row in table.to_pylist()]
 
-    filtered_data = [
-        record for record in all_data
-        if (not alarm_status or record.alarm_status == alarm_status)
-        and (not zone or record.zone == zone)
+    # Validate once per table and encode the columns directly, bypassing response_model
+    content = await run_in_threadpool(lambda: energy_usage_to_json(validate_energy_usage_table(table)))
+    return Response(content=content, media_type="application/json", headers=headers)
+
+
+@router.get("/aggregate", response_model=AggregateResponse,
+    summary="Aggregate Energy Usage",
+    description="Aggregate energy usage metrics on the server. Group by `zone`, `data_center_id` and/or `grid_energy_source`, optionally bucket by time (e.g., 15m, 1h, 1d), "
+                "and reduce `metrics` (e.g., pue, co2_emissions_kg, power_draw_kw) with `functions` such as sum, mean, min, max, count or a percentile like p95.",
+)
+async def get_energy_usage_aggregate(
+    group_by: Optional[str] = Query(
+        None, description="Comma separated fields to group by (zone, data_center_id, grid_energy_source)"
+    ),
+    bucket: Optional[str] = Query(
+        None, description="Time bucket size (e.g., 15m, 1h, 1d)"
+    ),
+    metrics: Optional[str] = Query(
+        None, description="Comma separated metrics to aggregate (e.g., pue,co2_emissions_kg). Defaults to all metrics"
+    ),
+    functions: Optional[str] = Query(
+        "mean", description="Comma separated aggregate functions (sum, mean, min, max, count, p50, p95, p99)"
+    ),
+    alarm_status: Optional[str] = Query(
+        None, description="Filter by alarm status (e.g., normal, warning, critical)"
+    ),
+    zone: Optional[str] = Query(
+        None, description="Filter by zone identifier (e.g., A1, B2, C3)"
+    ),
+    data_center_id: Optional[str] = Query(
+        None, description="Filter by data center identifier (e.g., DC-NYC1)"
+    ),
+    start: Optional[datetime] = Query(
+        None, description="Only include records at or after this timestamp (ISO 8601)"
+    ),
+    end: Optional[datetime] = Query(
+        None, description="Only include records before this timestamp (ISO 8601)"
+    )):
+
+    try:
+        query = AggregateQuery(group_by=_split(group_by), bucket=bucket, metrics=_split(metrics), functions=_split(functions) or ["mean"])
+    except ValidationError as ex:
+        raise HTTPException(status_code=400, detail=ex.errors(include_url=False, include_context=False))
+
+    filters = EnergyUsageFilter(alarm_status=alarm_status, zone=zone, data_center_id=data_center_id, start=start, end=end)
+    result = await aggregation.get_energy_usage_aggregate(query, filters)
+
+    return AggregateResponse(group_by=query.group_by, bucket=query.bucket, rows=result.to_dict(orient="records"))
+
+
+@router.get("/anomalies", response_model=AnomalyResponse,
+    summary="Detect Energy Usage Anomalies",
+    description="Flag readings that deviate from each data center's recent history. For every `data_center_id` and metric (pue, temperature_c, power_draw_kw, ups_load_percent) "
+                "the mean and standard deviation of the previous `window` readings are compared with the reading (`signal=value`, spikes) or with its EWMA over `ewma_span` readings "
+                "(`signal=ewma`, sustained drift). Only readings whose z-score reaches `threshold` in the requested `direction` are returned, the latest `limit` of them. "
+                "Use `direction=up` with `signal=ewma` to find, e.g., data centers whose PUE is drifting upward.",
+)
+async def get_energy_usage_anomalies(
+    metrics: Optional[str] = Query(
+        None, description="Comma separated metrics to check (pue, temperature_c, power_draw_kw, ups_load_percent). Defaults to all of them"
+    ),
+    window: int = Query(
+        96, description="Number of previous readings of the data center forming the baseline"
+    ),
+    min_periods: Optional[int] = Query(
+        None, description="Readings needed in the baseline before flagging, defaults to window"
+    ),
+    ewma_span: int = Query(
+        12, description="Span of the exponentially weighted moving average, in readings"
+    ),
+    threshold: float = Query(
+        3.0, description="Absolute z-score from which a reading is flagged"
+    ),
+    signal: str = Query(
+        "value", description="Compare the raw reading (value) or its moving average (ewma) with the baseline"
+    ),
+    direction: str = Query(
+        "both", description="Flag deviations upward (up), downward (down) or both"
+    ),
+    zone: Optional[str] = Query(
+        None, description="Filter by zone identifier (e.g., A1, B2, C3)"
+    ),
+    data_center_id: Optional[str] = Query(
+        None, description="Filter by data center identifier (e.g., DC-NYC1)"
+    ),
+    start: Optional[datetime] = Query(
+        None, description="Only return flagged readings at or after this timestamp (ISO 8601)"
+    ),
+    end: Optional[datetime] = Query(
+        None, description="Only return flagged readings before this timestamp (ISO 8601)"
+    ),
+    limit: int = Query(
+        1000, ge=1, le=max_page_size, description="Maximum number of flagged readings to return, the most recent ones"
+    )):
+
+    try:
+        query = AnomalyQuery(metrics=_split(metrics), window=window, min_periods=min_periods, ewma_span=ewma_span,
+                             threshold=threshold, signal=signal, direction=direction)
+    except ValidationError as ex:
+        raise HTTPException(status_code=400, detail=ex.errors(include_url=False, include_context=False))
+
+    filters = EnergyUsageFilter(zone=zone, data_center_id=data_center_id, start=start, end=end)
+    flagged = await anomalies.get_energy_usage_anomalies(query, filters)
+
+    return AnomalyResponse(window=query.window, ewma_span=query.ewma_span, threshold=query.threshold, signal=query.signal,
+                           total=flagged.num_rows, points=flagged.slice(max(flagged.num_rows - limit, 0)).to_pylist())
+
+
+@router.post("/init", response_model=InitResponse, include_in_schema=False, dependencies=[Depends(require_admin_key)],
+    summary="Generate Energy Usage Data",
+    description="Replace the energy usage dataset with synthetic telemetry for load testing. Generates `rows` records, one per data center zone every `interval_minutes`, "
+                "streamed to the `zone=<zone>/date=<yyyy-mm-dd>` partitions of the dataset in row groups of `row_group_size` rows. "
+                "The previous partition files and any legacy single `usage.parquet` are removed once the new files are written. "
+                "Set `overwrite` to false to keep an existing dataset.",
+)
+async def init_energy_usage(request: InitRequest):
+    try:
+        return await energy_usage.init_energy_usage(request)
+    except FileExistsError as ex:
+        raise HTTPException(status_code=409, detail=str(ex))
+    except ValueError as ex:
+        raise HTTPException(status_code=400, detail=str(ex))
+
+
+@router.post("/compact", response_model=CompactionResponse, include_in_schema=False, dependencies=[Depends(require_admin_key)],
+    summary="Compact Energy Usage Dataset",
+    description="Merge small parquet files within each zone/date partition of the energy usage dataset into one file per partition. "
+                "Files of at least `small_file_bytes` bytes are left as they are.",
+)
+async def compact_energy_usage(small_file_bytes: Optional[int] = Query(
+        None, ge=1, description="Only merge files smaller than this size in bytes"
+    )):
+    return await energy_usage.compact_energy_usage(small_file_bytes)
+
+
+@router.post("/ingest", response_model=IngestResponse, include_in_schema=False, dependencies=[Depends(require_admin_key)],
+    summary="Ingest Energy Usage Records",
+    description="Append a batch of energy usage records to the dataset. Send a JSON array of records, `Content-Type: application/x-ndjson` "
+                "or `Content-Type: application/vnd.apache.arrow.stream`. The batch is validated as a whole and written as one delta file per zone/date partition, "
+                "served records are updated by merging the new files instead of reloading the dataset.",
+)
+async def ingest_energy_usage(request: Request):
+    content_type = request.headers.get("content-type", "")
+    parse = (energy_usage_from_ndjson if NDJSON_MEDIA_TYPE in content_type
+             else energy_usage_from_arrow_stream if ARROW_STREAM_MEDIA_TYPE in content_type
+             else energy_usage_from_json)
+    body = await request.body()
 
-    ]
-    return filtered_data
\ No newline at end of file
+    try:
+        table = await run_in_threadpool(parse, body)
+        return await energy_usage.ingest_energy_usage(table)
+    except ValueError as ex:
+        # Includes Arrow's parse errors, ArrowInvalid is a ValueError
+        raise HTTPException(status_code=400, detail=str(ex))
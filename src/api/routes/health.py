@@ -0,0 +1,25 @@
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import JSONResponse
+
+from service.energy_usage import storage_available
+
+router = APIRouter(prefix="/health", include_in_schema=False)
+
+
+@router.get("/live")
+def get_liveness(request: Request) -> JSONResponse:
+    """200 whenever the worker process answers, storage and dataset errors only affect readiness."""
+    return JSONResponse(request.app.state.warm_up.state())
+
+
+@router.get("/ready")
+def get_readiness(request: Request) -> JSONResponse:
+    """200 once the worker has warmed up (storage open, dataset loaded), 503 until then, failed steps are retried meanwhile."""
+    state = request.app.state.warm_up.state()
+    return JSONResponse(state, status_code=200 if state["status"] == "ready" else 503)
+
+
+def require_storage():
+    """Dependency of the data endpoints, answering 503 while the worker is still opening storage."""
+    if not storage_available():
+        raise HTTPException(status_code=503, detail="Warming up, retry shortly", headers={"Retry-After": "1"})
@@ -0,0 +1,262 @@
+import asyncio
+import gzip
+import hashlib
+import logging
+import zlib
+from os import environ
+from typing import Callable, Optional
+from urllib.parse import parse_qsl
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from service.energy_usage import get_dataset_version, add_dataset_load_hook
+from service.result_cache import LRUCache
+from telemetry.timing import stage
+
+try:
+    import zstandard
+except ImportError:  # optional, zstd is not offered without it
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:  # optional, br is not offered without it
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+max_age = int(environ.get("ENERGY_HTTP_MAX_AGE", 0))
+cache_control = environ.get("ENERGY_HTTP_CACHE_CONTROL", f"public, max-age={max_age}, must-revalidate")
+compress_min_bytes = int(environ.get("ENERGY_HTTP_COMPRESS_MIN_BYTES", 1024))
+
+response_cache = LRUCache(
+    max_entries=int(environ.get("ENERGY_HTTP_CACHE_MAX_ENTRIES", 256)),
+    max_bytes=int(environ.get("ENERGY_HTTP_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+)
+counters = {"not_modified": 0, "compressed": 0, "streamed_compressed": 0, "version_changed": 0}
+
+# Cached bodies are keyed by dataset version, clearing on reload just frees the memory sooner
+add_dataset_load_hook(lambda snapshot: response_cache.clear())
+
+
+def _gzip_stream():
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    return lambda data: compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+
+
+def _zstd_stream():
+    compressor = zstandard.ZstdCompressor(level=3).compressobj()
+    return lambda data: compressor.compress(data) + compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK), compressor.flush
+
+
+def _brotli_stream():
+    compressor = brotli.Compressor(quality=5)
+    return lambda data: compressor.process(data) + compressor.flush(), compressor.finish
+
+
+# Content codings in server preference order: (whole body encoder, streaming encoder factory)
+ENCODINGS: dict[str, tuple[Callable[[bytes], bytes], Callable]] = {}
+if zstandard is not None:
+    ENCODINGS["zstd"] = (zstandard.ZstdCompressor(level=3).compress, _zstd_stream)
+if brotli is not None:
+    ENCODINGS["br"] = (lambda data: brotli.compress(data, quality=5), _brotli_stream)
+ENCODINGS["gzip"] = (lambda data: gzip.compress(data, compresslevel=6, mtime=0), _gzip_stream)
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick the supported content coding with the highest q-value, None for identity."""
+    weights = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        weight = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        if coding:
+            weights[coding.strip().lower()] = weight
+
+    wildcard = weights.get("*", 0.0)
+    best = max(ENCODINGS, key=lambda coding: weights.get(coding, wildcard))
+    return best if weights.get(best, wildcard) > 0 else None
+
+
+def representation_digest(version: str, scope: Scope, headers: Headers) -> str:
+    """Digest identifying a response body: dataset version, path, normalized query and requested format."""
+    query = sorted(parse_qsl(scope.get("query_string", b"").decode("latin-1"), keep_blank_values=True))
+    key = "\n".join([version, scope["path"], repr(query), headers.get("accept", "").strip()])
+    return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+
+def matching_etag(if_none_match: str, etags: list[str]) -> Optional[str]:
+    """The ETag in `etags` that If-None-Match names, None when the client has no current copy."""
+    # If-None-Match uses weak comparison, W/ prefixes are ignored
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    if "*" in candidates:
+        return etags[-1]
+    return next((etag for etag in etags if etag in candidates), None)
+
+
+def http_cache_stats() -> dict:
+    return {**response_cache.stats(), **counters}
+
+
+class HttpCacheMiddleware:
+    """
+    Conditional requests and response compression for GET endpoints under `prefixes`.
+
+    Responses carry a strong ETag derived from the dataset version and the request, so a matching
+    If-None-Match is answered with 304 before the handler runs. Bodies are compressed with the best
+    coding the client accepts (zstd, br or gzip) once they reach `compress_min_bytes`, streamed
+    responses chunk by chunk. Complete 200 responses are kept per (request, coding) in an LRU, hot
+    queries are then served without running the query, serializing or compressing again. When the
+    dataset version changes while the handler runs, the response is sent without ETag and not kept.
+    """
+
+    def __init__(self, app: ASGIApp, prefixes: tuple[str, ...] = ("/usage/",)):
+        self.app = app
+        self.prefixes = prefixes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] != "GET" or not scope["path"].startswith(self.prefixes):
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        encoding = negotiate_encoding(headers.get("accept-encoding", ""))
+        try:
+            version = await get_dataset_version()
+            digest = representation_digest(version, scope, headers)
+        except Exception as ex:
+            # Let the handler report storage errors, without validators
+            logger.warning(f"Dataset version unavailable, serving without ETag: {ex}")
+            await self.app(scope, receive, send)
+            return
+
+        etags = [f'"{digest}"'] + ([f'"{digest}-{encoding}"'] if encoding else [])
+        matched = matching_etag(headers.get("if-none-match", ""), etags)
+        if matched:
+            counters["not_modified"] += 1
+            await self._send_not_modified(send, matched)
+            return
+
+        cached = response_cache.get((digest, encoding))
+        if cached is not None:
+            raw_headers, body = cached
+            await send({"type": "http.response.start", "status": 200, "headers": list(raw_headers)})
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        await self.app(scope, receive, _ResponseEncoder(send, digest, encoding, version).send)
+
+    @staticmethod
+    async def _send_not_modified(send: Send, etag: str):
+        headers = MutableHeaders()
+        headers["etag"] = etag
+        headers["cache-control"] = cache_control
+        headers["vary"] = "Accept, Accept-Encoding"
+        await send({"type": "http.response.start", "status": 304, "headers": headers.raw})
+        await send({"type": "http.response.body", "body": b""})
+
+
+class _ResponseEncoder:
+    """Wraps `send` for one response, adding validators and compressing the body."""
+
+    def __init__(self, send: Send, digest: str, encoding: Optional[str], version: str):
+        self._send = send
+        self.digest = digest
+        self.encoding = encoding
+        self.version = version
+
+        self._start: Optional[Message] = None
+        self._passthrough = False
+        self._stream = None
+
+    async def _version_unchanged(self) -> bool:
+        """Whether the body was built from the version the digest names, checked once the handler has produced it."""
+        try:
+            unchanged = await get_dataset_version() == self.version
+        except Exception as ex:
+            logger.warning(f"Dataset version unavailable, serving without ETag: {ex}")
+            unchanged = False
+        if not unchanged:
+            counters["version_changed"] += 1
+        return unchanged
+
+    def _set_headers(self, headers: MutableHeaders, encoding: Optional[str], tagged: bool):
+        if tagged:
+            headers["etag"] = f'"{self.digest}-{encoding}"' if encoding else f'"{self.digest}"'
+            headers["cache-control"] = cache_control
+        headers.add_vary_header("Accept")
+        headers.add_vary_header("Accept-Encoding")
+        if encoding:
+            headers["content-encoding"] = encoding
+
+    async def send(self, message: Message):
+        if message["type"] == "http.response.start":
+            # Held back until the first body chunk tells a complete body from a stream
+            self._start = message
+            return
+        if message["type"] != "http.response.body" or self._passthrough:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self._start is not None:
+            start, self._start = self._start, None
+            headers = MutableHeaders(raw=list(start["headers"]))
+            if start["status"] != 200 or "content-encoding" in headers:
+                self._passthrough = True
+                await self._send(start)
+                await self._send(message)
+            elif more_body:
+                await self._start_stream(start, headers, body)
+            else:
+                await self._send_complete(start, headers, body)
+            return
+
+        # Later chunks of a streamed body
+        if self._stream is None:
+            await self._send(message)
+            return
+        compress, finish = self._stream
+        chunk = await asyncio.to_thread(compress, body) if body else b""
+        if not more_body:
+            chunk += finish()
+        await self._send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+    async def _send_complete(self, start: Message, headers: MutableHeaders, body: bytes):
+        encoding = self.encoding if len(body) >= compress_min_bytes else None
+        if encoding:
+            with stage("compress"):
+                body = await asyncio.to_thread(ENCODINGS[encoding][0], body)
+            counters["compressed"] += 1
+
+        tagged = await self._version_unchanged()
+        self._set_headers(headers, encoding, tagged)
+        headers["content-length"] = str(len(body))
+        if tagged:
+            # Outer middleware may add headers in place, keep a copy
+            response_cache.put((self.digest, self.encoding), (list(headers.raw), body), len(body))
+
+        await self._send({**start, "headers": headers.raw})
+        await self._send({"type": "http.response.body", "body": body})
+
+    async def _start_stream(self, start: Message, headers: MutableHeaders, body: bytes):
+        # Size is unknown up front, streams are compressed whenever the client accepts it
+        if self.encoding:
+            self._stream = ENCODINGS[self.encoding][1]()
+            del headers["content-length"]
+            counters["streamed_compressed"] += 1
+        self._set_headers(headers, self.encoding, await self._version_unchanged())
+        await self._send({**start, "headers": headers.raw})
+
+        if self._stream is not None:
+            body = await asyncio.to_thread(self._stream[0], body) if body else b""
+        await self._send({"type": "http.response.body", "body": body, "more_body": True})
@@ -0,0 +1,82 @@
+import random
+import time
+from os import environ
+
+from fastapi import APIRouter, Response
+from starlette.datastructures import MutableHeaders
+from starlette.routing import BaseRoute, Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from telemetry.metrics import registry, render_metrics
+from telemetry.timing import start_request_timing, stop_request_timing, request_timings
+
+# Fraction of responses carrying a Server-Timing breakdown, 0 disables it
+server_timing_sample_rate = float(environ.get("ENERGY_SERVER_TIMING_SAMPLE_RATE", 0))
+
+PROMETHEUS_MEDIA_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+REQUESTS = registry.counter("energy_http_requests_total", "HTTP requests by route and status.")
+REQUEST_DURATION = registry.histogram("energy_http_request_duration_seconds", "HTTP request duration until the response started.")
+
+router = APIRouter()
+
+
+@router.get("/metrics", include_in_schema=False)
+def get_metrics() -> Response:
+    """Request, stage, row and cache metrics in the Prometheus text format, summed over the host's workers."""
+    return Response(content=render_metrics(), media_type=PROMETHEUS_MEDIA_TYPE)
+
+
+def _server_timing(timings: dict[str, float], total: float) -> str:
+    entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items()]
+    return ", ".join(entries + [f"total;dur={total * 1000:.1f}"])
+
+
+def _route_path(scope: Scope, routes: list[BaseRoute]) -> str:
+    """Route label of the request, "unmatched" for unknown paths so labels stay bounded."""
+    route = scope.get("route")
+    if getattr(route, "path_format", None):
+        return route.path_format
+    # Routes of included routers (e.g. GraphQL) carry no prefix, and requests answered before
+    # routing (a 304 from the HTTP cache) have none. None of them take path parameters.
+    if route is not None or any(route.matches(scope)[0] == Match.FULL for route in routes):
+        return scope["path"]
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """
+    Count requests and their duration per route, and collect the stage timings recorded while
+    handling them. A sample of responses reports those timings in a Server-Timing header, for
+    streamed responses it covers the work done before the first chunk.
+    """
+
+    def __init__(self, app: ASGIApp, routes: list[BaseRoute]):
+        self.app = app
+        self.routes = routes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        token = start_request_timing()
+        started = time.perf_counter()
+        sampled = server_timing_sample_rate > 0 and random.random() < server_timing_sample_rate
+        status = 500
+
+        async def send_with_timing(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                elapsed = time.perf_counter() - started
+                REQUEST_DURATION.observe(elapsed, method=scope["method"], route=_route_path(scope, self.routes))
+                if sampled:
+                    MutableHeaders(scope=message).append("Server-Timing", _server_timing(request_timings(), elapsed))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            REQUESTS.inc(method=scope["method"], route=_route_path(scope, self.routes), status=status)
+            stop_request_timing(token)
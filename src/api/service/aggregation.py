@@ -0,0 +1,124 @@
+from data.storageaccount import energy_usage
+from data.storageaccount.cache import EnergyUsageSnapshot
+from model.aggregate_model import AggregateQuery, BASE_FUNCTIONS, MetricField
+from model.filter_model import EnergyUsageFilter
+from typing import TYPE_CHECKING, Optional, get_args
+import asyncio
+import pyarrow as pa
+import pyarrow.compute as pc
+import logging
+from telemetry.timing import stage
+
+if TYPE_CHECKING:
+    # Imported on first use, pandas is a large share of the startup time
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+METRICS = list(get_args(MetricField))
+
+# Rollups materialized for every loaded snapshot, keyed by (group_by, bucket)
+MATERIALIZED_ROLLUPS = [
+    (("zone",), None),
+    (("data_center_id",), None),
+    (("grid_energy_source",), None),
+    (("zone",), "1h"),
+    (("data_center_id",), "1h"),
+]
+
+
+def compute_aggregate(table: pa.Table, query: AggregateQuery) -> "pd.DataFrame":
+    """Group and reduce an energy usage table, one column per `{metric}_{function}`."""
+    with stage("aggregate"):
+        return _compute_aggregate(table, query)
+
+
+def _compute_aggregate(table: pa.Table, query: AggregateQuery) -> "pd.DataFrame":
+    metrics = query.metrics or METRICS
+    keys = list(query.group_by)
+
+    columns = {name: table[name] for name in keys + metrics}
+    interval = query.bucket_interval()
+    if interval:
+        multiple, unit = interval
+        columns = {"bucket": pc.floor_temporal(table["timestamp"], multiple=multiple, unit=unit), **columns}
+        keys = ["bucket"] + keys
+
+    import pandas as pd
+
+    frame = pa.table(columns).to_pandas()
+    if not keys:
+        # Single global group
+        frame["_all"] = 0
+        keys = ["_all"]
+
+    grouped = frame.groupby(keys, sort=True, observed=True)[metrics]
+    parts = []
+
+    base_functions = [function for function in query.functions if function in BASE_FUNCTIONS]
+    if base_functions:
+        reduced = grouped.agg(base_functions)
+        reduced.columns = [f"{metric}_{function}" for metric, function in reduced.columns]
+        parts.append(reduced)
+
+    for function in query.functions:
+        if function in BASE_FUNCTIONS:
+            continue
+        quantile = grouped.quantile(int(function[1:]) / 100)
+        quantile.columns = [f"{metric}_{function}" for metric in quantile.columns]
+        parts.append(quantile)
+
+    result = pd.concat(parts, axis=1).reset_index()
+    ordered = [f"{metric}_{function}" for metric in metrics for function in query.functions]
+    return result[[key for key in keys if key != "_all"] + ordered]
+
+
+def _compute_rollup(snapshot: EnergyUsageSnapshot, group_by: tuple[str, ...], bucket: Optional[str]) -> "pd.DataFrame":
+    query = AggregateQuery(group_by=list(group_by), bucket=bucket, metrics=METRICS, functions=list(BASE_FUNCTIONS))
+    shared = energy_usage.shared_snapshot
+    if shared is None:
+        return compute_aggregate(snapshot.table, query)
+
+    # Computed by one worker per host, the others read it back from the shared snapshot directory
+    name = f"rollup-{'-'.join(group_by)}-{bucket or 'all'}"
+    return shared.derived(snapshot.version, name, lambda: pa.Table.from_pandas(compute_aggregate(snapshot.table, query), preserve_index=False)).to_pandas()
+
+
+def materialize_rollups(snapshot: EnergyUsageSnapshot):
+    """Load hook computing the common rollups once per dataset version."""
+    rollups = {}
+    for group_by, bucket in MATERIALIZED_ROLLUPS:
+        rollups[(group_by, bucket)] = _compute_rollup(snapshot, group_by, bucket)
+    snapshot.derived["rollups"] = rollups
+    logger.info(f"Materialized {len(rollups)} energy usage rollups for version {snapshot.version}")
+
+
+energy_usage.energy_usage_cache.add_load_hook(materialize_rollups)
+
+
+async def _materialized(query: AggregateQuery, filters: EnergyUsageFilter) -> Optional["pd.DataFrame"]:
+    if not energy_usage.cache_enabled or filters.model_dump(exclude_none=True):
+        return None
+    if any(function not in BASE_FUNCTIONS for function in query.functions):
+        return None
+
+    rollup = (await energy_usage.get_energy_usage_snapshot()).derived.get("rollups", {}).get((tuple(query.group_by), query.bucket))
+    if rollup is None:
+        return None
+
+    metrics = query.metrics or METRICS
+    keys = (["bucket"] if query.bucket else []) + list(query.group_by)
+    return rollup[keys + [f"{metric}_{function}" for metric in metrics for function in query.functions]]
+
+
+async def get_energy_usage_aggregate(query: AggregateQuery, filters: Optional[EnergyUsageFilter] = None) -> "pd.DataFrame":
+    """Serve the aggregate from a materialized rollup when possible, otherwise compute it over the filtered scan."""
+    filters = filters or EnergyUsageFilter()
+
+    result = await _materialized(query, filters)
+    if result is not None:
+        return result
+
+    columns = list(query.group_by) + (query.metrics or METRICS) + (["timestamp"] if query.bucket else [])
+    table = await energy_usage.get_energy_usage_table(filters, columns)
+    return await asyncio.to_thread(compute_aggregate, table, query)
@@ -0,0 +1,164 @@
+from data.storageaccount import energy_usage
+from model.anomaly_model import AnomalyQuery, AnomalyMetric
+from model.filter_model import EnergyUsageFilter
+from service.result_cache import LRUCache
+from os import environ
+from typing import Optional, get_args
+import asyncio
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from telemetry.timing import stage
+
+ANOMALY_METRICS = list(get_args(AnomalyMetric))
+
+ANOMALY_SCHEMA = pa.schema([
+    ("timestamp", pa.timestamp("ns")),
+    ("data_center_id", pa.string()),
+    ("metric", pa.string()),
+    ("value", pa.float64()),
+    ("rolling_mean", pa.float64()),
+    ("rolling_std", pa.float64()),
+    ("ewma", pa.float64()),
+    ("z_score", pa.float64()),
+])
+
+anomaly_cache = LRUCache(
+    max_entries=int(environ.get("ENERGY_ANOMALY_CACHE_MAX_ENTRIES", 64)),
+    max_bytes=int(environ.get("ENERGY_ANOMALY_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+)
+
+# Cached results are keyed by dataset version, clearing on reload just frees the memory sooner
+energy_usage.energy_usage_cache.add_load_hook(lambda snapshot: anomaly_cache.clear())
+
+
+def _group_series(ids: pa.ChunkedArray, timestamps: np.ndarray) -> tuple[np.ndarray, np.ndarray, pa.Array]:
+    """Row order putting each data center's readings together in time order, the offset where each series starts, and the ids."""
+    encoded = pc.dictionary_encode(ids.combine_chunks())
+    codes = encoded.indices.to_numpy()
+    order = np.lexsort((timestamps, codes))
+    sorted_codes = codes[order]
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]]) if len(order) else np.empty(0, dtype=np.int64)
+    return order, starts, encoded.dictionary
+
+
+def rolling_stats(values: np.ndarray, series_start: np.ndarray, window: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Mean, sample standard deviation and count of the `window` readings before each one in its series.
+
+    All series are computed at once from prefix sums, a window never reaches back past the start
+    of its series. The current reading is left out so a spike does not mask itself.
+    """
+    index = np.arange(len(values))
+    begin = np.maximum(series_start, index - window)
+    count = index - begin
+
+    # Offset by the series' first reading to limit cancellation in the sum of squares
+    base = values[series_start]
+    shifted = values - base
+    sums = np.concatenate(([0.0], np.cumsum(shifted)))
+    squares = np.concatenate(([0.0], np.cumsum(shifted * shifted)))
+    total = sums[index] - sums[begin]
+    total_squares = squares[index] - squares[begin]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = total / count
+        variance = (total_squares - total * mean) / (count - 1)
+    return mean + base, np.sqrt(np.maximum(variance, 0.0)), count
+
+
+def ewma(values: np.ndarray, starts: np.ndarray, span: int) -> np.ndarray:
+    """
+    Exponentially weighted moving average of every series, y = (1 - alpha) * y_prev + alpha * x with alpha = 2 / (span + 1).
+
+    The recurrence is evaluated in closed form with cumulative sums over blocks short enough for
+    decay ** -block to stay finite, carrying the last average from block to block.
+    """
+    alpha = 2 / (span + 1)
+    decay = 1 - alpha
+    if decay == 0:
+        return values.copy()
+
+    block = max(1, int(100 / -np.log10(decay)))
+    powers = decay ** np.arange(1, block + 1)
+    result = np.empty_like(values)
+    for start, end in zip(starts, np.r_[starts[1:], len(values)]):
+        carry = values[start]
+        for offset in range(start, end, block):
+            x = values[offset:min(offset + block, end)]
+            weights = powers[:len(x)]
+            result[offset:offset + len(x)] = weights * (carry + alpha * np.cumsum(x / weights))
+            carry = result[offset + len(x) - 1]
+    return result
+
+
+def compute_anomalies(table: pa.Table, query: AnomalyQuery) -> pa.Table:
+    """Flag the readings whose z-score against their data center's trailing window reaches the threshold, sorted by timestamp."""
+    with stage("anomalies"):
+        return _compute_anomalies(table, query)
+
+
+def _compute_anomalies(table: pa.Table, query: AnomalyQuery) -> pa.Table:
+    timestamps = table["timestamp"].to_numpy()
+    order, starts, ids = _group_series(table["data_center_id"], timestamps)
+    series_start = np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+    min_periods = query.min_periods or query.window
+
+    parts = []
+    for metric in query.metrics or ANOMALY_METRICS:
+        values = table[metric].to_numpy().astype(np.float64)[order]
+        mean, std, count = rolling_stats(values, series_start, query.window)
+        smoothed = ewma(values, starts, query.ewma_span)
+        signal = smoothed if query.signal == "ewma" else values
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            z_score = (signal - mean) / std
+        # A flat baseline has no spread to compare against
+        valid = (count >= min_periods) & (std > 0)
+        if query.direction == "up":
+            flagged = valid & (z_score >= query.threshold)
+        elif query.direction == "down":
+            flagged = valid & (z_score <= -query.threshold)
+        else:
+            flagged = valid & (np.abs(z_score) >= query.threshold)
+
+        positions = np.flatnonzero(flagged)
+        rows = order[positions]
+        parts.append(pa.table([
+            pc.take(table["timestamp"], rows),
+            pc.take(table["data_center_id"], rows),
+            pa.repeat(pa.scalar(metric), len(rows)),
+            values[positions],
+            mean[positions],
+            std[positions],
+            smoothed[positions],
+            z_score[positions],
+        ], schema=ANOMALY_SCHEMA))
+
+    result = pa.concat_tables(parts) if parts else ANOMALY_SCHEMA.empty_table()
+    return result.sort_by([("timestamp", "ascending"), ("data_center_id", "ascending"), ("metric", "ascending")])
+
+
+async def get_energy_usage_anomalies(query: AnomalyQuery, filters: Optional[EnergyUsageFilter] = None) -> pa.Table:
+    """
+    Flagged readings for the series selected by `filters`, computed once per dataset version and query.
+
+    Windows need the readings before `start`, so only the zone and data center filters narrow the
+    series; the time range selects among the flagged readings.
+    """
+    filters = filters or EnergyUsageFilter()
+    series = EnergyUsageFilter(zone=filters.zone, data_center_id=filters.data_center_id)
+
+    key = (await energy_usage.get_energy_usage_version(), query.model_dump_json(), series.model_dump_json())
+    flagged = anomaly_cache.get(key)
+    if flagged is None:
+        columns = ["timestamp", "data_center_id"] + (query.metrics or ANOMALY_METRICS)
+        table = await energy_usage.get_energy_usage_table(series, columns)
+        flagged = await asyncio.to_thread(compute_anomalies, table, query)
+        anomaly_cache.put(key, flagged, flagged.nbytes)
+
+    if filters.start is not None:
+        flagged = flagged.filter(pc.field("timestamp") >= filters.start)
+    if filters.end is not None:
+        flagged = flagged.filter(pc.field("timestamp") < filters.end)
+    return flagged
@@ -0,0 +1,154 @@
+from datetime import datetime, timedelta
+import time
+from typing import Iterator, Optional, get_args
+import numpy as np
+import pyarrow as pa
+from model.records_model import DataCenterEnergyRecord
+from data.storageaccount.energy_usage import ENERGY_USAGE_SCHEMA
+
+ZONES = list(get_args(DataCenterEnergyRecord.model_fields["zone"].annotation))
+SITE_CODES = ["NYC", "CHI", "OMA", "DAL", "SEA", "ATL", "PHX", "SJC", "IAD", "DEN", "PDX", "BOS", "MIA", "SLC", "MSP", "LAS"]
+
+GRID_SOURCES = np.array(["grid", "solar", "diesel", "battery"], dtype=object)
+BATTERY_STATUSES = np.array(["online", "charging", "discharging", "offline"], dtype=object)
+ALARM_STATUSES = np.array(["normal", "warning", "critical"], dtype=object)
+OPERATOR_NOTES = np.array(["", "Temp spike investigated", "Checked UPS levels", "Rebooted cooling system"], dtype=object)
+
+# kg CO2 per kWh drawn, by energy source
+CO2_INTENSITY = np.array([0.39, 0.05, 0.74, 0.39])
+
+
+def data_center_ids(count: int) -> list[str]:
+    return [f"DC-{SITE_CODES[i % len(SITE_CODES)]}{i // len(SITE_CODES) + 1}" for i in range(count)]
+
+
+class _SeriesProfile:
+    """Static characteristics of every (data center, zone) series, drawn once per run."""
+
+    def __init__(self, rng: np.random.Generator, data_centers: int):
+        series = data_centers * len(ZONES)
+        self.data_center = np.repeat(np.array(data_center_ids(data_centers), dtype=object), len(ZONES))
+        self.zone = np.tile(np.array(ZONES, dtype=object), data_centers)
+
+        # Per site: IT capacity, cooling efficiency, electrical losses and climate
+        self.it_capacity_kw = np.repeat(rng.uniform(90, 160, data_centers), len(ZONES)) * rng.uniform(0.8, 1.1, series)
+        self.cooling_ratio = np.repeat(rng.uniform(0.25, 0.55, data_centers), len(ZONES))
+        self.loss_ratio = rng.uniform(0.04, 0.09, series)
+        self.base_temperature_c = np.repeat(rng.uniform(21, 25, data_centers), len(ZONES)) + rng.normal(0, 0.5, series)
+        self.base_humidity = rng.uniform(38, 52, series)
+        self.ups_capacity_kw = self.it_capacity_kw * rng.uniform(1.15, 1.4, series)
+        self.solar_share = np.repeat(rng.uniform(0, 0.35, data_centers), len(ZONES))
+
+        # Slow drifts as a few low frequency sines with random phases, continuous across batches
+        self.drift_periods_h = np.array([37.0, 171.0, 613.0])
+        self.drift_phase = rng.uniform(0, 2 * np.pi, (series, len(self.drift_periods_h)))
+
+
+def _drift(profile: _SeriesProfile, hours: np.ndarray, series: np.ndarray) -> np.ndarray:
+    angles = 2 * np.pi * hours[:, None] / profile.drift_periods_h + profile.drift_phase[series]
+    return np.sin(angles).mean(axis=1)
+
+
+def _generate_batch(profile: _SeriesProfile, rng: np.random.Generator, first_row: int, rows: int,
+                    start_ns: int, interval_ns: int) -> pa.Table:
+    series_count = len(profile.zone)
+    index = np.arange(first_row, first_row + rows)
+    tick, series = np.divmod(index, series_count)
+
+    timestamps_ns = start_ns + tick * interval_ns
+    hours = (timestamps_ns // 1_000_000_000) / 3600.0
+    hour_of_day = hours % 24
+    weekday = ((hours // 24) + 3) % 7 < 5  # 1970-01-01 was a Thursday
+
+    daily = np.sin(2 * np.pi * (hour_of_day - 8) / 24)  # peaks mid afternoon
+    drift = _drift(profile, hours, series)
+
+    utilization = 0.62 + 0.14 * daily + 0.05 * weekday + 0.08 * drift + rng.normal(0, 0.03, rows)
+    it_load = profile.it_capacity_kw[series] * np.clip(utilization, 0.2, 1.05)
+
+    temperature = (profile.base_temperature_c[series] + 1.8 * daily + 1.2 * drift
+                   + 3.0 * (utilization - 0.62) + rng.normal(0, 0.6, rows))
+    # Occasional cooling faults show up as short temperature excursions
+    temperature += (rng.random(rows) < 0.004) * rng.uniform(4, 9, rows)
+    humidity = profile.base_humidity[series] - 1.5 * (temperature - profile.base_temperature_c[series]) + rng.normal(0, 2.5, rows)
+
+    cooling_load = it_load * profile.cooling_ratio[series] * (1 + 0.05 * (temperature - 24)) * rng.normal(1, 0.04, rows)
+    cooling_load = np.maximum(cooling_load, 0.05 * it_load)
+    power_draw = it_load * (1 + profile.loss_ratio[series]) + cooling_load
+    ups_load = 100 * it_load / profile.ups_capacity_kw[series]
+
+    # Energy source: solar only in daylight, grid outages switch to battery then diesel
+    draw = rng.random(rows)
+    daylight = (hour_of_day >= 8) & (hour_of_day < 18)
+    source = np.zeros(rows, dtype=np.int64)
+    source[daylight & (draw < profile.solar_share[series] * np.clip(daily + 0.5, 0, 1))] = 1
+    source[draw > 0.993] = 3
+    source[draw > 0.997] = 2
+
+    battery = np.zeros(rows, dtype=np.int64)
+    status_draw = rng.random(rows)
+    battery[status_draw < 0.05] = 1
+    battery[status_draw > 0.995] = 3
+    battery[source == 3] = 2
+
+    co2 = power_draw * (interval_ns / 3.6e12) * CO2_INTENSITY[source]
+
+    pue = power_draw / it_load
+    alarm = np.zeros(rows, dtype=np.int64)
+    alarm[(temperature > 27) | (pue > 1.9) | (ups_load > 80) | (humidity < 25) | (humidity > 65) | (battery == 3)] = 1
+    alarm[(temperature > 30) | (pue > 2.2) | (ups_load > 92) | (source == 2)] = 2
+
+    note = np.zeros(rows, dtype=np.int64)
+    noted = (alarm > 0) & (rng.random(rows) < 0.6)
+    note[noted & (temperature > 27)] = 1
+    note[noted & ((temperature > 30) | (pue > 1.9))] = 3
+    note[noted & (note == 0) & ((ups_load > 80) | (battery >= 2) | (source >= 2))] = 2
+    note[noted & (note == 0)] = 1
+
+    return pa.table({
+        "timestamp": pa.array(timestamps_ns, pa.int64()).cast(pa.timestamp("ns")),
+        "data_center_id": pa.array(profile.data_center[series], pa.string()),
+        "zone": pa.array(profile.zone[series], pa.string()),
+        "power_draw_kw": np.round(power_draw, 2),
+        "it_load_kw": np.round(it_load, 2),
+        "cooling_load_kw": np.round(cooling_load, 2),
+        "pue": np.round(pue, 2),
+        "temperature_c": np.round(temperature, 2),
+        "humidity_percent": np.round(np.clip(humidity, 5, 95), 1),
+        "ups_load_percent": np.round(np.clip(ups_load, 0, 100), 1),
+        "battery_backup_status": pa.array(BATTERY_STATUSES[battery], pa.string()),
+        "grid_energy_source": pa.array(GRID_SOURCES[source], pa.string()),
+        "co2_emissions_kg": np.round(co2, 2),
+        "alarm_status": pa.array(ALARM_STATUSES[alarm], pa.string()),
+        "operator_notes": pa.array(OPERATOR_NOTES[note], pa.string()),
+    }, schema=ENERGY_USAGE_SCHEMA)
+
+
+def generate_energy_usage(rows: int, data_centers: int = 3, interval: timedelta = timedelta(minutes=15),
+                          start: Optional[datetime] = None, batch_size: int = 1_000_000,
+                          seed: Optional[int] = None) -> Iterator[pa.Table]:
+    """
+    Generate synthetic energy usage telemetry, `batch_size` rows at a time and in timestamp order.
+
+    Every tick emits one record per (data center, zone) series. Loads follow a daily and weekly
+    cycle plus slow per-series drift, cooling and PUE follow from the IT load and temperature,
+    and alarms are derived from the resulting readings. Memory use is bounded by `batch_size`
+    regardless of `rows`, and the same seed, start and batch size always yield the same data.
+    """
+    seed = seed if seed is not None else int(np.random.SeedSequence().entropy % 2 ** 32)
+    profile = _SeriesProfile(np.random.default_rng(seed), data_centers)
+    series_count = len(profile.zone)
+
+    interval_ns = int(interval.total_seconds() * 1_000_000_000)
+    if start is None:
+        # End the series at the current interval
+        ticks = -(-rows // series_count)
+        now_ns = time.time_ns()
+        start_ns = now_ns - now_ns % interval_ns - (ticks - 1) * interval_ns
+    else:
+        start_ns = int(np.datetime64(start, "ns").astype(np.int64))
+
+    batch_size = max(batch_size - batch_size % series_count, series_count)
+    for batch_index, first_row in enumerate(range(0, rows, batch_size)):
+        rng = np.random.default_rng([seed, batch_index])
+        yield _generate_batch(profile, rng, first_row, min(batch_size, rows - first_row), start_ns, interval_ns)
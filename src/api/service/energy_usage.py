@@ -1,6 +1,145 @@
 from data.storageaccount import energy_usage
+from data.storageaccount import init as storage
 from model.records_model import DataCenterEnergyRecord
+from model.filter_model import EnergyUsageFilter
+from model.init_data import InitRequest, InitResponse
+from model.compaction_model import CompactionResponse
+from model.ingest_model import IngestResponse
+from service.data_generator import generate_energy_usage
+from datetime import timedelta
+from os import environ
+from typing import AsyncIterator, Optional
+import asyncio
+import logging
+import pyarrow as pa
 
+logger = logging.getLogger(__name__)
 
-def get_all_data_center_energy()-> list[DataCenterEnergyRecord]:
-    return energy_usage.get_all_data_center_energy()
\ No newline at end of file
+init_max_rows = int(environ.get("ENERGY_INIT_MAX_ROWS", 100_000_000))
+init_row_group_size = int(environ.get("ENERGY_INIT_ROW_GROUP_SIZE", 1_000_000))
+init_compression = environ.get("ENERGY_INIT_COMPRESSION", "zstd")
+# Load the cached dataset while the worker warms up, before it reports ready
+preload_dataset = environ.get("ENERGY_PRELOAD_DATASET", "true").lower() == "true"
+ingest_max_rows = int(environ.get("ENERGY_INGEST_MAX_ROWS", 1_000_000))
+# Delta files this worker appends before it folds them into the dataset in the background, 0 disables
+compaction_delta_files = int(environ.get("ENERGY_COMPACTION_DELTA_FILES", 64))
+
+_delta_files_written = 0
+_compaction_task: Optional[asyncio.Task] = None
+
+
+async def get_all_data_center_energy()-> list[DataCenterEnergyRecord]:
+    return await energy_usage.get_all_data_center_energy()
+
+
+async def get_energy_usage_table(filters: Optional[EnergyUsageFilter] = None, columns: Optional[list[str]] = None) -> pa.Table:
+    return await energy_usage.get_energy_usage_table(filters, columns)
+
+
+async def get_energy_usage_page(filters: Optional[EnergyUsageFilter] = None, columns: Optional[list[str]] = None,
+                                limit: Optional[int] = None, cursor: Optional[str] = None,
+                                sort_by: Optional[str] = None, descending: bool = False) -> tuple[pa.Table, Optional[str]]:
+    return await energy_usage.get_energy_usage_page(filters, columns, limit, cursor, sort_by, descending)
+
+
+def iter_energy_usage_pages(filters: Optional[EnergyUsageFilter] = None, columns: Optional[list[str]] = None,
+                            page_size: int = 5000) -> AsyncIterator[pa.Table]:
+    return energy_usage.iter_energy_usage_pages(filters, columns, page_size)
+
+
+async def get_dataset_version() -> str:
+    """Version of the dataset being served, read from storage when the in-process cache is disabled."""
+    return await energy_usage.get_energy_usage_version()
+
+
+def add_dataset_load_hook(hook):
+    energy_usage.energy_usage_cache.add_load_hook(hook)
+
+
+def storage_available() -> bool:
+    """Whether the worker's storage clients are open, they are opened in the background at startup."""
+    return storage.async_storage is not None
+
+
+async def open_storage():
+    await storage.storage_startup()
+
+
+async def close_storage():
+    await energy_usage.energy_usage_cache.close()
+    await storage.storage_shutdown()
+
+
+async def preload_energy_usage():
+    """Load the dataset into the cache, with its rollups, so the first requests are served warm."""
+    if energy_usage.cache_enabled and preload_dataset:
+        await energy_usage.get_energy_usage_snapshot()
+
+
+def get_cache_stats() -> dict:
+    return energy_usage.energy_usage_cache.stats()
+
+
+async def init_energy_usage(request: InitRequest) -> InitResponse:
+    """Replace the partitioned dataset, and any legacy usage.parquet, with synthetic data generated one row group at a time."""
+    if request.rows > init_max_rows:
+        raise ValueError(f"rows must be at most {init_max_rows}")
+
+    row_group_size = request.row_group_size or init_row_group_size
+    batches = generate_energy_usage(
+        request.rows,
+        data_centers=request.data_centers,
+        interval=timedelta(minutes=request.interval_minutes),
+        start=request.start,
+        batch_size=row_group_size,
+        seed=request.seed,
+    )
+    rows = await asyncio.to_thread(
+        energy_usage.write_energy_usage, batches, request.overwrite,
+        row_group_size, request.compression or init_compression,
+    )
+    return InitResponse(message=f"Generated {rows} energy usage records for {request.data_centers} data center(s)", rows_written=rows)
+
+
+async def compact_energy_usage(small_file_bytes: Optional[int] = None) -> CompactionResponse:
+    """Merge small files within each partition of the dataset."""
+    result = await asyncio.to_thread(energy_usage.compact_energy_usage, small_file_bytes, init_compression)
+    if result["partitions"]:
+        # Same records in fewer files, the current snapshot keeps being served until the reload completes
+        energy_usage.energy_usage_cache.refresh()
+    return CompactionResponse(**result)
+
+
+async def _compact_in_background():
+    try:
+        await compact_energy_usage()
+    except Exception as ex:
+        logger.error(f"Error compacting energy usage deltas: {ex}")
+
+
+def _schedule_compaction() -> bool:
+    global _compaction_task, _delta_files_written
+    if _compaction_task is not None and not _compaction_task.done():
+        return False
+    _delta_files_written = 0
+    _compaction_task = asyncio.create_task(_compact_in_background())
+    return True
+
+
+async def ingest_energy_usage(table: pa.Table) -> IngestResponse:
+    """
+    Append a validated batch of records as delta files and have the cache merge them in.
+
+    Once this worker has written `compaction_delta_files` delta files, they are folded into the
+    partitions' base files by a background compaction.
+    """
+    global _delta_files_written
+    if table.num_rows > ingest_max_rows:
+        raise ValueError(f"A batch must hold at most {ingest_max_rows} records")
+
+    result = await asyncio.to_thread(energy_usage.append_energy_usage, table, init_compression)
+    energy_usage.energy_usage_cache.refresh()
+
+    _delta_files_written += result["files_written"]
+    scheduled = 0 < compaction_delta_files <= _delta_files_written and _schedule_compaction()
+    return IngestResponse(rows_written=result["rows"], files_written=result["files_written"], compaction_scheduled=scheduled)
@@ -0,0 +1,197 @@
+from model.records_model import DataCenterEnergyRecord
+from datetime import datetime
+import asyncio
+import io
+from typing import AsyncIterable, AsyncIterator, Literal, Optional, Union, get_args, get_origin
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.json as pj
+import orjson
+from telemetry.timing import stage
+from data.storageaccount.energy_usage import ENERGY_USAGE_SCHEMA
+
+
+def _field_spec(annotation) -> tuple[object, bool, Optional[list]]:
+    """Return (python type, nullable, allowed literal values) for a model field annotation."""
+    nullable = False
+    if get_origin(annotation) is Union:
+        args = [arg for arg in get_args(annotation) if arg is not type(None)]
+        nullable = len(args) < len(get_args(annotation))
+        annotation = args[0]
+
+    if get_origin(annotation) is Literal:
+        return str, nullable, list(get_args(annotation))
+    return annotation, nullable, None
+
+
+ENERGY_USAGE_FIELDS = {
+    name: _field_spec(field.annotation) for name, field in DataCenterEnergyRecord.model_fields.items()
+}
+
+
+def validate_energy_usage_table(table: pa.Table) -> pa.Table:
+    """
+    Validate an energy usage table against DataCenterEnergyRecord once per column instead of once per row.
+
+    Columns are cast to the canonical Arrow type for the field. Raises ValueError when a column
+    is missing, has an incompatible type, contains nulls in a required field or values outside
+    a Literal field's allowed set.
+    """
+    with stage("validate"):
+        return _validate_columns(table)
+
+
+def _validate_columns(table: pa.Table) -> pa.Table:
+    columns = []
+    for name in table.column_names:
+        if name not in ENERGY_USAGE_FIELDS:
+            raise ValueError(f"Unexpected column '{name}'")
+
+        python_type, nullable, allowed = ENERGY_USAGE_FIELDS[name]
+        column = table[name]
+
+        if python_type is datetime:
+            if not pa.types.is_timestamp(column.type):
+                raise ValueError(f"Column '{name}' must be a timestamp, got {column.type}")
+        elif python_type is float:
+            if not (pa.types.is_floating(column.type) or pa.types.is_integer(column.type)):
+                raise ValueError(f"Column '{name}' must be numeric, got {column.type}")
+            column = column.cast(pa.float64())
+        elif python_type is str:
+            if not (pa.types.is_string(column.type) or pa.types.is_large_string(column.type)):
+                raise ValueError(f"Column '{name}' must be a string, got {column.type}")
+            column = column.cast(pa.string())
+
+        if not nullable and column.null_count:
+            raise ValueError(f"Column '{name}' contains {column.null_count} null value(s)")
+
+        if allowed is not None:
+            invalid = pc.invert(pc.is_in(column, value_set=pa.array(allowed)))
+            if pc.any(invalid).as_py():
+                bad_values = pc.unique(pc.filter(column, invalid)).to_pylist()
+                raise ValueError(f"Column '{name}' contains invalid value(s): {bad_values}")
+
+        columns.append(column)
+
+    return pa.table(columns, names=table.column_names)
+
+
+def _format_timestamps(column: pa.ChunkedArray) -> pa.ChunkedArray:
+    # Match the ISO 8601 format Pydantic emits for naive datetimes
+    formatted = pc.cast(pc.cast(column, pa.timestamp("us")), pa.string())
+    formatted = pc.replace_substring(formatted, " ", "T")
+    return pc.replace_substring_regex(formatted, r"\.000000$", "")
+
+
+def _to_records(table: pa.Table) -> list[dict]:
+    names = table.column_names
+    columns = []
+    for name in names:
+        column = table[name]
+        if pa.types.is_timestamp(column.type):
+            column = _format_timestamps(column)
+        columns.append(column.to_pylist())
+
+    return [dict(zip(names, row)) for row in zip(*columns)]
+
+
+def energy_usage_to_json(table: pa.Table) -> bytes:
+    """Serialize a validated energy usage table to a JSON array of records."""
+    with stage("serialize"):
+        return orjson.dumps(_to_records(table))
+
+
+def _to_ndjson(table: pa.Table) -> bytes:
+    table = validate_energy_usage_table(table)
+    with stage("serialize"):
+        return b"".join(orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE) for record in _to_records(table))
+
+
+async def energy_usage_to_ndjson(tables: AsyncIterable[pa.Table]) -> AsyncIterator[bytes]:
+    """Stream energy usage tables as newline delimited JSON, one chunk per table encoded in a worker thread."""
+    async for table in tables:
+        if table.num_rows:
+            yield await asyncio.to_thread(_to_ndjson, table)
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object handing out whatever was written since the last drain."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _write_arrow(sink: _ChunkSink, writer: Optional[pa.ipc.RecordBatchStreamWriter], table: pa.Table):
+    table = validate_energy_usage_table(table)
+    with stage("serialize"):
+        if writer is None:
+            writer = pa.ipc.new_stream(sink, table.schema)
+        writer.write_table(table)
+        return writer, sink.drain()
+
+
+async def energy_usage_to_arrow_stream(tables: AsyncIterable[pa.Table]) -> AsyncIterator[bytes]:
+    """Stream energy usage tables in the Arrow IPC streaming format, one chunk of record batches per table."""
+    sink = _ChunkSink()
+    writer = None
+
+    async for table in tables:
+        writer, chunk = await asyncio.to_thread(_write_arrow, sink, writer, table)
+        yield chunk
+
+    if writer is not None:
+        writer.close()
+        yield sink.drain()
+
+
+def _conform(table: pa.Table) -> pa.Table:
+    missing = [name for name in ENERGY_USAGE_SCHEMA.names if name not in table.column_names]
+    if missing:
+        raise ValueError(f"Missing column(s): {missing}")
+
+    table = validate_energy_usage_table(table)
+    # Timezone aware timestamps are stored as naive UTC, like the rest of the dataset
+    return table.select(ENERGY_USAGE_SCHEMA.names).cast(ENERGY_USAGE_SCHEMA)
+
+
+def energy_usage_from_ndjson(body: bytes) -> pa.Table:
+    """Parse and validate newline delimited JSON records into an energy usage table, without building a Python object per row."""
+    if not body.strip():
+        return ENERGY_USAGE_SCHEMA.empty_table()
+    with stage("parse"):
+        table = pj.read_json(
+            pa.BufferReader(body),
+            parse_options=pj.ParseOptions(explicit_schema=ENERGY_USAGE_SCHEMA, unexpected_field_behavior="error"),
+        )
+    return _conform(table)
+
+
+def energy_usage_from_json(body: bytes) -> pa.Table:
+    """Parse and validate a JSON array of records into an energy usage table."""
+    with stage("parse"):
+        records = orjson.loads(body)
+        if not isinstance(records, list) or not all(isinstance(record, dict) for record in records):
+            raise ValueError("Expected a JSON array of records")
+        # Re-encoded as NDJSON so Arrow parses and types the columns in one pass
+        body = b"".join(orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE) for record in records)
+    return energy_usage_from_ndjson(body)
+
+
+def energy_usage_from_arrow_stream(body: bytes) -> pa.Table:
+    """Read and validate an energy usage table sent in the Arrow IPC streaming format."""
+    with stage("parse"):
+        table = pa.ipc.open_stream(body).read_all()
+    return _conform(table)
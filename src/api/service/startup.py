@@ -0,0 +1,98 @@
+import asyncio
+import logging
+import time
+from os import environ
+from typing import Awaitable, Callable, Optional
+
+from telemetry.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Time from the start of the app import until the worker is ready, exceeding it logs a warning
+startup_budget_seconds = float(environ.get("ENERGY_STARTUP_BUDGET_SECONDS", 10))
+# Delay before retrying a failed step, doubled on every failure up to the maximum
+retry_seconds = float(environ.get("ENERGY_WARM_UP_RETRY_SECONDS", 1))
+retry_max_seconds = float(environ.get("ENERGY_WARM_UP_RETRY_MAX_SECONDS", 60))
+
+STARTUP_DURATION = registry.histogram(
+    "energy_startup_duration_seconds", "Worker startup time per phase, ready is the total until the worker was ready.",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0),
+)
+
+
+class WarmUp:
+    """
+    Startup steps of a worker, run in the background by the application lifespan.
+
+    The worker accepts connections as soon as the app is imported, so liveness probes answer
+    immediately, while readiness reports whether every step (opening storage, loading the dataset)
+    has completed. Steps run in order, a failed step is retried with exponential backoff until it
+    succeeds, its last error is reported by the readiness probe meanwhile.
+    """
+
+    def __init__(self, started: float):
+        self.started = started
+        self.steps: list[tuple[str, Callable[[], Awaitable]]] = []
+        self.timings: dict[str, float] = {}
+        self.import_seconds: Optional[float] = None
+        self.ready_seconds: Optional[float] = None
+        self.error: Optional[str] = None
+        self.failures = 0
+        self._done = asyncio.Event()
+
+    def add_step(self, name: str, step: Callable[[], Awaitable]):
+        self.steps.append((name, step))
+
+    @property
+    def status(self) -> str:
+        return "ready" if self.ready_seconds is not None else "starting"
+
+    async def run(self):
+        self.import_seconds = self.import_seconds or time.perf_counter() - self.started
+        try:
+            for name, step in self.steps:
+                step_started = time.perf_counter()
+                delay = retry_seconds
+                while True:
+                    try:
+                        await step()
+                        break
+                    except Exception as ex:
+                        self.error = f"{name}: {ex}"
+                        self.failures += 1
+                        logger.exception(f"Warm-up step {name} failed, retrying in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, retry_max_seconds)
+                self.timings[name] = time.perf_counter() - step_started
+            self.error = None
+
+            self.ready_seconds = time.perf_counter() - self.started
+            for phase, seconds in {"import": self.import_seconds, **self.timings, "ready": self.ready_seconds}.items():
+                STARTUP_DURATION.observe(seconds, phase=phase)
+            timings = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.timings.items())
+            message = f"Ready in {self.ready_seconds:.2f}s (import {self.import_seconds:.2f}s, {timings})"
+            if self.ready_seconds > startup_budget_seconds:
+                logger.warning(f"{message}, over the startup budget of {startup_budget_seconds:.0f}s")
+            else:
+                logger.info(message)
+        finally:
+            self._done.set()
+
+    async def wait(self):
+        """Wait until the warm-up has finished, failed steps are retried until they succeed."""
+        await self._done.wait()
+
+    def metrics(self):
+        """Metrics collector, summed over the workers of a host it counts the ready ones."""
+        yield "energy_workers_ready", "gauge", "Workers that finished warming up.", {}, int(self.status == "ready")
+
+    def state(self) -> dict:
+        return {
+            "status": self.status,
+            "error": self.error,
+            "failures": self.failures,
+            "import_seconds": self.import_seconds,
+            "ready_seconds": self.ready_seconds,
+            "budget_seconds": startup_budget_seconds,
+            "steps": self.timings,
+        }
@@ -0,0 +1,214 @@
+import asyncio
+import glob
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+from os import environ
+from typing import Callable, Iterable
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Gunicorn workers each count their own requests, they publish their samples here so whichever
+# worker answers a scrape reports the totals of the host
+metrics_dir = environ.get("ENERGY_METRICS_DIR", os.path.join(tempfile.gettempdir(), "energy-metrics"))
+metrics_dump_seconds = float(environ.get("ENERGY_METRICS_DUMP_SECONDS", 5))
+
+# (sample name, sorted label pairs) -> value
+Samples = dict[tuple[str, tuple[tuple[str, str], ...]], float]
+
+
+def _labels(labels: dict) -> tuple[tuple[str, str], ...]:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> Samples:
+        with self._lock:
+            return {(self.name, key): value for key, value in self._values.items()}
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: tuple[float, ...] = DURATION_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        # labels -> (per bucket counts, sum, count)
+        self._values: dict[tuple, tuple[list[int], float, int]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _labels(labels)
+        with self._lock:
+            counts, total, count = self._values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    def samples(self) -> Samples:
+        samples = {}
+        with self._lock:
+            for key, (counts, total, count) in self._values.items():
+                for bound, bucket_count in zip(self.buckets, counts):
+                    samples[(f"{self.name}_bucket", key + (("le", repr(bound)),))] = bucket_count
+                samples[(f"{self.name}_bucket", key + (("le", "+Inf"),))] = count
+                samples[(f"{self.name}_sum", key)] = total
+                samples[(f"{self.name}_count", key)] = count
+        return samples
+
+
+class Registry:
+    """Process-wide metrics, rendered in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics: dict[str, object] = {}
+        self._collectors: list[Callable[[], Iterable[tuple[str, str, str, dict, float]]]] = []
+
+    def counter(self, name: str, documentation: str) -> Counter:
+        return self._metrics.setdefault(name, Counter(name, documentation))
+
+    def histogram(self, name: str, documentation: str, buckets: tuple[float, ...] = DURATION_BUCKETS) -> Histogram:
+        return self._metrics.setdefault(name, Histogram(name, documentation, buckets))
+
+    def add_collector(self, collector: Callable[[], Iterable[tuple[str, str, str, dict, float]]]):
+        """Register a callable yielding (name, kind, help, labels, value) read at scrape time, e.g. cache counters."""
+        self._collectors.append(collector)
+
+    def families(self) -> dict[str, dict]:
+        """{name: {"kind", "help", "samples"}} for this process."""
+        families = {
+            name: {"kind": metric.kind, "help": metric.documentation, "samples": metric.samples()}
+            for name, metric in self._metrics.items()
+        }
+        for collector in self._collectors:
+            try:
+                for name, kind, documentation, labels, value in collector():
+                    family = families.setdefault(name, {"kind": kind, "help": documentation, "samples": {}})
+                    family["samples"][(name, _labels(labels))] = value
+            except Exception as ex:
+                logger.error(f"Error in metrics collector {getattr(collector, '__name__', collector)}: {ex}")
+        return families
+
+
+registry = Registry()
+
+
+def _dump_path(pid: int) -> str:
+    return os.path.join(metrics_dir, f"{pid}.json")
+
+
+def dump_metrics():
+    """Publish this worker's samples for the other workers of the host, written atomically."""
+    families = {
+        name: {**family, "samples": [[sample, dict(labels), value] for (sample, labels), value in family["samples"].items()]}
+        for name, family in registry.families().items()
+    }
+    os.makedirs(metrics_dir, exist_ok=True)
+    temporary = _dump_path(os.getpid()) + ".tmp"
+    with open(temporary, "w") as f:
+        json.dump(families, f)
+    os.replace(temporary, _dump_path(os.getpid()))
+
+
+def remove_metrics_dump():
+    try:
+        os.remove(_dump_path(os.getpid()))
+    except FileNotFoundError:
+        pass
+
+
+async def publish_metrics():
+    """Background task of every worker, dumping its samples every `metrics_dump_seconds`."""
+    try:
+        while True:
+            try:
+                await asyncio.to_thread(dump_metrics)
+            except OSError as ex:
+                logger.error(f"Could not publish worker metrics to {metrics_dir}: {ex}")
+            await asyncio.sleep(metrics_dump_seconds)
+    finally:
+        remove_metrics_dump()
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _worker_families() -> Iterable[dict]:
+    for path in glob.glob(os.path.join(metrics_dir, "*.json")):
+        name = os.path.basename(path).removesuffix(".json")
+        if not name.isdigit() or int(name) == os.getpid():
+            continue
+        pid = int(name)
+        if not _alive(pid):
+            # Counters of exited workers restart from zero, as after a restart of the process
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            continue
+        try:
+            with open(path) as f:
+                families = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for family in families.values():
+            family["samples"] = {(sample, _labels(labels)): value for sample, labels, value in family["samples"]}
+        yield families
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def render_metrics() -> str:
+    """Prometheus text format for this process, summed with the published samples of the other workers."""
+    families = registry.families()
+    if metrics_dir:
+        for worker in _worker_families():
+            for name, family in worker.items():
+                merged = families.setdefault(name, {"kind": family["kind"], "help": family["help"], "samples": {}})
+                for key, value in family["samples"].items():
+                    merged["samples"][key] = merged["samples"].get(key, 0) + value
+
+    lines = []
+    for name in sorted(families):
+        family = families[name]
+        lines.append(f"# HELP {name} {family['help']}")
+        lines.append(f"# TYPE {name} {family['kind']}")
+        for (sample, labels), value in sorted(family["samples"].items(), key=lambda item: (item[0][0] != f"{name}_bucket", item[0])):
+            label_text = ",".join(f'{key}="{_escape(label)}"' for key, label in labels)
+            lines.append(f"{sample}{{{label_text}}} {_format_value(value)}" if label_text else f"{sample} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,52 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from .metrics import registry
+
+STAGE_DURATION = registry.histogram("energy_stage_duration_seconds", "Time spent per processing stage.")
+STORAGE_BYTES_READ = registry.counter("energy_storage_bytes_read_total", "Bytes downloaded from storage to load the dataset.")
+SCAN_FILE_BYTES = registry.counter("energy_scan_file_bytes_total", "Size of the parquet files opened by uncached scans.")
+ROWS_SCANNED = registry.counter("energy_rows_scanned_total", "Rows the filters were evaluated over.")
+ROWS_MATCHED = registry.counter("energy_rows_matched_total", "Rows left after filtering, before paging.")
+ROWS_RETURNED = registry.counter("energy_rows_returned_total", "Rows returned to clients.")
+
+# Stage timings of the request being handled, copied into worker threads by asyncio.to_thread
+_request_timings: ContextVar[Optional[dict[str, float]]] = ContextVar("request_timings", default=None)
+
+
+def start_request_timing():
+    """Collect the stage timings of the current request from here on, returns a token for `stop_request_timing`."""
+    return _request_timings.set({})
+
+
+def stop_request_timing(token):
+    _request_timings.reset(token)
+
+
+def request_timings() -> dict[str, float]:
+    return _request_timings.get() or {}
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time a block as one processing stage, recorded as a metric and on the current request."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_DURATION.observe(elapsed, stage=name)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + elapsed
+
+
+def count_rows(operation: str, scanned: Optional[int] = None, matched: Optional[int] = None, returned: Optional[int] = None):
+    if scanned is not None:
+        ROWS_SCANNED.inc(scanned, operation=operation)
+    if matched is not None:
+        ROWS_MATCHED.inc(matched, operation=operation)
+    if returned is not None:
+        ROWS_RETURNED.inc(returned, operation=operation)
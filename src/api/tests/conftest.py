@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The API modules import each other from the src/api root, as they do when the app runs
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
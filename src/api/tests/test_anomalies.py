@@ -0,0 +1,110 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from model.anomaly_model import AnomalyQuery
+from service.anomalies import _group_series, compute_anomalies, ewma, rolling_stats
+
+
+def _series(lengths, seed=1):
+    """Values of several series laid out one after another, and the offset where each starts."""
+    rng = np.random.default_rng(seed)
+    values = np.concatenate([1000 + rng.normal(0, 5, length).cumsum() for length in lengths])
+    starts = np.r_[0, np.cumsum(lengths)[:-1]].astype(np.int64)
+    return values, starts
+
+
+def _frame(values, starts):
+    series = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, len(values)]))
+    return pd.DataFrame({"series": series, "value": values})
+
+
+@pytest.mark.parametrize("window", [2, 5, 48])
+def test_rolling_stats_match_pandas(window):
+    values, starts = _series([300, 1, 2, 120])
+    frame = _frame(values, starts)
+    series_start = starts[frame["series"].to_numpy()]
+
+    mean, std, count = rolling_stats(values, series_start, window)
+
+    # The window is the `window` readings before each one, within its series
+    previous = frame.groupby("series")["value"].shift(1)
+    rolling = previous.groupby(frame["series"]).rolling(window, min_periods=1)
+    np.testing.assert_allclose(mean, rolling.mean().reset_index(level=0, drop=True), rtol=1e-9, equal_nan=True)
+    # Prefix sums lose a few digits next to pandas' running sums, relative to the values (~1000)
+    np.testing.assert_allclose(std, rolling.std().reset_index(level=0, drop=True), rtol=1e-6, atol=1e-6, equal_nan=True)
+    np.testing.assert_array_equal(count, rolling.count().reset_index(level=0, drop=True))
+
+
+def test_rolling_std_of_a_flat_series_is_zero():
+    values = np.full(10, 1.25)
+
+    _, std, _ = rolling_stats(values, np.zeros(10, dtype=np.int64), 4)
+
+    assert np.isnan(std[:2]).all()
+    assert (std[2:] == 0).all()
+
+
+@pytest.mark.parametrize("span", [1, 2, 12, 500])
+def test_ewma_matches_pandas(span):
+    # Series longer than the closed form's blocks, the average is carried across them
+    values, starts = _series([5000, 1, 700])
+    frame = _frame(values, starts)
+
+    expected = frame.groupby("series")["value"].transform(lambda s: s.ewm(span=span, adjust=False).mean())
+
+    np.testing.assert_allclose(ewma(values, starts, span), expected, rtol=1e-9)
+
+
+def test_group_series_orders_each_data_center_by_time():
+    ids = pa.chunked_array([["b", "a", "b", "a", "c"]])
+    timestamps = np.array([3, 2, 1, 0, 5], dtype="datetime64[ns]")
+
+    order, starts, dictionary = _group_series(ids, timestamps)
+
+    assert [(ids[int(row)].as_py(), int(timestamps[row].astype(np.int64))) for row in order] \
+        == [("b", 1), ("b", 3), ("a", 0), ("a", 2), ("c", 5)]
+    assert starts.tolist() == [0, 2, 4]
+    assert dictionary.to_pylist() == ["b", "a", "c"]
+
+
+def test_compute_anomalies_flags_a_spike_against_a_pandas_reference():
+    rng = np.random.default_rng(3)
+    rows = 200
+    start = datetime(2025, 1, 1)
+    pue = np.concatenate([1.4 + rng.normal(0, 0.01, rows), 1.6 + rng.normal(0, 0.01, rows)])
+    pue[150] = 2.5
+    table = pa.table({
+        "timestamp": pa.array([start + timedelta(minutes=15 * i) for i in range(rows)] * 2, pa.timestamp("ns")),
+        "data_center_id": ["dc-1"] * rows + ["dc-2"] * rows,
+        "pue": pue,
+    })
+    query = AnomalyQuery(metrics=["pue"], window=24, threshold=4)
+
+    result = compute_anomalies(table, query)
+
+    frame = table.to_pandas()
+    baseline = frame.groupby("data_center_id")["pue"].transform(lambda s: s.shift(1).rolling(24, min_periods=24).mean())
+    spread = frame.groupby("data_center_id")["pue"].transform(lambda s: s.shift(1).rolling(24, min_periods=24).std())
+    z_score = (frame["pue"] - baseline) / spread
+    expected = frame[z_score.abs() >= 4]
+
+    assert result.num_rows == len(expected) >= 1
+    assert result["timestamp"].to_pylist() == sorted(expected["timestamp"].dt.to_pydatetime().tolist())
+    np.testing.assert_allclose(sorted(result["z_score"].to_pylist()), sorted(z_score[z_score.abs() >= 4]), rtol=1e-6)
+    assert 2.5 in result["value"].to_pylist()
+
+
+def test_compute_anomalies_of_an_empty_table():
+    table = pa.table({
+        "timestamp": pa.array([], pa.timestamp("ns")),
+        "data_center_id": pa.array([], pa.string()),
+        "pue": pa.array([], pa.float64()),
+    })
+
+    result = compute_anomalies(table, AnomalyQuery(metrics=["pue"]))
+
+    assert result.num_rows == 0
@@ -0,0 +1,115 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from fsspec.implementations.local import LocalFileSystem
+
+from data.storageaccount import init
+from data.storageaccount.energy_usage import USAGE_BLOB_NAME, USAGE_DATASET_DIR, _merge_sorted, write_energy_usage
+from data.storageaccount.pagination import timestamp_index
+from service.data_generator import generate_energy_usage
+
+START = datetime(2025, 1, 1)
+
+
+def _table(seconds, source) -> pa.Table:
+    return pa.table({
+        "timestamp": pa.array([START + timedelta(seconds=int(s)) for s in seconds], pa.timestamp("ns")),
+        "source": pa.array([source] * len(seconds), pa.string()),
+        "n": pa.array(range(len(seconds)), pa.int64()),
+    })
+
+
+def _reference(table, delta) -> pa.Table:
+    # Stable sort, existing rows stay ahead of delta rows with the same timestamp
+    return pa.concat_tables([table, delta]).sort_by("timestamp")
+
+
+@pytest.mark.parametrize("table_seconds, delta_seconds", [
+    ([0, 1, 2, 3], [4, 5]),
+    ([0, 1, 2, 3], [3, 3]),
+    ([0, 2, 4, 6], [1, 5]),
+    ([0, 2, 2, 4], [-1, 2, 2, 9]),
+    ([], [1, 2]),
+    ([0, 1], []),
+])
+def test_merge_matches_a_stable_sort(table_seconds, delta_seconds):
+    table, delta = _table(table_seconds, "table"), _table(delta_seconds, "delta")
+
+    merged = _merge_sorted(table, timestamp_index(table), delta)
+
+    assert merged.to_pylist() == _reference(table, delta).to_pylist()
+
+
+def test_merge_of_random_deltas():
+    rng = np.random.default_rng(7)
+    for _ in range(20):
+        table = _table(np.sort(rng.integers(0, 50, rng.integers(0, 40))), "table")
+        delta = _table(np.sort(rng.integers(0, 50, rng.integers(0, 10))), "delta")
+
+        merged = _merge_sorted(table, timestamp_index(table), delta)
+
+        assert merged.to_pylist() == _reference(table, delta).to_pylist()
+
+
+def test_appended_delta_keeps_the_table_chunks():
+    table = pa.concat_tables([_table([0, 1], "table"), _table([2, 3], "table")])
+    delta = _table([3, 4], "delta")
+
+    merged = _merge_sorted(table, timestamp_index(table), delta)
+
+    assert merged["n"].num_chunks == 3
+    assert merged["source"].to_pylist() == ["table"] * 4 + ["delta"] * 2
+
+
+def test_delta_is_cast_to_the_table_schema():
+    table = _table([0, 2], "table")
+    delta = _table([1], "delta").cast(pa.schema([
+        ("timestamp", pa.timestamp("us")), ("source", pa.large_string()), ("n", pa.int32()),
+    ]))
+
+    merged = _merge_sorted(table, timestamp_index(table), delta)
+
+    assert merged.schema == table.schema
+    assert merged["source"].to_pylist() == ["table", "delta", "table"]
+
+
+@pytest.fixture
+def local_storage(tmp_path, monkeypatch):
+    monkeypatch.setattr(init, "fs", LocalFileSystem())
+    monkeypatch.setattr(init, "storage_account_container", str(tmp_path))
+    return tmp_path
+
+
+def _generated(rows, seed):
+    return generate_energy_usage(rows, data_centers=1, start=datetime(2025, 1, 1, 23, 30), seed=seed)
+
+
+def test_overwrite_replaces_partitions_and_the_legacy_file(local_storage):
+    pq.write_table(next(_generated(3, 1)), local_storage / USAGE_BLOB_NAME)
+    write_energy_usage(_generated(30, 1))
+    first = sorted(local_storage.glob(f"{USAGE_DATASET_DIR}/**/*.parquet"))
+
+    rows = write_energy_usage(_generated(12, 2))
+
+    files = sorted(local_storage.glob(f"{USAGE_DATASET_DIR}/**/*.parquet"))
+    assert rows == 12
+    assert not (local_storage / USAGE_BLOB_NAME).exists()
+    assert files and not set(files) & set(first)
+    assert {path.parent.name for path in files} == {"date=2025-01-01", "date=2025-01-02"}
+    assert sum(pq.read_metadata(path).num_rows for path in files) == 12
+
+
+@pytest.mark.parametrize("legacy", [True, False])
+def test_existing_data_is_kept_without_overwrite(local_storage, legacy):
+    if legacy:
+        pq.write_table(next(_generated(3, 1)), local_storage / USAGE_BLOB_NAME)
+    else:
+        write_energy_usage(_generated(6, 1))
+
+    with pytest.raises(FileExistsError):
+        write_energy_usage(_generated(6, 2), overwrite=False)
+
+    assert (local_storage / USAGE_BLOB_NAME).exists() == legacy
@@ -0,0 +1,97 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+
+import pytest
+
+from data.storageaccount import energy_usage
+from data.storageaccount.cache import EnergyUsageSnapshot
+from graphql_api import extensions
+from graphql_api import schema as graphql_schema
+from service.data_generator import generate_energy_usage
+
+ROWS = 60
+
+
+@pytest.fixture
+def scans(monkeypatch):
+    """Serve the GraphQL schema from an in-memory snapshot, recording the limit of every page read."""
+    snapshot = EnergyUsageSnapshot(next(generate_energy_usage(ROWS, data_centers=2, start=datetime(2025, 1, 1), seed=3)),
+                                   "v1", time.time())
+    limits = []
+
+    async def get_energy_usage_page(filters=None, columns=None, limit=None, cursor=None, sort_by=None, descending=False):
+        limits.append(limit)
+        return energy_usage.page_energy_usage(snapshot, filters, columns, limit, cursor, sort_by, descending)
+
+    async def dataset_version():
+        return snapshot.version
+
+    monkeypatch.setattr(graphql_schema, "get_energy_usage_page", get_energy_usage_page)
+    monkeypatch.setattr(extensions, "get_dataset_version", dataset_version)
+    extensions.result_cache.clear()
+    yield limits
+    extensions.result_cache.clear()
+
+
+def _execute(query: str):
+    return asyncio.run(graphql_schema.schema.execute(query, context_value={}))
+
+
+def _codes(result) -> list:
+    return [error.extensions.get("code") for error in result.errors or []]
+
+
+def test_unpaged_energy_usage_returns_every_record(scans):
+    result = _execute("{ energyUsage { timestamp pue } }")
+
+    assert result.errors is None
+    assert len(result.data["energyUsage"]) == ROWS
+
+
+def test_pages_follow_the_cursor(scans):
+    first = _execute("{ energyUsagePage(limit: 25) { items { timestamp } nextCursor } }").data["energyUsagePage"]
+    second = _execute(f'{{ energyUsagePage(limit: 50, cursor: "{first["nextCursor"]}") {{ items {{ timestamp }} nextCursor }} }}')
+
+    assert len(first["items"]) == 25
+    assert len(second.data["energyUsagePage"]["items"]) == ROWS - 25
+
+
+@pytest.mark.parametrize("query", [
+    '{ energyUsagePage(cursor: "garbage") { items { pue } } }',
+    '{ energyUsage(cursor: "garbage") { pue } }',
+    # An offset cursor of a sorted query used on the timestamp order
+    '{ energyUsagePage(cursor: "eyJvIjoxfQ") { items { pue } } }',
+])
+def test_bad_cursor_is_a_clean_client_error(scans, caplog, query):
+    with caplog.at_level(logging.ERROR):
+        result = _execute(query)
+
+    assert _codes(result) == ["BAD_USER_INPUT"]
+    assert "Invalid cursor" in result.errors[0].message
+    assert not [record for record in caplog.records if record.levelno >= logging.ERROR]
+
+
+def test_unpaged_query_over_the_cost_limit_is_rejected_without_reading_everything(scans, monkeypatch):
+    monkeypatch.setattr(graphql_schema, "max_query_cost", 40)
+
+    result = _execute("{ energyUsage { timestamp pue } }")
+
+    assert _codes(result) == ["BAD_USER_INPUT"]
+    # 40 // 2 fields, plus the one row that shows the limit is exceeded
+    assert scans == [21]
+
+
+def test_unpaged_query_within_the_cost_limit(scans, monkeypatch):
+    monkeypatch.setattr(graphql_schema, "max_query_cost", ROWS * 2)
+
+    result = _execute("{ energyUsage { timestamp pue } }")
+
+    assert result.errors is None
+    assert len(result.data["energyUsage"]) == ROWS
+
+
+@pytest.mark.parametrize("limit", [0, 100_000])
+def test_limit_out_of_range(scans, limit):
+    assert _codes(_execute(f"{{ energyUsagePage(limit: {limit}) {{ items {{ pue }} }} }}")) == ["BAD_USER_INPUT"]
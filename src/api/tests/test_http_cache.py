@@ -0,0 +1,223 @@
+import gzip
+
+import pytest
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.responses import PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from routes import http_cache
+from routes.http_cache import ENCODINGS, HttpCacheMiddleware, matching_etag, negotiate_encoding
+
+GZIP_ONLY = {"gzip": ENCODINGS["gzip"]}
+# Stand-ins for the optional zstandard and brotli encoders, in server preference order
+ALL_CODINGS = {"zstd": (bytes, None), "br": (bytes, None), "gzip": ENCODINGS["gzip"]}
+
+
+def test_optional_codings_follow_the_installed_modules():
+    assert ("zstd" in ENCODINGS) == (http_cache.zstandard is not None)
+    assert ("br" in ENCODINGS) == (http_cache.brotli is not None)
+    assert list(ENCODINGS)[-1] == "gzip"
+
+
+@pytest.mark.parametrize("accept_encoding, expected", [
+    ("", None),
+    ("identity", None),
+    ("gzip", "gzip"),
+    ("GZIP", "gzip"),
+    ("gzip, deflate, br, zstd", "gzip"),
+    ("br, zstd", None),
+    ("*", "gzip"),
+    ("gzip;q=0", None),
+    ("*;q=0.5, gzip;q=0", None),
+    ("gzip;q=bogus", None),
+])
+def test_negotiation_without_optional_codings(monkeypatch, accept_encoding, expected):
+    monkeypatch.setattr(http_cache, "ENCODINGS", GZIP_ONLY)
+
+    assert negotiate_encoding(accept_encoding) == expected
+
+
+@pytest.mark.parametrize("accept_encoding, expected", [
+    ("gzip, deflate, br, zstd", "zstd"),
+    ("gzip, br", "br"),
+    ("gzip;q=1, br;q=0.5", "gzip"),
+    ("zstd;q=0, *", "br"),
+    ("zstd;q=0.2, br;q=0.1, gzip;q=0.3", "gzip"),
+    ("identity", None),
+])
+def test_negotiation_with_optional_codings(monkeypatch, accept_encoding, expected):
+    monkeypatch.setattr(http_cache, "ENCODINGS", ALL_CODINGS)
+
+    assert negotiate_encoding(accept_encoding) == expected
+
+
+@pytest.mark.parametrize("module, coding", [("zstandard", "zstd"), ("brotli", "br")])
+def test_optional_codings_round_trip(module, coding):
+    library = pytest.importorskip(module)
+    encode, stream = ENCODINGS[coding]
+    body = b"energy usage " * 1000
+    compress, finish = stream()
+
+    assert library.decompress(encode(body)) == body
+    assert library.decompress(compress(body[:5000]) + compress(body[5000:]) + finish()) == body
+
+
+def test_matching_etag():
+    etags = ['"abc"', '"abc-gzip"']
+
+    assert matching_etag('"abc-gzip"', etags) == '"abc-gzip"'
+    assert matching_etag('W/"abc", "other"', etags) == '"abc"'
+    assert matching_etag("*", etags) == '"abc-gzip"'
+    assert matching_etag('"other"', etags) is None
+    assert matching_etag("", etags) is None
+
+
+BODY = "timestamp,pue\n" + "2025-01-01T00:00:00,1.4\n" * 200
+
+
+@pytest.fixture
+def client(monkeypatch):
+    calls = {"handler": 0}
+    version = {"value": "v1"}
+
+    async def dataset_version():
+        return version["value"]
+
+    async def usage(request):
+        calls["handler"] += 1
+        return PlainTextResponse(BODY)
+
+    async def small(request):
+        return PlainTextResponse("ok")
+
+    async def stream(request):
+        return StreamingResponse(iter([BODY.encode()] * 3), media_type="text/plain")
+
+    async def racing(request):
+        # New data lands while the handler runs
+        calls["handler"] += 1
+        version["value"] = f"v{calls['handler'] + 1}"
+        return PlainTextResponse(BODY) if request.query_params.get("stream") is None \
+            else StreamingResponse(iter([BODY.encode()] * 3), media_type="text/plain")
+
+    monkeypatch.setattr(http_cache, "get_dataset_version", dataset_version)
+    monkeypatch.setattr(http_cache, "ENCODINGS", GZIP_ONLY)
+    http_cache.response_cache.clear()
+
+    app = Starlette(
+        routes=[Route("/usage/data", usage), Route("/usage/small", small), Route("/usage/stream", stream), Route("/usage/racing", racing),
+                Route("/other", usage)],
+        middleware=[Middleware(HttpCacheMiddleware)],
+    )
+    with TestClient(app) as test_client:
+        test_client.calls = calls
+        test_client.version = version
+        yield test_client
+    http_cache.response_cache.clear()
+
+
+def test_response_is_compressed_and_validated(client):
+    response = client.get("/usage/data", headers={"accept-encoding": "gzip"})
+
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["etag"].endswith('-gzip"')
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert response.text == BODY
+
+
+def test_small_body_is_not_compressed(client):
+    response = client.get("/usage/small", headers={"accept-encoding": "gzip"})
+
+    assert "content-encoding" not in response.headers
+    assert not response.headers["etag"].endswith('-gzip"')
+
+
+def test_identity_response(client):
+    response = client.get("/usage/data", headers={"accept-encoding": "identity"})
+
+    assert "content-encoding" not in response.headers
+    assert response.headers["content-length"] == str(len(BODY))
+
+
+def test_matching_etag_is_answered_before_the_handler(client):
+    etag = client.get("/usage/data", headers={"accept-encoding": "gzip"}).headers["etag"]
+
+    response = client.get("/usage/data", headers={"accept-encoding": "gzip", "if-none-match": etag})
+
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+    assert client.calls["handler"] == 1
+
+
+def test_identity_etag_matches_a_compressed_request(client):
+    etag = client.get("/usage/data", headers={"accept-encoding": "identity"}).headers["etag"]
+
+    response = client.get("/usage/data", headers={"accept-encoding": "gzip", "if-none-match": f"W/{etag}"})
+
+    assert response.status_code == 304
+
+
+def test_etag_changes_with_the_dataset_version(client):
+    etag = client.get("/usage/data").headers["etag"]
+
+    client.version["value"] = "v2"
+    response = client.get("/usage/data", headers={"if-none-match": etag})
+
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+
+def test_etag_depends_on_the_query(client):
+    first = client.get("/usage/data", params={"zone": "A1", "limit": 5}).headers["etag"]
+    reordered = client.get("/usage/data", params={"limit": 5, "zone": "A1"}).headers["etag"]
+    other = client.get("/usage/data", params={"zone": "B2", "limit": 5}).headers["etag"]
+
+    assert first == reordered
+    assert first != other
+
+
+def test_repeated_requests_are_served_from_the_cache(client):
+    first = client.get("/usage/data", headers={"accept-encoding": "gzip"})
+    second = client.get("/usage/data", headers={"accept-encoding": "gzip"})
+
+    assert client.calls["handler"] == 1
+    assert second.headers["etag"] == first.headers["etag"]
+    assert second.text == BODY
+
+
+def test_streamed_response_is_compressed_per_chunk(client):
+    response = client.get("/usage/stream", headers={"accept-encoding": "gzip"})
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert "content-length" not in response.headers
+    assert response.text == BODY * 3
+
+
+def test_other_paths_are_not_touched(client):
+    response = client.get("/other", headers={"accept-encoding": "gzip"})
+
+    assert "etag" not in response.headers
+    assert "content-encoding" not in response.headers
+
+
+def test_gzip_body_is_reproducible():
+    encode = ENCODINGS["gzip"][0]
+
+    assert encode(BODY.encode()) == encode(BODY.encode())
+    assert gzip.decompress(encode(BODY.encode())) == BODY.encode()
+
+
+@pytest.mark.parametrize("params", [{}, {"stream": "1"}])
+def test_response_built_during_a_version_change_is_not_tagged_or_cached(client, params):
+    first = client.get("/usage/racing", params=params, headers={"accept-encoding": "gzip"})
+    second = client.get("/usage/racing", params=params, headers={"accept-encoding": "gzip"})
+
+    assert first.status_code == 200 and first.text == BODY * (3 if params else 1)
+    assert "etag" not in first.headers
+    assert first.headers["content-encoding"] == "gzip"
+    assert "etag" not in second.headers
+    assert client.calls["handler"] == 2
@@ -0,0 +1,109 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pytest
+
+from data.storageaccount.pagination import (
+    decode_cursor, decode_offset_cursor, encode_cursor, encode_offset_cursor, paginate, timestamp_index,
+)
+
+START = datetime(2025, 1, 1)
+# Ties at 1s and 3s, the cursor has to tell rows with the same timestamp apart
+SECONDS = [0, 1, 1, 1, 2, 3, 3, 4, 5, 5]
+
+
+def _table(seconds=SECONDS) -> pa.Table:
+    return pa.table({
+        "timestamp": pa.array([START + timedelta(seconds=s) for s in seconds], pa.timestamp("ns")),
+        "n": pa.array(range(len(seconds)), pa.int64()),
+    })
+
+
+def _all_pages(table, limit, **kwargs) -> list[list[int]]:
+    timestamps = timestamp_index(table)
+    pages, cursor = [], None
+    while True:
+        page, cursor = paginate(table, timestamps, limit=limit, cursor=cursor, **kwargs)
+        pages.append(page["n"].to_pylist())
+        if cursor is None:
+            return pages
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 4, 7, 10, 50])
+def test_pages_cover_the_table_once_in_order(limit):
+    pages = _all_pages(_table(), limit)
+
+    assert [n for page in pages for n in page] == list(range(len(SECONDS)))
+    assert all(len(page) <= limit for page in pages)
+
+
+def test_pages_apply_the_filter_expression():
+    expression = pc.equal(pc.bit_wise_and(pc.field("n"), 1), 0)
+
+    pages = _all_pages(_table(), 2, expression=expression)
+
+    assert [n for page in pages for n in page] == [0, 2, 4, 6, 8]
+
+
+def test_window_is_half_open():
+    table = _table()
+    page, cursor = paginate(table, timestamp_index(table), start=START + timedelta(seconds=1), end=START + timedelta(seconds=3))
+
+    assert page["n"].to_pylist() == [1, 2, 3, 4]
+    assert cursor is None
+
+
+def test_pages_within_a_window():
+    pages = _all_pages(_table(), 2, start=START + timedelta(seconds=1), end=START + timedelta(seconds=5))
+
+    assert [n for page in pages for n in page] == [1, 2, 3, 4, 5, 6, 7]
+
+
+def test_cursor_counts_rows_returned_at_its_timestamp():
+    table = _table()
+    timestamps = timestamp_index(table)
+
+    # Two of the three rows at 1s
+    _, cursor = paginate(table, timestamps, limit=3)
+    assert decode_cursor(cursor) == (int(timestamps[1]), 2)
+
+    # The next page lies entirely at 1s, the count carries over
+    page, cursor = paginate(table, timestamps, limit=1, cursor=cursor)
+    assert page["n"].to_pylist() == [3]
+    assert decode_cursor(cursor) == (int(timestamps[1]), 3)
+
+
+def test_unlimited_page_has_no_cursor():
+    table = _table()
+    page, cursor = paginate(table, timestamp_index(table))
+
+    assert page.num_rows == table.num_rows
+    assert cursor is None
+
+
+def test_empty_table():
+    table = _table([])
+    page, cursor = paginate(table, timestamp_index(table), limit=5)
+
+    assert page.num_rows == 0
+    assert cursor is None
+    assert timestamp_index(table).dtype == np.int64
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(1_700_000_000_000_000_000, 3)) == (1_700_000_000_000_000_000, 3)
+    assert decode_offset_cursor(encode_offset_cursor(42)) == 42
+
+
+@pytest.mark.parametrize("cursor", ["", "not-a-cursor", encode_offset_cursor(1)])
+def test_malformed_cursor(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+@pytest.mark.parametrize("cursor", ["", "not-a-cursor", encode_cursor(1, 0), encode_offset_cursor(-1)])
+def test_malformed_offset_cursor(cursor):
+    with pytest.raises(ValueError):
+        decode_offset_cursor(cursor)
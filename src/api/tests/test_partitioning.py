@@ -0,0 +1,88 @@
+from datetime import datetime
+
+import pyarrow as pa
+import pytest
+
+from data.storageaccount.partitioning import (
+    ZONES, parse_partition, partition_matches, partition_of, partition_prefixes, split_partitions,
+)
+from model.filter_model import EnergyUsageFilter
+
+
+def test_no_filter_lists_the_whole_dataset():
+    assert partition_prefixes(None) == [""]
+    assert partition_prefixes(EnergyUsageFilter()) == [""]
+
+
+def test_zone_filter_lists_one_zone():
+    assert partition_prefixes(EnergyUsageFilter(zone="B2")) == ["zone=B2/"]
+
+
+def test_bounded_window_lists_one_prefix_per_day():
+    filters = EnergyUsageFilter(zone="A1", start=datetime(2025, 1, 30, 12), end=datetime(2025, 2, 2))
+
+    # The midnight end excludes 2025-02-02
+    assert partition_prefixes(filters) == [
+        "zone=A1/date=2025-01-30/", "zone=A1/date=2025-01-31/", "zone=A1/date=2025-02-01/",
+    ]
+
+
+def test_bounded_window_without_zone_lists_every_zone():
+    filters = EnergyUsageFilter(start=datetime(2025, 1, 1), end=datetime(2025, 1, 1, 6))
+
+    assert partition_prefixes(filters) == [f"zone={zone}/date=2025-01-01/" for zone in ZONES]
+
+
+def test_wide_window_is_pruned_after_listing():
+    filters = EnergyUsageFilter(zone="C3", start=datetime(2025, 1, 1), end=datetime(2025, 6, 1))
+
+    assert partition_prefixes(filters, max_days=31) == ["zone=C3/"]
+    assert partition_prefixes(EnergyUsageFilter(start=datetime(2025, 1, 1))) == [""]
+
+
+def test_timezone_aware_window_is_converted_to_utc():
+    filters = EnergyUsageFilter(start=datetime.fromisoformat("2025-01-02T00:30:00+01:00"),
+                                end=datetime.fromisoformat("2025-01-02T01:30:00+01:00"))
+
+    assert partition_prefixes(filters) == [
+        f"zone={zone}/date={day}/" for zone in ZONES for day in ("2025-01-01", "2025-01-02")
+    ]
+
+
+@pytest.mark.parametrize("path, filters, expected", [
+    ("usage/zone=A1/date=2025-01-01/part-0.parquet", None, True),
+    ("usage/zone=A1/date=2025-01-01/part-0.parquet", EnergyUsageFilter(zone="A1"), True),
+    ("usage/zone=A1/date=2025-01-01/part-0.parquet", EnergyUsageFilter(zone="B2"), False),
+    ("usage/zone=A1/date=2025-01-01/part-0.parquet", EnergyUsageFilter(start=datetime(2025, 1, 1, 23)), True),
+    ("usage/zone=A1/date=2025-01-01/part-0.parquet", EnergyUsageFilter(start=datetime(2025, 1, 2)), False),
+    ("usage/zone=A1/date=2025-01-01/part-0.parquet", EnergyUsageFilter(end=datetime(2025, 1, 1)), False),
+    ("usage/zone=A1/date=2025-01-01/part-0.parquet", EnergyUsageFilter(end=datetime(2025, 1, 1, 0, 0, 1)), True),
+    # Files outside the partition layout are never pruned
+    ("usage/legacy.parquet", EnergyUsageFilter(zone="B2", start=datetime(2030, 1, 1)), True),
+])
+def test_partition_matches(path, filters, expected):
+    assert partition_matches(path, filters) is expected
+
+
+def test_parse_partition_ignores_other_keys():
+    assert parse_partition("root/year=2025/zone=C3/date=2025-03-04/x=1.parquet") == {"zone": "C3", "date": "2025-03-04"}
+
+
+def test_partition_of():
+    assert partition_of("data/usage/zone=A1/date=2025-01-01/delta-1.parquet", "data/usage") == "zone=A1/date=2025-01-01"
+
+
+def test_split_partitions_groups_rows_and_drops_the_zone():
+    table = pa.table({
+        "timestamp": pa.array([datetime(2025, 1, 1, 23), datetime(2025, 1, 2, 1), datetime(2025, 1, 1, 22),
+                               datetime(2025, 1, 1, 23, 30)], pa.timestamp("ns")),
+        "zone": ["A1", "A1", "B2", "A1"],
+        "n": [0, 1, 2, 3],
+    })
+
+    parts = {directory: part for directory, part in split_partitions(table)}
+
+    assert list(parts) == ["zone=A1/date=2025-01-01", "zone=A1/date=2025-01-02", "zone=B2/date=2025-01-01"]
+    assert parts["zone=A1/date=2025-01-01"]["n"].to_pylist() == [0, 3]
+    assert all("zone" not in part.column_names for part in parts.values())
+    assert list(split_partitions(table.slice(0, 0))) == []
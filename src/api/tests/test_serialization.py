@@ -0,0 +1,127 @@
+from datetime import datetime
+
+import orjson
+import pyarrow as pa
+import pytest
+
+from data.storageaccount.energy_usage import ENERGY_USAGE_SCHEMA
+from service.data_generator import generate_energy_usage
+from service.serialization import (
+    energy_usage_from_arrow_stream, energy_usage_from_json, energy_usage_from_ndjson,
+)
+
+
+@pytest.fixture
+def table() -> pa.Table:
+    return next(generate_energy_usage(12, data_centers=2, start=datetime(2025, 1, 1), seed=5))
+
+
+def _records(table: pa.Table) -> list[dict]:
+    # Microseconds convert to datetime, nanoseconds to pandas timestamps
+    return table.set_column(0, "timestamp", table["timestamp"].cast(pa.timestamp("us"))).to_pylist()
+
+
+def _ndjson(records: list[dict]) -> bytes:
+    return b"".join(orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE) for record in records)
+
+
+def _arrow_stream(table: pa.Table) -> bytes:
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def test_ndjson(table):
+    parsed = energy_usage_from_ndjson(_ndjson(_records(table)))
+
+    assert parsed.schema == ENERGY_USAGE_SCHEMA
+    assert parsed.equals(table)
+
+
+def test_json_array(table):
+    parsed = energy_usage_from_json(orjson.dumps(_records(table)))
+
+    assert parsed.equals(table)
+
+
+def test_arrow_stream(table):
+    assert energy_usage_from_arrow_stream(_arrow_stream(table)).equals(table)
+
+
+def test_arrow_stream_is_conformed_to_the_schema(table):
+    # Columns out of order and a coarser timestamp unit
+    sent = table.select(list(reversed(table.column_names)))
+    sent = sent.set_column(sent.schema.get_field_index("timestamp"), "timestamp", sent["timestamp"].cast(pa.timestamp("ms")))
+
+    parsed = energy_usage_from_arrow_stream(_arrow_stream(sent))
+
+    assert parsed.schema == ENERGY_USAGE_SCHEMA
+    assert parsed.equals(table)
+
+
+def test_arrow_stream_with_an_unknown_column_is_rejected(table):
+    sent = table.append_column("extra", pa.array([1] * table.num_rows))
+
+    with pytest.raises(ValueError, match="extra"):
+        energy_usage_from_arrow_stream(_arrow_stream(sent))
+
+
+def test_empty_bodies():
+    assert energy_usage_from_ndjson(b"  \n").num_rows == 0
+    assert energy_usage_from_json(b"[]").num_rows == 0
+
+
+def test_timezone_aware_timestamps_are_stored_as_naive_utc(table):
+    record = dict(_records(table)[0], timestamp="2025-01-01T03:07:00+01:00")
+
+    parsed = energy_usage_from_json(orjson.dumps([record]))
+
+    assert parsed["timestamp"].to_pylist() == [datetime(2025, 1, 1, 2, 7)]
+
+
+def test_null_operator_notes_are_accepted(table):
+    record = dict(_records(table)[0], operator_notes=None)
+
+    assert energy_usage_from_json(orjson.dumps([record]))["operator_notes"].to_pylist() == [None]
+
+
+@pytest.mark.parametrize("change", [
+    {"zone": "ZZ"},
+    {"alarm_status": "panic"},
+    {"pue": None},
+    {"data_center_id": None},
+    {"unexpected": 1},
+])
+def test_invalid_records_are_rejected(table, change):
+    records = _records(table)
+    records[3] = {**records[3], **change}
+
+    with pytest.raises(ValueError):
+        energy_usage_from_json(orjson.dumps(records))
+    with pytest.raises(ValueError):
+        energy_usage_from_ndjson(_ndjson(records))
+
+
+def test_missing_column_is_rejected(table):
+    with pytest.raises(ValueError, match="pue"):
+        energy_usage_from_arrow_stream(_arrow_stream(table.drop_columns(["pue"])))
+    with pytest.raises(ValueError):
+        energy_usage_from_json(orjson.dumps([{key: value for key, value in _records(table)[0].items() if key != "pue"}]))
+
+
+@pytest.mark.parametrize("body", [b'{"not": "an array"}', b"[1, 2]", b"[{"])
+def test_malformed_json(body):
+    with pytest.raises(ValueError):
+        energy_usage_from_json(body)
+
+
+@pytest.mark.parametrize("body", [b'{"bad', b"not json\n"])
+def test_malformed_ndjson(body):
+    with pytest.raises(ValueError):
+        energy_usage_from_ndjson(body)
+
+
+def test_malformed_arrow_stream():
+    with pytest.raises(ValueError):
+        energy_usage_from_arrow_stream(b"not arrow")